@@ -0,0 +1,96 @@
+"""Micro-benchmark of xml_to_mongo's element converters.
+
+Times the original recursive element_to_dict (kept here as the baseline)
+against the current iterative converter and its BSON codec, over the
+node_type elements of an XML file. Each element is converted --repeat times
+per round so lxml parsing is not part of the measurement.
+
+    python -m external_metadata_awareness.adhoc.benchmark_element_to_dict \\
+        --xml-file tests/data/biosample_set_sample.xml
+"""
+
+import time
+from pathlib import Path
+
+import bson
+import click
+import lxml.etree as ET
+
+from external_metadata_awareness.xml_to_mongo import element_to_dict, element_to_raw_bson
+
+_FIXTURE = Path(__file__).resolve().parents[2] / "tests" / "data" / "biosample_set_sample.xml"
+
+
+def recursive_element_to_dict(elem):
+    """
+    Recursively converts an XML element to a nested dictionary.
+
+    This is xml_to_mongo's converter before it was made iterative.
+    """
+    doc = {}
+    if elem.text and elem.text.strip():
+        doc['content'] = elem.text.strip()
+    doc.update(elem.attrib)
+    for child in elem:
+        child_doc = recursive_element_to_dict(child)
+        if child.tag in doc:
+            if isinstance(doc[child.tag], list):
+                doc[child.tag].append(child_doc)
+            else:
+                doc[child.tag] = [doc[child.tag], child_doc]
+        else:
+            doc[child.tag] = child_doc
+    return doc
+
+
+def recursive_element_to_bson(elem):
+    """The baseline conversion followed by the encode pymongo does on insert."""
+    return bson.encode(recursive_element_to_dict(elem))
+
+
+def _time_converter(convert, elements, repeat, rounds):
+    """Return the best per-element time in microseconds over several rounds."""
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            for elem in elements:
+                convert(elem)
+        best = min(best, time.perf_counter() - start)
+    return best / (repeat * len(elements)) * 1e6
+
+
+@click.command()
+@click.option("--xml-file", default=str(_FIXTURE), show_default=True,
+              type=click.Path(exists=True, dir_okay=False), help="XML file to read elements from.")
+@click.option("--node-type", default="BioSample", show_default=True, help="Tag of the elements to convert.")
+@click.option("--repeat", default=200, show_default=True, type=int,
+              help="Conversions of every element per round.")
+@click.option("--rounds", default=5, show_default=True, type=int, help="Rounds; the best one is reported.")
+def main(xml_file, node_type, repeat, rounds):
+    """Compare the recursive and iterative element converters on one XML file."""
+    elements = list(ET.parse(xml_file).getroot().iter(node_type))
+    if not elements:
+        raise click.ClickException(f"No {node_type} elements in {xml_file}")
+
+    for elem in elements:
+        if element_to_dict(elem) != recursive_element_to_dict(elem):
+            raise click.ClickException(f"Converters disagree on {node_type} {elem.attrib}")
+
+    timings = [
+        ("recursive dict (baseline)", recursive_element_to_dict),
+        ("iterative dict", element_to_dict),
+        ("recursive dict + bson.encode", recursive_element_to_bson),
+        ("iterative raw BSON", element_to_raw_bson),
+    ]
+
+    click.echo(f"{len(elements)} {node_type} elements, {repeat} x {rounds} rounds")
+    baseline = None
+    for label, convert in timings:
+        per_element = _time_converter(convert, elements, repeat, rounds)
+        baseline = baseline or per_element
+        click.echo(f"{label:<32} {per_element:10.2f} us/element  {baseline / per_element:5.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,70 @@
 import click
+import io
 from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from lxml import etree
 import time
 from datetime import datetime
 import json
 
+from external_metadata_awareness.xml_shards import compute_shard_ranges, iter_shard_events
+
+
+# Checking the clock on every element is measurable on large files, so the
+# status interval is only tested every this many elements.
+_STATUS_CHECK_EVERY = 1000
+
+
+def _count_path_events(events, xpath_counter, root_path='', status=None, stop=None):
+    """
+    Count the XPaths in a stream of ('start'|'end', element) iterparse events.
+
+    Paths are kept on a stack pushed at 'start' and popped at 'end', so each
+    element costs one string join rather than a walk up to the root. Every
+    element counts once for its path, once per attribute (path@attr) and once
+    if it has non-blank text (path#text). root_path is prepended to every path,
+    for events from a fragment of a larger document. status is called every
+    _STATUS_CHECK_EVERY elements; counting ends early when stop() is true.
+    """
+    path_stack = [root_path]
+    elements = 0
+    for event, elem in events:
+        if event == 'start':
+            path_stack.append(f"{path_stack[-1]}/{elem.tag}")
+            continue
+
+        base_xpath = path_stack.pop()
+        xpath_counter[base_xpath] += 1
+
+        # Include attributes
+        for attr in elem.attrib:
+            xpath_counter[f"{base_xpath}@{attr}"] += 1
+
+        # Include text content if present
+        if elem.text and elem.text.strip():
+            xpath_counter[f"{base_xpath}#text"] += 1
+
+        elements += 1
+        if status and elements % _STATUS_CHECK_EVERY == 0:
+            status()
+        if stop and stop():
+            return
+
+        elem.clear()
+        while elem.getprevious() is not None:
+            del elem.getparent()[0]
+
 
 def count_unique_xpaths(xml_file, status_interval, always_count_path, stop_after):
     """Count unique XPaths in an XML file using iterparse, reporting status every N seconds."""
     try:
         xpath_counter = Counter()
-        context = etree.iterparse(xml_file, events=('end',))
+        context = etree.iterparse(xml_file, events=('start', 'end'))
 
         last_status_time = time.time()
 
-        for event, elem in context:
+        def status():
+            nonlocal last_status_time
             current_time = time.time()
             if current_time - last_status_time >= status_interval:
                 timestamp = datetime.utcnow().isoformat()
@@ -22,32 +72,89 @@ def count_unique_xpaths(xml_file, status_interval, always_count_path, stop_after
                     f"[{timestamp}] Processed paths: {len(xpath_counter)}; {always_count_path} count: {xpath_counter.get(always_count_path, 0)}")
                 last_status_time = current_time
 
-            path_parts = []
-            current = elem
-            while current is not None:
-                path_parts.append(current.tag)
-                current = current.getparent()
+        def stop():
+            if stop_after and xpath_counter[always_count_path] >= stop_after:
+                click.echo(f"Stopping after {stop_after} occurrences of {always_count_path}")
+                return True
+            return False
 
-            base_xpath = '/' + '/'.join(reversed(path_parts))
-            xpath_counter[base_xpath] += 1
+        _count_path_events(context, xpath_counter, status=status, stop=stop)
 
-            # Include attributes
-            for attr in elem.attrib:
-                attr_xpath = f"{base_xpath}@{attr}"
-                xpath_counter[attr_xpath] += 1
+        return sorted(xpath_counter.items(), key=lambda x: (-x[1], x[0]))
+    except etree.XMLSyntaxError as e:
+        click.echo(f"XML parsing error: {e}", err=True)
+        return []
+    except Exception as e:
+        click.echo(f"Error processing file: {e}", err=True)
+        return []
 
-            # Include text content if present
-            if elem.text and elem.text.strip():
-                text_xpath = f"{base_xpath}#text"
-                xpath_counter[text_xpath] += 1
 
-            if stop_after and xpath_counter[always_count_path] >= stop_after:
-                click.echo(f"Stopping after {stop_after} occurrences of {always_count_path}")
-                break
+def _root_and_record_tags(xml_file):
+    """Return the root tag and the tag of the root's first child (None if it has none)."""
+    tags = []
+    for _, elem in etree.iterparse(xml_file, events=('start',)):
+        tags.append(elem.tag)
+        if len(tags) == 2:
+            break
+    return tags[0], (tags[1] if len(tags) > 1 else None)
+
+
+def count_shard_xpaths(xml_file, start, end, root_path):
+    """Count the XPaths of the records in one byte-range shard; returns a Counter."""
+    xpath_counter = Counter()
+    events = iter_shard_events(xml_file, start, end, events=('start', 'end'))
+    _count_path_events(events, xpath_counter, root_path=root_path)
+    return xpath_counter
+
+
+def _count_outside_shards(xml_file, shard_start, shard_end):
+    """
+    Count the XPaths of everything outside [shard_start, shard_end).
+
+    That is the document with all its records cut out: the XML declaration,
+    the root element (its path, attributes and text) and any non-record
+    elements before the first or after the last record.
+    """
+    with open(xml_file, 'rb') as fh:
+        head = fh.read(shard_start)
+        fh.seek(shard_end)
+        tail = fh.read()
+    xpath_counter = Counter()
+    _count_path_events(etree.iterparse(io.BytesIO(head + tail), events=('start', 'end')), xpath_counter)
+    return xpath_counter
+
+
+def count_unique_xpaths_parallel(xml_file, status_interval, always_count_path, workers,
+                                 shard_size=64 * 1024 * 1024):
+    """
+    Count unique XPaths with shards of the file counted in a process pool.
+
+    The file is split at the opening tags of the root's child records, each
+    shard's Counter is built by a worker, and the Counters are merged. The
+    result is identical to count_unique_xpaths without stop_after, provided
+    the record elements are not nested inside one another.
+    """
+    try:
+        root_tag, record_tag = _root_and_record_tags(xml_file)
+        shards = compute_shard_ranges(xml_file, record_tag, shard_size) if record_tag else []
+        if not shards:
+            return count_unique_xpaths(xml_file, status_interval, always_count_path, None)
 
-            elem.clear()
-            while elem.getprevious() is not None:
-                del elem.getparent()[0]
+        xpath_counter = _count_outside_shards(xml_file, shards[0][0], shards[-1][1])
+        root_path = f"/{root_tag}"
+        last_status_time = time.time()
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(count_shard_xpaths, xml_file, start, end, root_path)
+                       for start, end in shards]
+            for done, future in enumerate(as_completed(futures), start=1):
+                xpath_counter.update(future.result())
+                current_time = time.time()
+                if current_time - last_status_time >= status_interval:
+                    timestamp = datetime.utcnow().isoformat()
+                    click.echo(
+                        f"[{timestamp}] Shards done: {done}/{len(shards)}; Processed paths: {len(xpath_counter)}; "
+                        f"{always_count_path} count: {xpath_counter.get(always_count_path, 0)}")
+                    last_status_time = current_time
 
         return sorted(xpath_counter.items(), key=lambda x: (-x[1], x[0]))
     except etree.XMLSyntaxError as e:
@@ -94,9 +201,20 @@ def save_results(sorted_paths, output_file):
               help='XPath that will always be counted (default: /PackageSet/Package/Project)')
 @click.option('--stop-after', '-s', default=None, type=int,
               help='Stop processing after N occurrences of always-count-path')
-def main(xml_file, interval, output, always_count_path, stop_after):
+@click.option('--workers', '-w', default=1, type=int,
+              help='Worker processes (default: 1). Above 1, byte-range shards of the file are '
+                   'counted in parallel and merged; not combinable with --stop-after')
+@click.option('--shard-size-mb', default=64, type=int,
+              help='Approximate shard size in MB when --workers is above 1 (default: 64)')
+def main(xml_file, interval, output, always_count_path, stop_after, workers, shard_size_mb):
     """Count unique XPaths in an XML file and save the results."""
-    xpath_counts = count_unique_xpaths(xml_file, interval, always_count_path, stop_after)
+    if workers > 1 and stop_after:
+        raise click.UsageError("--stop-after needs a single in-order pass; use it with --workers 1")
+    if workers > 1:
+        xpath_counts = count_unique_xpaths_parallel(xml_file, interval, always_count_path, workers,
+                                                    shard_size=shard_size_mb * 1024 * 1024)
+    else:
+        xpath_counts = count_unique_xpaths(xml_file, interval, always_count_path, stop_after)
     print_xpath_counts(xpath_counts)
     save_results(xpath_counts, output)
 
@@ -1,14 +1,80 @@
 """Export all tables from a DuckDB database to individual Parquet files."""
 
+import json
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 import click
 import duckdb
+import pyarrow.parquet as pq
 
 logging.basicConfig(level=logging.INFO, format="%(message)s")
 logger = logging.getLogger(__name__)
 
+MANIFEST_NAME = "manifest.json"
+
+
+def parse_partition_specs(ctx, param, values):
+    """Click callback: turn TABLE=COL[,COL...] options into {table: [columns]}."""
+    specs = {}
+    for value in values:
+        table, sep, columns = value.partition("=")
+        columns = [column.strip() for column in columns.split(",") if column.strip()]
+        if not sep or not table or not columns:
+            raise click.BadParameter(f"expected TABLE=COLUMN[,COLUMN...], got {value!r}")
+        specs[table] = columns
+    return specs
+
+
+def copy_options(partition_by=None, row_group_size=None):
+    """The COPY ... TO option list for one table."""
+    options = ["FORMAT PARQUET", "COMPRESSION ZSTD"]
+    if row_group_size:
+        options.append(f"ROW_GROUP_SIZE {int(row_group_size)}")
+    if partition_by:
+        columns = ", ".join(f'"{column}"' for column in partition_by)
+        options += [f"PARTITION_BY ({columns})", "OVERWRITE"]
+    return ", ".join(options)
+
+
+def parquet_file_stats(path, root):
+    """Size, row and row-group counts of one Parquet file, with its path relative to root."""
+    metadata = pq.ParquetFile(path).metadata
+    return {
+        "path": str(path.relative_to(root)),
+        "bytes": path.stat().st_size,
+        "rows": metadata.num_rows,
+        "row_groups": metadata.num_row_groups,
+    }
+
+
+def export_table(conn, table, output_dir, partition_by=None, row_group_size=None):
+    """
+    Copy one table to <table>.parquet, or to a Hive-partitioned <table>/ directory.
+
+    conn should be a cursor of its own when tables are exported concurrently.
+    Returns the table's manifest entry.
+    """
+    out_path = output_dir / (table if partition_by else f"{table}.parquet")
+    (rows,) = conn.execute(
+        f"COPY \"{table}\" TO '{out_path}' ({copy_options(partition_by, row_group_size)})"
+    ).fetchone()
+    files = sorted(out_path.rglob("*.parquet")) if partition_by else [out_path]
+    file_stats = [parquet_file_stats(path, output_dir) for path in files]
+    entry = {
+        "table": table,
+        "path": out_path.name,
+        "rows": rows,
+        "partition_by": partition_by or [],
+        "row_group_size": row_group_size,
+        "bytes": sum(stats["bytes"] for stats in file_stats),
+        "files": file_stats,
+    }
+    logger.info("  %-40s %10d rows  %8.1f MB in %d file(s)",
+                table, rows, entry["bytes"] / (1024 * 1024), len(file_stats))
+    return entry
+
 
 @click.command()
 @click.argument("duckdb_file", type=click.Path(exists=True, path_type=Path))
@@ -19,11 +85,35 @@ logger = logging.getLogger(__name__)
     show_default=True,
     help="Directory to write Parquet files into.",
 )
-def export_duckdb_to_parquet(duckdb_file: Path, output_dir: Path) -> None:
+@click.option(
+    "--row-group-size",
+    type=click.IntRange(min=1),
+    default=None,
+    help="Target rows per Parquet row group (DuckDB's default when omitted).",
+)
+@click.option(
+    "--partition-by",
+    "partition_specs",
+    multiple=True,
+    callback=parse_partition_specs,
+    metavar="TABLE=COL[,COL]",
+    help="Write TABLE as a Hive-partitioned directory on these columns. Repeatable.",
+)
+@click.option(
+    "--workers",
+    type=click.IntRange(min=1),
+    default=1,
+    show_default=True,
+    help="Tables exported concurrently.",
+)
+def export_duckdb_to_parquet(duckdb_file: Path, output_dir: Path, row_group_size: int | None,
+                             partition_specs: dict, workers: int) -> None:
     """Export each table in DUCKDB_FILE to a separate Parquet file.
 
     Reads the DuckDB database and writes one <table>.parquet file per table
-    into the output directory.
+    into the output directory, or a <table>/ directory of Hive partitions
+    for tables given with --partition-by. A manifest.json with row counts
+    and per-file statistics is written alongside.
     """
     output_dir.mkdir(parents=True, exist_ok=True)
 
@@ -43,16 +133,30 @@ def export_duckdb_to_parquet(duckdb_file: Path, output_dir: Path) -> None:
             logger.warning("No tables found in %s", duckdb_file)
             return
 
-        logger.info("Exporting %d tables from %s to %s", len(tables), duckdb_file, output_dir)
+        unknown = sorted(set(partition_specs) - {table for table, _ in tables})
+        if unknown:
+            raise click.BadParameter(f"no such table(s): {', '.join(unknown)}", param_hint="--partition-by")
+
+        logger.info("Exporting %d tables from %s to %s with %d worker(s)",
+                    len(tables), duckdb_file, output_dir, workers)
+
+        def export(table):
+            cursor = conn.cursor()
+            try:
+                return export_table(cursor, table, output_dir, partition_specs.get(table), row_group_size)
+            finally:
+                cursor.close()
 
-        for table, estimated_rows in tables:
-            out_path = output_dir / f"{table}.parquet"
-            conn.execute(
-                f'COPY "{table}" TO \'{out_path}\' (FORMAT PARQUET, COMPRESSION ZSTD)'
-            )
-            size_mb = out_path.stat().st_size / (1024 * 1024)
-            logger.info("  %-40s ~%10d rows  %8.1f MB", table, estimated_rows, size_mb)
+        # Largest tables first, so the longest exports start earliest.
+        by_size = [table for table, _ in sorted(tables, key=lambda t: -(t[1] or 0))]
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            entries = list(pool.map(export, by_size))
 
-        logger.info("Done. %d Parquet files written to %s", len(tables), output_dir)
+        manifest = {
+            "source": str(duckdb_file),
+            "tables": sorted(entries, key=lambda entry: entry["table"]),
+        }
+        (output_dir / MANIFEST_NAME).write_text(json.dumps(manifest, indent=2) + "\n")
+        logger.info("Done. %d tables written to %s (manifest: %s)", len(tables), output_dir, MANIFEST_NAME)
     finally:
         conn.close()
@@ -6,6 +6,9 @@ Exports four submission-related collections:
   - flattened_submission_biosamples: transformed/flattened with ontology enhancement
   - submission_biosample_slot_counts: field usage statistics
 
+Each collection is streamed into DuckDB as Arrow record batches
+(see mongo_to_duckdb), so memory stays bounded by the batch size.
+
 Usage::
 
     poetry run export-submissions-to-duckdb
@@ -18,99 +21,109 @@ import logging
 
 import click
 import duckdb
-import pandas as pd
+import pyarrow as pa
 from pymongo import MongoClient
 
+from external_metadata_awareness.mongo_to_duckdb import export_collection, load_table
+
 logging.basicConfig(level=logging.INFO, format="%(message)s")
 log = logging.getLogger(__name__)
 
+SLOT_COUNTS_SCHEMA = pa.schema([("field", pa.string()), ("count", pa.int64())])
+
+BIOSAMPLE_ROWS_SCHEMA = pa.schema([
+    ("submission_id", pa.string()),
+    ("key", pa.string()),
+    ("field", pa.string()),
+    ("value", pa.string()),
+])
+
+NMDC_SUBMISSIONS_SCHEMA = pa.schema(
+    [(name, pa.string()) for name in (
+        "submission_id", "status", "created", "package_name", "templates", "study_name", "pi_name",
+        "pi_email", "pi_orcid", "description", "notes", "gold_study_id", "ncbi_bioproject_id",
+        "data_dois", "funding_sources", "award", "award_dois")]
+    + [("data_generated", pa.bool_()), ("doe", pa.bool_()), ("metadata_submission_json", pa.string())]
+)
+
 
 def _export_flattened_submission_biosamples(db, conn):
-    """Export flattened_submission_biosamples (cast to string for mixed-type columns)."""
+    """Export flattened_submission_biosamples (mixed-type columns load as strings)."""
     log.info("Exporting flattened_submission_biosamples...")
-    docs = list(db.flattened_submission_biosamples.find({}, {"_id": 0}))
-    df = pd.DataFrame(docs)
-    # Cast object columns to string — MongoDB docs have mixed types (e.g. int and str
-    # in the same column like '281 degrees') that DuckDB cannot auto-infer.
-    for col in df.select_dtypes(include=["object"]).columns:
-        df[col] = df[col].astype(str).replace({"None": None, "nan": None})
-    conn.register("_tmp_df", df)
-    conn.execute("CREATE OR REPLACE TABLE flattened_submission_biosamples AS SELECT * FROM _tmp_df")
-    conn.unregister("_tmp_df")
-    log.info(f"  {len(df)} rows, {len(df.columns)} columns")
+    # MongoDB docs have mixed types (e.g. int and str in the same column like
+    # '281 degrees'); the inferred schema makes such columns VARCHAR.
+    rows, columns = export_collection(db.flattened_submission_biosamples, conn)
+    log.info(f"  {rows} rows, {columns} columns")
 
 
 def _export_submission_biosample_slot_counts(db, conn):
     """Export submission_biosample_slot_counts (small reference table)."""
     log.info("Exporting submission_biosample_slot_counts...")
-    docs = list(db.submission_biosample_slot_counts.find({}, {"_id": 0}))
-    df = pd.DataFrame(docs)
-    conn.register("_tmp_df", df)
-    conn.execute("CREATE OR REPLACE TABLE submission_biosample_slot_counts AS SELECT * FROM _tmp_df")
-    conn.unregister("_tmp_df")
-    log.info(f"  {len(df)} rows")
+    rows, _ = export_collection(db.submission_biosample_slot_counts, conn, schema=SLOT_COUNTS_SCHEMA)
+    log.info(f"  {rows} rows")
 
 
-def _export_submission_biosample_rows(db, conn):
-    """Export submission_biosample_rows (flatten nested row_data array)."""
-    log.info("Exporting submission_biosample_rows...")
-    rows = []
-    for doc in db.submission_biosample_rows.find({}, {"_id": 0}):
+def _biosample_row_pairs(docs):
+    """Yield one field-value row per row_data item of each submission_biosample_rows doc."""
+    for doc in docs:
         base = {"submission_id": doc["submission_id"], "key": doc.get("key", "")}
         for item in doc.get("row_data", []):
             field = item.get("field", "")
             value = item.get("value")
             if isinstance(value, (list, dict)):
                 value = json.dumps(value)
-            rows.append({**base, "field": field, "value": str(value) if value is not None else None})
-    df = pd.DataFrame(rows)
-    conn.register("_tmp_df", df)
-    conn.execute("CREATE OR REPLACE TABLE submission_biosample_rows AS SELECT * FROM _tmp_df")
-    conn.unregister("_tmp_df")
-    log.info(f"  {len(df)} rows (field-value pairs)")
+            yield {**base, "field": field, "value": str(value) if value is not None else None}
+
+
+def _export_submission_biosample_rows(db, conn):
+    """Export submission_biosample_rows (flatten nested row_data array)."""
+    log.info("Exporting submission_biosample_rows...")
+    rows = load_table(conn, "submission_biosample_rows",
+                      _biosample_row_pairs(db.submission_biosample_rows.find({}, {"_id": 0})),
+                      BIOSAMPLE_ROWS_SCHEMA)
+    log.info(f"  {rows} rows (field-value pairs)")
+
+
+def _submission_row(doc):
+    """Flatten one nmdc_submissions doc into its key columns."""
+    row = {}
+    row["submission_id"] = doc.get("id") or doc.get("submission_id", "")
+    row["status"] = doc.get("status", "")
+    row["created"] = doc.get("created", "")
+
+    meta = doc.get("metadata_submission", {})
+    row["package_name"] = json.dumps(meta.get("packageName", []))
+    row["templates"] = json.dumps(meta.get("templates", []))
+
+    study = meta.get("studyForm", {})
+    row["study_name"] = study.get("studyName", "")
+    row["pi_name"] = study.get("piName", "")
+    row["pi_email"] = study.get("piEmail", "")
+    row["pi_orcid"] = study.get("piOrcid", "")
+    row["description"] = study.get("description", "")
+    row["notes"] = study.get("notes", "")
+    row["gold_study_id"] = study.get("GOLDStudyId", "")
+    row["ncbi_bioproject_id"] = study.get("NCBIBioProjectId", "")
+    row["data_dois"] = json.dumps(study.get("dataDois", []))
+    row["funding_sources"] = json.dumps(study.get("fundingSources", []))
+
+    multi = meta.get("multiOmicsForm", {})
+    row["award"] = multi.get("award", "")
+    row["award_dois"] = json.dumps(multi.get("awardDois", []))
+    row["data_generated"] = multi.get("dataGenerated")
+    row["doe"] = multi.get("doe")
+
+    row["metadata_submission_json"] = json.dumps(meta, default=str)
+    return row
 
 
 def _export_nmdc_submissions(db, conn):
     """Export nmdc_submissions (flatten nested JSON into key columns)."""
     log.info("Exporting nmdc_submissions...")
-    flat_rows = []
-    for doc in db.nmdc_submissions.find({}, {"_id": 0}):
-        row = {}
-        row["submission_id"] = doc.get("id") or doc.get("submission_id", "")
-        row["status"] = doc.get("status", "")
-        row["created"] = doc.get("created", "")
-
-        meta = doc.get("metadata_submission", {})
-        row["package_name"] = json.dumps(meta.get("packageName", []))
-        row["templates"] = json.dumps(meta.get("templates", []))
-
-        study = meta.get("studyForm", {})
-        row["study_name"] = study.get("studyName", "")
-        row["pi_name"] = study.get("piName", "")
-        row["pi_email"] = study.get("piEmail", "")
-        row["pi_orcid"] = study.get("piOrcid", "")
-        row["description"] = study.get("description", "")
-        row["notes"] = study.get("notes", "")
-        row["gold_study_id"] = study.get("GOLDStudyId", "")
-        row["ncbi_bioproject_id"] = study.get("NCBIBioProjectId", "")
-        row["data_dois"] = json.dumps(study.get("dataDois", []))
-        row["funding_sources"] = json.dumps(study.get("fundingSources", []))
-
-        multi = meta.get("multiOmicsForm", {})
-        row["award"] = multi.get("award", "")
-        row["award_dois"] = json.dumps(multi.get("awardDois", []))
-        row["data_generated"] = multi.get("dataGenerated")
-        row["doe"] = multi.get("doe")
-
-        row["metadata_submission_json"] = json.dumps(meta, default=str)
-
-        flat_rows.append(row)
-
-    df = pd.DataFrame(flat_rows)
-    conn.register("_tmp_df", df)
-    conn.execute("CREATE OR REPLACE TABLE nmdc_submissions AS SELECT * FROM _tmp_df")
-    conn.unregister("_tmp_df")
-    log.info(f"  {len(df)} rows")
+    rows = load_table(conn, "nmdc_submissions",
+                      (_submission_row(doc) for doc in db.nmdc_submissions.find({}, {"_id": 0})),
+                      NMDC_SUBMISSIONS_SCHEMA)
+    log.info(f"  {rows} rows")
 
 
 @click.command()
@@ -0,0 +1,128 @@
+"""
+An Aho-Corasick automaton over the keys of an oaklib lexical index.
+
+oaklib's naive lexical-index annotator tests every grouping key against the
+text with `k in text_lower` and keeps the first occurrence of each key, so one
+label costs a pass per key. LexicalAutomaton compiles the keys once and finds
+the first occurrence of every key in a single pass over the text, after which
+LexicalAutomaton.annotate applies the same rules oaklib does:
+
+  - a key is skipped when its first occurrence is preceded by a letter;
+  - one annotation per relationship of the key, with 1-based inclusive
+    subject_start/subject_end and match_string sliced from the original text.
+
+Annotations come back in grouping order, as oaklib yields them, as plain
+tuples that need neither oaklib nor the index to be used.
+"""
+
+from collections import deque
+from typing import NamedTuple
+
+
+class KeyMatch(NamedTuple):
+    """One relationship of a matched lexical index key, positioned in the text."""
+    subject_start: int
+    subject_end: int
+    predicate_id: str
+    object_id: str
+    object_label: str | None
+    match_string: str
+    matches_whole_text: bool
+
+
+class LexicalAutomaton:
+    """
+    Keys of a lexical index compiled into goto/fail/output tables.
+
+    keys and relationships are parallel lists in grouping order; each
+    relationship is a (predicate, element, element_term) tuple.
+    """
+
+    def __init__(self, keys, relationships):
+        self.keys = list(keys)
+        self.relationships = [tuple(tuple(r) for r in rels) for rels in relationships]
+        self._goto = [{}]
+        self._fail = [0]
+        # Key index ending at the state, and the nearest state down the fail chain that ends a key.
+        self._terminal = [-1]
+        self._output_link = [0]
+        for key_index, key in enumerate(self.keys):
+            if key:
+                self._add(key, key_index)
+        self._link()
+
+    @classmethod
+    def from_lexical_index(cls, lexical_index):
+        """Compile an oaklib LexicalIndex, keeping its grouping order."""
+        keys = []
+        relationships = []
+        for key, grouping in lexical_index.groupings.items():
+            keys.append(key)
+            relationships.append([(r.predicate, r.element, r.element_term) for r in grouping.relationships])
+        return cls(keys, relationships)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _add(self, key, key_index):
+        state = 0
+        for char in key:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._terminal.append(-1)
+                self._output_link.append(0)
+            state = next_state
+        # Duplicate keys keep their first position, as a dict of groupings would.
+        if self._terminal[state] < 0:
+            self._terminal[state] = key_index
+
+    def _link(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, child in self._goto[state].items():
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[child] = target if target != child else 0
+                failed_to = self._fail[child]
+                self._output_link[child] = failed_to if self._terminal[failed_to] >= 0 else self._output_link[failed_to]
+                queue.append(child)
+
+    def first_occurrences(self, text):
+        """Return {key index: 0-based start of the key's first occurrence in text}."""
+        goto, fail, terminal, output_link, keys = (
+            self._goto, self._fail, self._terminal, self._output_link, self.keys)
+        found = {}
+        state = 0
+        for end, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            match = state if terminal[state] >= 0 else output_link[state]
+            while match:
+                key_index = terminal[match]
+                if key_index not in found:
+                    found[key_index] = end - len(keys[key_index]) + 1
+                match = output_link[match]
+        return found
+
+    def annotate(self, text):
+        """Annotate text as oaklib's lexical-index annotator would; returns KeyMatch tuples."""
+        text_lower = text.lower()
+        matches = []
+        for key_index, start in sorted(self.first_occurrences(text_lower).items()):
+            if start > 0 and text_lower[start - 1].isalpha():
+                continue
+            key_length = len(self.keys[key_index])
+            match_string = text[start:start + key_length]
+            whole_text = start == 0 and key_length == len(text)
+            for predicate, element, element_term in self.relationships[key_index]:
+                matches.append(KeyMatch(start + 1, start + key_length, predicate, element, element_term,
+                                        match_string, whole_text))
+        return matches
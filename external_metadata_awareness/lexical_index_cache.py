@@ -0,0 +1,110 @@
+"""
+Binary cache of a compiled lexical index, for fast annotator start-up.
+
+Loading expanded_envo_po_lexical_index.yaml through oaklib and building the
+element-to-label map from it takes minutes. This module stores what the
+annotator actually uses, the compiled LexicalAutomaton (the index keys and
+their relationships as flat tuples) and the element-to-label map, as one
+pickle behind a small header:
+
+    MAGIC | header length (4 bytes, big-endian) | JSON header | pickle payload
+
+The header records the cache format version, the oaklib adapter strings of
+the ontologies in the index, the (path, size, mtime) stamps of the source
+files the index was built from, a sha256 checksum over those stamps, and a
+sha256 of the payload. read_index_cache returns None, so the caller
+rebuilds, when the file is missing, truncated, of another format version, or
+built from sources that have since changed.
+"""
+
+import hashlib
+import json
+import os
+import pickle
+import struct
+
+DEFAULT_INDEX_CACHE = "expanded_envo_po_lexical_index.pkl"
+
+FORMAT_VERSION = 1
+
+_MAGIC = b"EMALXIDX"
+_HEADER_LENGTH = struct.Struct(">I")
+
+
+def source_stamps(paths):
+    """(path, size, mtime) of each existing source file, sorted by path."""
+    stamps = []
+    for path in sorted(set(paths)):
+        if os.path.exists(path):
+            stat = os.stat(path)
+            stamps.append([path, stat.st_size, stat.st_mtime])
+    return stamps
+
+
+def source_checksum(stamps):
+    """sha256 over the source stamps; changes whenever a source file does."""
+    return hashlib.sha256(json.dumps(stamps).encode("utf-8")).hexdigest()
+
+
+def write_index_cache(path, automaton, element_to_label, source_paths, adapters=()):
+    """
+    Write the cache for the given sources, atomically replacing any existing file.
+
+    adapters are the adapter strings of the ontologies merged into the index,
+    so the index can be validated and rebuilt with the same ontologies.
+    """
+    payload = pickle.dumps((automaton, element_to_label), protocol=pickle.HIGHEST_PROTOCOL)
+    stamps = source_stamps(source_paths)
+    header = json.dumps({
+        "format_version": FORMAT_VERSION,
+        "adapters": list(adapters),
+        "sources": stamps,
+        "source_checksum": source_checksum(stamps),
+        "payload_sha256": hashlib.sha256(payload).hexdigest(),
+        "keys": len(automaton),
+    }).encode("utf-8")
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_MAGIC)
+        f.write(_HEADER_LENGTH.pack(len(header)))
+        f.write(header)
+        f.write(payload)
+    os.replace(tmp_path, path)
+
+
+def read_index_header(path):
+    """The JSON header of a cache file, or None if the file is missing or not a cache."""
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as f:
+        if f.read(len(_MAGIC)) != _MAGIC:
+            return None
+        length = f.read(_HEADER_LENGTH.size)
+        if len(length) != _HEADER_LENGTH.size:
+            return None
+        try:
+            return json.loads(f.read(_HEADER_LENGTH.unpack(length)[0]))
+        except ValueError:
+            return None
+
+
+def read_index_cache(path, source_paths):
+    """
+    Return (automaton, element_to_label) from the cache at path.
+
+    Returns None when there is no usable cache: the file is missing or
+    damaged, has another format version, or its source checksum does not
+    match the current stamps of source_paths.
+    """
+    header = read_index_header(path)
+    if header is None or header.get("format_version") != FORMAT_VERSION:
+        return None
+    if header.get("source_checksum") != source_checksum(source_stamps(source_paths)):
+        return None
+    with open(path, "rb") as f:
+        f.seek(len(_MAGIC))
+        f.seek(_HEADER_LENGTH.unpack(f.read(_HEADER_LENGTH.size))[0], os.SEEK_CUR)
+        payload = f.read()
+    if hashlib.sha256(payload).hexdigest() != header.get("payload_sha256"):
+        return None
+    return pickle.loads(payload)
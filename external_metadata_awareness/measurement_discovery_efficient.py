@@ -18,8 +18,11 @@ PERFORMANCE CHARACTERISTICS:
         - Output: content_pairs_aggregated collection
 
     Phase 3: Quantulum3 Processing (~40M pairs after skip list)
-        - Time: 4-8 hours (CPU-intensive)
-        - Memory: Moderate (batch buffer + results list)
+        - Time: 4-8 hours (CPU-intensive) with one process; --workers N divides this
+          roughly by N (workers parse, this process writes)
+        - Memory: Constant (batch buffer only; pairs stream in from Phase 1)
+        - Reruns: values already in the quantulum3 parse cache (--parse-cache) are not
+          parsed again, so a monthly refresh mostly pays for new values only
         - Output: measurement_results_skip_filtered collection
 
 USAGE EXAMPLES:
@@ -38,9 +41,12 @@ USAGE EXAMPLES:
         --clear-output \\
         --min-count 10
 
-    # Full production run (4-8 hours)
+    # Full production run (4-8 hours single-process)
     make -f Makefiles/measurement_discovery.Makefile run-measurement-discovery
 
+    # Same, parsing on 32 cores
+    make -f Makefiles/measurement_discovery.Makefile run-measurement-discovery MEASUREMENT_WORKERS=32
+
 OUTPUT COLLECTIONS:
     - content_pairs_aggregated: All (harmonized_name, content, biosample_count) pairs
     - measurement_results_skip_filtered: Parsed quantities (value, unit, entity)
@@ -48,17 +54,28 @@ OUTPUT COLLECTIONS:
 MEMORY MANAGEMENT:
     - Streams aggregation cursor to avoid loading 64M docs into memory (Issue #262)
     - Batched inserts (10k documents per batch) for aggregation saves
+    - Phases run as one generator chain: parsing starts with the first aggregation
+      batch, and no list of pairs is ever built (at most 10k are prefetched)
     - Skip list (224 harmonized_names) reduces quantulum3 processing by ~40%
 
 See: https://github.com/microbiomedata/external-metadata-awareness/issues/262
 """
 
 import click
+import queue
+import threading
 import time
+import zlib
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
 from pymongo import MongoClient
+from pymongo.errors import BulkWriteError
 from quantulum3 import parser
 from tqdm import tqdm
 
+from external_metadata_awareness.quantulum_parse_cache import DEFAULT_PARSE_CACHE, open_parse_cache, parse_quantities
+
 # Skip list developed by Claude and MAM on 2025-09-28/29 based on dimensional unit analysis
 # Original criteria: Skip harmonized_names with <5% dimensional content rate from quantulum3 parsing
 # Extended criteria: Skip fields containing name, id (whole word), type, method, regm, process, date
@@ -123,6 +140,292 @@ SKIP_HARMONIZED_NAMES = {
     'description', 'food_source', 'source_name', 'secondary_treatment', 'samp_store_loc'
 }
 
+
+def looks_like_measurement(content):
+    """Cheap prefilter: only content with both a letter and a digit is worth parsing."""
+    has_letter = any(c.isalpha() for c in content)
+    has_digit = any(c.isdigit() for c in content)
+    return has_letter and has_digit
+
+
+def quantity_fields(quantity):
+    """Reduce a cached quantity dict to a compact tuple.
+
+    (value, unit, entity, span_start, span_end, surface_text)
+    """
+    unit = quantity['unit']
+    span = quantity['span']
+    return (
+        quantity['value'],
+        unit['name'] if unit else None,
+        unit['entity'] if unit else None,
+        span[0] if span else None,
+        span[1] if span else None,
+        quantity['surface'],
+    )
+
+
+def parse_content(content, parse_cache=None):
+    """Parse one content string with quantulum3 into a list of quantity_fields tuples."""
+    quantities = parse_cache.parse(content) if parse_cache is not None else parse_quantities(content)
+    return [quantity_fields(quantity) for quantity in quantities]
+
+
+def result_doc(harmonized_name, content, biosample_count, fields):
+    """Build one measurement_results_skip_filtered document from a quantity_fields tuple."""
+    value, unit, entity, span_start, span_end, surface_text = fields
+    # Calculate coverage percentage
+    coverage_pct = ((span_end - span_start) / len(content) * 100) if span_start is not None and len(content) > 0 else 0
+    return {
+        'harmonized_name': harmonized_name,
+        'original_content': content,
+        'biosample_count': biosample_count,
+        'value': value,
+        'unit': unit,
+        'entity': entity,
+        'span_start': span_start,
+        'span_end': span_end,
+        'surface_text': surface_text,
+        'coverage_pct': round(coverage_pct, 1),
+        'content_length': len(content)
+    }
+
+
+def _init_parse_worker():
+    """Load quantulum3's models once per worker, before the first real chunk arrives."""
+    parser.parse("1 m")
+
+
+def parse_chunk(contents):
+    """Worker entry point: parse a chunk of content strings.
+
+    Returns one entry per input, in order: a list of quantity dicts, or the
+    error message if quantulum3 raised. These are exactly what the parse
+    cache stores.
+    """
+    results = []
+    for content in contents:
+        try:
+            results.append(parse_quantities(content))
+        except Exception as e:
+            results.append(str(e))
+    return results
+
+
+def parse_in_pool(pairs, workers, chunk_size, parse_cache=None):
+    """Parse (harmonized_name, content, biosample_count) dicts in a process pool.
+
+    Yields (pair, parse_result) in input order, where parse_result is what
+    parse_chunk returns for that pair. Only workers * 2 chunks are in flight at
+    once, so results never pile up ahead of the caller. With a parse_cache,
+    cached values are answered here and only misses go to the workers; their
+    results are cached by this process, the cache's only writer.
+    """
+    pairs = iter(pairs)
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_parse_worker) as pool:
+        def submit():
+            while len(pending) < workers * 2:
+                chunk = list(islice(pairs, chunk_size))
+                if not chunk:
+                    return
+                cached = [parse_cache.get(pair['content']) if parse_cache is not None else None
+                          for pair in chunk]
+                misses = [pair['content'] for pair, result in zip(chunk, cached) if result is None]
+                future = pool.submit(parse_chunk, misses) if misses else None
+                pending.append((chunk, cached, future))
+
+        submit()
+        while pending:
+            chunk, cached, future = pending.popleft()
+            parsed = iter(future.result() if future is not None else ())
+            submit()
+            for pair, result in zip(chunk, cached):
+                if result is None:
+                    result = next(parsed)
+                    if parse_cache is not None:
+                        parse_cache.put(pair['content'], result)
+                yield pair, result
+
+
+# Pairs the aggregation-reading thread may run ahead of quantulum3 parsing.
+PREFETCH_PAIRS = 10000
+
+
+# Progress of each shard's Phase 3, for --resume.
+CHECKPOINT_COLLECTION = 'measurement_discovery_checkpoints'
+
+
+def new_stream_stats():
+    """Counters filled in by stream_aggregation, apply_skip_list and apply_shard as pairs go by."""
+    return {'total_count': 0, 'total_biosamples': 0, 'saved_count': 0, 'skipped_count': 0,
+            'other_shard_count': 0, 'first_five': []}
+
+
+def stream_aggregation(cursor, stats, agg_collection=None, agg_batch_size=10000):
+    """Yield aggregation rows one at a time, counting them into stats.
+
+    When agg_collection is given, rows are also saved to it in batches of
+    agg_batch_size as they pass through.
+    """
+    agg_batch = []
+    for result in cursor:
+        stats['total_count'] += 1
+        stats['total_biosamples'] += result['biosample_count']
+
+        # Collect first 5 for display
+        if len(stats['first_five']) < 5:
+            stats['first_five'].append(result)
+
+        if agg_collection is not None:
+            agg_batch.append(result)
+
+            if len(agg_batch) >= agg_batch_size:
+                agg_collection.insert_many(agg_batch)
+                stats['saved_count'] += len(agg_batch)
+                agg_batch = []
+
+                # Progress every 1M
+                if stats['saved_count'] % 1000000 == 0:
+                    print(f"[{time.strftime('%H:%M:%S')}] Saved {stats['saved_count']:,} aggregation results...")
+
+        yield result
+
+    # Save final aggregation batch
+    if agg_collection is not None and agg_batch:
+        agg_collection.insert_many(agg_batch)
+        stats['saved_count'] += len(agg_batch)
+
+
+def apply_skip_list(pairs, stats):
+    """Yield the pairs whose harmonized_name is not in SKIP_HARMONIZED_NAMES."""
+    for result in pairs:
+        if result['harmonized_name'] not in SKIP_HARMONIZED_NAMES:
+            yield result
+        else:
+            stats['skipped_count'] += 1
+
+
+def prefetch(iterable, maxsize):
+    """Iterate iterable in a background thread, at most maxsize items ahead of the caller.
+
+    Lets the MongoDB cursor fetch (and the aggregation save) proceed while the
+    caller parses. Exceptions from the iterable are re-raised in the caller;
+    if the caller stops early the thread is told to stop.
+    """
+    buffer = queue.Queue(maxsize)
+    stop = threading.Event()
+
+    def put(entry):
+        while not stop.is_set():
+            try:
+                buffer.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put((False, item)):
+                    return
+        except Exception as e:
+            put((True, e))
+        else:
+            put((True, None))
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            done, item = buffer.get()
+            if done:
+                if item is not None:
+                    raise item
+                return
+            yield item
+    finally:
+        stop.set()
+        thread.join()
+
+
+def parse_shard_spec(ctx, param, value):
+    """click callback: parse --shard i/N into (i, N), 1-based."""
+    try:
+        index, count = (int(part) for part in value.split('/'))
+    except ValueError:
+        raise click.BadParameter("expected i/N, e.g. 2/4")
+    if not 1 <= index <= count:
+        raise click.BadParameter("i must be between 1 and N")
+    return index, count
+
+
+def in_shard(pair, shard_index, shard_count):
+    """Stable assignment of a (harmonized_name, content) pair to one of shard_count shards."""
+    key = f"{pair['harmonized_name']}\0{pair['content']}".encode('utf-8')
+    return zlib.crc32(key) % shard_count == shard_index - 1
+
+
+def apply_shard(pairs, shard_index, shard_count, stats):
+    """Yield only this shard's pairs; the rest are counted as other_shard_count."""
+    for result in pairs:
+        if in_shard(result, shard_index, shard_count):
+            yield result
+        else:
+            stats['other_shard_count'] += 1
+
+
+def pair_result_docs(pair, fields_list):
+    """Result documents for one pair, with an _id that is stable across reruns.
+
+    The _id is "{harmonized_name}:{content}:{n}" for the pair's n-th quantity, so
+    re-inserting a pair's results after an interrupted run is a duplicate-key
+    no-op instead of a second copy.
+    """
+    harmonized_name, content = pair['harmonized_name'], pair['content']
+    docs = []
+    for n, fields in enumerate(fields_list):
+        doc = {'_id': f"{harmonized_name}:{content}:{n}"}
+        doc.update(result_doc(harmonized_name, content, pair['biosample_count'], fields))
+        docs.append(doc)
+    return docs
+
+
+_DUPLICATE_KEY_ERROR = 11000
+
+
+def insert_result_docs(collection, docs):
+    """Insert result documents unordered, ignoring those a previous run already saved (duplicate _id)."""
+    try:
+        collection.insert_many(docs, ordered=False)
+    except BulkWriteError as e:
+        errors = e.details.get('writeErrors', [])
+        if e.details.get('writeConcernErrors') or any(
+                err.get('code') != _DUPLICATE_KEY_ERROR for err in errors):
+            raise
+
+
+def resume_stage(checkpoint):
+    """$match stage that keeps only pairs sorting after the checkpoint's last pair."""
+    last_name, last_content = checkpoint['last_harmonized_name'], checkpoint['last_content']
+    return {"$match": {"$or": [
+        {"harmonized_name": {"$gt": last_name}},
+        {"harmonized_name": last_name, "content": {"$gt": last_content}},
+    ]}}
+
+
+def save_checkpoint(collection, checkpoint, last_pair, pairs_processed, complete=False):
+    """Record that every pair up to and including last_pair has its results saved."""
+    if last_pair is not None:
+        checkpoint['last_harmonized_name'] = last_pair['harmonized_name']
+        checkpoint['last_content'] = last_pair['content']
+    checkpoint['pairs_processed'] = pairs_processed
+    checkpoint['complete'] = complete
+    checkpoint['updated_at'] = time.strftime('%Y-%m-%dT%H:%M:%S')
+    collection.replace_one({'_id': checkpoint['_id']}, checkpoint, upsert=True)
+
+
 @click.command()
 @click.option(
     '--mongo-uri',
@@ -173,7 +476,45 @@ SKIP_HARMONIZED_NAMES = {
     help='Drop measurement_results_skip_filtered before processing. MINIMAL IMPACT: ~1-2 seconds. '
          'Use when starting fresh (not resuming).'
 )
-def main(mongo_uri, min_count, progress_every, batch_size, limit, save_aggregation, clear_output):
+@click.option(
+    '--workers',
+    default=1,
+    type=int,
+    help='quantulum3 worker processes. MAJOR IMPACT: Phase 3 is CPU-bound and scales with cores. '
+         '1 = parse in this process with per-value progress output; N > 1 = a process pool, with '
+         'results written by this process.'
+)
+@click.option(
+    '--chunk-size',
+    default=500,
+    type=int,
+    help='Values sent to a worker at a time when --workers > 1. MINIMAL IMPACT: '
+         'larger chunks mean less inter-process overhead but coarser progress.'
+)
+@click.option(
+    '--parse-cache',
+    default=DEFAULT_PARSE_CACHE,
+    show_default=True,
+    help='SQLite file of quantulum3 parses keyed by content hash + quantulum3 version, shared with '
+         'normalize-biosample-measurements. MAJOR IMPACT on reruns: only values not parsed by an '
+         'earlier run reach quantulum3. Pass an empty string to disable.'
+)
+@click.option(
+    '--resume',
+    is_flag=True,
+    help='Continue this shard from its last checkpoint in measurement_discovery_checkpoints instead of '
+         'starting over. MAJOR IMPACT after an interruption: pairs already saved are not parsed again.'
+)
+@click.option(
+    '--shard',
+    default='1/1',
+    show_default=True,
+    callback=parse_shard_spec,
+    help='Process only shard i of N (i/N), so N machines can split Phase 3. Pairs are assigned by a '
+         'stable hash of (harmonized_name, content); every shard still runs the aggregation.'
+)
+def main(mongo_uri, min_count, progress_every, batch_size, limit, save_aggregation, clear_output,
+         workers, chunk_size, parse_cache, resume, shard):
     """
     Efficient measurement discovery using biosamples_attributes aggregation with skip list.
 
@@ -195,7 +536,18 @@ def main(mongo_uri, min_count, progress_every, batch_size, limit, save_aggregati
 
         # Full production run (use Makefile target instead)
         $ make -f Makefiles/measurement_discovery.Makefile run-measurement-discovery
+
+        # Split across two machines, then pick up shard 2 again after an interruption
+        $ poetry run measurement-discovery-efficient --shard 1/2
+        $ poetry run measurement-discovery-efficient --shard 2/2 --resume
     """
+    shard_index, shard_count = shard
+    if resume and (clear_output or save_aggregation):
+        raise click.UsageError("--resume continues an earlier run; it cannot be combined with "
+                               "--clear-output or --save-aggregation")
+    if shard_index > 1 and (clear_output or save_aggregation):
+        raise click.UsageError("--clear-output and --save-aggregation affect every shard; "
+                               "use them on shard 1 only")
 
     print(f"[{time.strftime('%H:%M:%S')}] Starting efficient measurement discovery...")
     print(f"[{time.strftime('%H:%M:%S')}] Using skip list: {len(SKIP_HARMONIZED_NAMES)} harmonized_names will be skipped")
@@ -239,81 +591,33 @@ def main(mongo_uri, min_count, progress_every, batch_size, limit, save_aggregati
     if limit:
         pipeline.append({"$limit": limit})
 
-    start_time = time.time()
-    cursor = db.biosamples_attributes.aggregate(pipeline, allowDiskUse=True)
-
-    # Stream results to avoid loading all 64M documents into memory (Issue #262)
-    agg_collection = db['content_pairs_aggregated'] if save_aggregation else None
-    if save_aggregation:
-        print(f"[{time.strftime('%H:%M:%S')}] Streaming aggregation results to content_pairs_aggregated collection...")
-        agg_collection.drop()
-
-    # Streaming variables
-    agg_batch = []
-    agg_batch_size = 10000
-    quantulum_results = []
-    total_count = 0
-    saved_count = 0
-    skipped_count = 0
-    total_biosamples = 0
-    first_five = []
-
-    # Stream cursor and process in one pass
-    for result in cursor:
-        total_count += 1
-        total_biosamples += result['biosample_count']
-
-        # Collect first 5 for display
-        if len(first_five) < 5:
-            first_five.append(result)
-
-        # Save to aggregation collection if requested
-        if save_aggregation:
-            agg_batch.append(result)
-
-            if len(agg_batch) >= agg_batch_size:
-                agg_collection.insert_many(agg_batch)
-                saved_count += len(agg_batch)
-                agg_batch = []
-
-                # Progress every 1M
-                if saved_count % 1000000 == 0:
-                    print(f"[{time.strftime('%H:%M:%S')}] Saved {saved_count:,} aggregation results...")
-
-        # Filter for quantulum3 processing
-        if result['harmonized_name'] not in SKIP_HARMONIZED_NAMES:
-            quantulum_results.append(result)
-        else:
-            skipped_count += 1
-
-    agg_time = time.time() - start_time
-
-    # Save final aggregation batch
-    if save_aggregation and agg_batch:
-        agg_collection.insert_many(agg_batch)
-        saved_count += len(agg_batch)
-        print(f"[{time.strftime('%H:%M:%S')}] Saved {saved_count:,} aggregation results")
-
-    print(f"[{time.strftime('%H:%M:%S')}] Aggregation completed in {agg_time:.1f}s")
-    print(f"[{time.strftime('%H:%M:%S')}] Found {total_count:,} (harmonized_name, content) pairs with ≥{min_count} biosamples (ALL harmonized_names)")
-
-    if total_count > 0:
-        print(f"[{time.strftime('%H:%M:%S')}] Covering {total_biosamples:,} total biosample instances")
-        print(f"[{time.strftime('%H:%M:%S')}] Top 5 most common:")
-        for i, result in enumerate(first_five):
-            print(f"[{time.strftime('%H:%M:%S')}]   {i+1}. {result['harmonized_name']}: \"{result['content']}\" ({result['biosample_count']:,} biosamples)")
-
-    if total_count == 0:
-        print(f"[{time.strftime('%H:%M:%S')}] No results found - try lowering min_count")
-        return
-
-    print(f"[{time.strftime('%H:%M:%S')}] Applying skip list for quantulum3 processing...")
-    print(f"[{time.strftime('%H:%M:%S')}] Will process {len(quantulum_results):,} pairs ({skipped_count:,} pairs skipped)")
-
-    # Process with quantulum3 in batches
-    print(f"[{time.strftime('%H:%M:%S')}] Starting quantulum3 processing...")
-    processed = 0
-    parsed_results = []
+    # Progress of this shard; results are saved under stable _ids, so a pair
+    # whose results were saved just before an interruption is not duplicated
+    checkpoints = db[CHECKPOINT_COLLECTION]
+    shard_label = f"{shard_index}/{shard_count}"
+    run_settings = {'min_count': min_count, 'limit': limit}
+    checkpoint = checkpoints.find_one({'_id': shard_label}) if resume else None
+    if checkpoint is not None:
+        if {k: checkpoint.get(k) for k in run_settings} != run_settings:
+            raise click.ClickException(
+                f"Checkpoint for shard {shard_label} was written with {({k: checkpoint.get(k) for k in run_settings})}, "
+                f"not {run_settings}; rerun without --resume to start over")
+        if checkpoint.get('complete'):
+            print(f"[{time.strftime('%H:%M:%S')}] Shard {shard_label} already completed "
+                  f"({checkpoint['pairs_processed']:,} pairs); nothing to resume")
+            return
+        if checkpoint.get('last_harmonized_name') is not None:
+            print(f"[{time.strftime('%H:%M:%S')}] Resuming shard {shard_label} after "
+                  f"{checkpoint['last_harmonized_name']}: \"{checkpoint['last_content']}\" "
+                  f"({checkpoint['pairs_processed']:,} pairs already processed)")
+            pipeline.append(resume_stage(checkpoint))
+    else:
+        if resume:
+            print(f"[{time.strftime('%H:%M:%S')}] No checkpoint for shard {shard_label}; starting from the beginning")
+        checkpoint = dict(_id=shard_label, shard_index=shard_index, shard_count=shard_count,
+                          last_harmonized_name=None, last_content=None, pairs_processed=0, complete=False,
+                          **run_settings)
+    pairs_before = checkpoint['pairs_processed']
 
     output_collection = db['measurement_results_skip_filtered']
     print(f"[{time.strftime('%H:%M:%S')}] Results will be stored in: measurement_results_skip_filtered")
@@ -324,78 +628,149 @@ def main(mongo_uri, min_count, progress_every, batch_size, limit, save_aggregati
         output_collection.drop()
         print(f"[{time.strftime('%H:%M:%S')}] Output collection cleared")
 
-    with tqdm(total=len(quantulum_results), desc="Processing with quantulum3") as pbar:
-        for i, result in enumerate(quantulum_results):
-            content = result['content']
-            harmonized_name = result['harmonized_name']
-
-            # Show progress every N items
-            if i % progress_every == 0:
-                print(f"\n[{time.strftime('%H:%M:%S')}] Progress {i+1}/{len(quantulum_results)}: Processing \"{content}\" for {harmonized_name}")
+    start_time = time.time()
+    cursor = db.biosamples_attributes.aggregate(pipeline, allowDiskUse=True)
 
-            # Skip content that doesn't contain both letter and digit (likely not measurement)
-            has_letter = any(c.isalpha() for c in content)
-            has_digit = any(c.isdigit() for c in content)
+    # Stream results to avoid loading all 64M documents into memory (Issue #262)
+    agg_collection = db['content_pairs_aggregated'] if save_aggregation else None
+    if save_aggregation:
+        print(f"[{time.strftime('%H:%M:%S')}] Streaming aggregation results to content_pairs_aggregated collection...")
+        agg_collection.drop()
 
-            if not (has_letter and has_digit):
-                if i % progress_every == 0:
-                    print(f"[{time.strftime('%H:%M:%S')}]   → Skipped: no letter+digit pattern")
+    # Aggregation, skip list, letter+digit prefilter and quantulum3 run as one
+    # generator chain, so parsing starts with the first aggregation batch and
+    # memory stays flat however many pairs there are. The cursor is read in a
+    # background thread at most PREFETCH_PAIRS ahead of the parser.
+    stats = new_stream_stats()
+    pairs = prefetch(stream_aggregation(cursor, stats, agg_collection), PREFETCH_PAIRS)
+    quantulum_pairs = apply_skip_list(pairs, stats)
+    if shard_count > 1:
+        print(f"[{time.strftime('%H:%M:%S')}] Processing shard {shard_label} of the pairs")
+        quantulum_pairs = apply_shard(quantulum_pairs, shard_index, shard_count, stats)
+
+    print(f"[{time.strftime('%H:%M:%S')}] Starting quantulum3 processing (skip list applied as pairs arrive)...")
+    parse_cache = open_parse_cache(parse_cache)
+    processed = 0
+    parsed_results = []
+    last_pair = None
+
+    def flush(complete=False):
+        """Save the buffered results, then checkpoint every pair processed so far."""
+        nonlocal parsed_results
+        if parsed_results:
+            insert_result_docs(output_collection, parsed_results)
+            parsed_results = []
+        save_checkpoint(checkpoints, checkpoint, last_pair, pairs_before + processed, complete)
+
+    if workers > 1:
+        print(f"[{time.strftime('%H:%M:%S')}] Parsing with {workers} worker processes, {chunk_size} values per chunk")
+        parse_errors = 0
+        since_save = 0
+        with tqdm(desc="Processing with quantulum3") as pbar:
+            def candidates():
+                nonlocal processed, last_pair
+                for result in quantulum_pairs:
+                    if looks_like_measurement(result['content']):
+                        yield result
+                    else:
+                        processed += 1
+                        last_pair = result
+                        pbar.update(1)
+
+            for result, parsed in parse_in_pool(candidates(), workers, chunk_size, parse_cache):
+                if isinstance(parsed, str):
+                    parse_errors += 1
+                else:
+                    parsed_results.extend(pair_result_docs(result, [quantity_fields(q) for q in parsed]))
                 processed += 1
+                last_pair = result
+                since_save += 1
                 pbar.update(1)
-                continue
 
-            try:
-                parsed = parser.parse(str(content))
-                if parsed:
-                    for quantity in parsed:
-                        # Calculate coverage percentage
-                        coverage_pct = ((quantity.span[1] - quantity.span[0]) / len(content) * 100) if quantity.span and len(content) > 0 else 0
-
-                        doc = {
-                            'harmonized_name': harmonized_name,
-                            'original_content': content,
-                            'biosample_count': result['biosample_count'],
-                            'value': quantity.value,
-                            'unit': quantity.unit.name if quantity.unit else None,
-                            'entity': quantity.unit.entity.name if quantity.unit and quantity.unit.entity else None,
-                            'span_start': quantity.span[0] if quantity.span else None,
-                            'span_end': quantity.span[1] if quantity.span else None,
-                            'surface_text': quantity.surface if hasattr(quantity, 'surface') else None,
-                            'coverage_pct': round(coverage_pct, 1),
-                            'content_length': len(content)
-                        }
-                        parsed_results.append(doc)
-
-                        # Show detailed output for monitoring
-                        if i % progress_every == 0:
-                            print(f"[{time.strftime('%H:%M:%S')}]   → Parsed: {quantity.value} {quantity.unit.name if quantity.unit else 'dimensionless'}")
+                # Save intermediate results every batch
+                if since_save >= batch_size:
+                    flush()
+                    since_save = 0
+        print(f"[{time.strftime('%H:%M:%S')}] quantulum3 raised on {parse_errors:,} values")
+    else:
+        with tqdm(desc="Processing with quantulum3") as pbar:
+            for i, result in enumerate(quantulum_pairs):
+                content = result['content']
+                harmonized_name = result['harmonized_name']
+
+                # Show progress every N items
+                if i % progress_every == 0:
+                    print(f"\n[{time.strftime('%H:%M:%S')}] Progress {i+1:,}: Processing \"{content}\" for {harmonized_name}")
 
-                else:
+                # Skip content that doesn't contain both letter and digit (likely not measurement)
+                if not looks_like_measurement(content):
                     if i % progress_every == 0:
-                        print(f"[{time.strftime('%H:%M:%S')}]   → No quantities detected")
+                        print(f"[{time.strftime('%H:%M:%S')}]   → Skipped: no letter+digit pattern")
+                    processed += 1
+                    last_pair = result
+                    pbar.update(1)
+                    continue
+
+                try:
+                    parsed = parse_content(content, parse_cache)
+                    if parsed:
+                        parsed_results.extend(pair_result_docs(result, parsed))
+                        for fields in parsed:
+                            # Show detailed output for monitoring
+                            if i % progress_every == 0:
+                                print(f"[{time.strftime('%H:%M:%S')}]   → Parsed: {fields[0]} {fields[1] or 'dimensionless'}")
+
+                    else:
+                        if i % progress_every == 0:
+                            print(f"[{time.strftime('%H:%M:%S')}]   → No quantities detected")
 
-            except Exception as e:
-                if i % progress_every == 0:
-                    print(f"[{time.strftime('%H:%M:%S')}]   → Parse error: {str(e)[:50]}")
+                except Exception as e:
+                    if i % progress_every == 0:
+                        print(f"[{time.strftime('%H:%M:%S')}]   → Parse error: {str(e)[:50]}")
 
-            processed += 1
-            pbar.update(1)
+                processed += 1
+                last_pair = result
+                pbar.update(1)
 
-            # Save intermediate results every batch
-            if processed % batch_size == 0 and parsed_results:
-                print(f"\n[{time.strftime('%H:%M:%S')}] Saving batch: {len(parsed_results):,} results to MongoDB...")
-                output_collection.insert_many(parsed_results)
-                parsed_results = []  # Clear for next batch
-                print(f"[{time.strftime('%H:%M:%S')}] Processed {processed:,}/{len(quantulum_results):,} so far")
+                # Save intermediate results every batch
+                if processed % batch_size == 0:
+                    if parsed_results:
+                        print(f"\n[{time.strftime('%H:%M:%S')}] Saving batch: {len(parsed_results):,} results to MongoDB...")
+                    flush()
+                    print(f"[{time.strftime('%H:%M:%S')}] Processed {processed:,} so far")
 
     # Save final batch
     if parsed_results:
         print(f"\n[{time.strftime('%H:%M:%S')}] Saving final batch: {len(parsed_results):,} results...")
-        output_collection.insert_many(parsed_results)
+    flush(complete=True)
+
+    if parse_cache is not None:
+        parse_cache.close()
+        print(f"[{time.strftime('%H:%M:%S')}] {parse_cache.stats_line()}")
+
+    if save_aggregation:
+        print(f"[{time.strftime('%H:%M:%S')}] Saved {stats['saved_count']:,} aggregation results")
+    print(f"[{time.strftime('%H:%M:%S')}] Aggregation and processing completed in {time.time() - start_time:.1f}s")
+    print(f"[{time.strftime('%H:%M:%S')}] Found {stats['total_count']:,} (harmonized_name, content) pairs with ≥{min_count} biosamples (ALL harmonized_names)")
+
+    if stats['total_count'] == 0:
+        print(f"[{time.strftime('%H:%M:%S')}] No results found - try lowering min_count")
+        return
+
+    print(f"[{time.strftime('%H:%M:%S')}] Covering {stats['total_biosamples']:,} total biosample instances")
+    print(f"[{time.strftime('%H:%M:%S')}] First 5 pairs:")
+    for i, result in enumerate(stats['first_five']):
+        print(f"[{time.strftime('%H:%M:%S')}]   {i+1}. {result['harmonized_name']}: \"{result['content']}\" ({result['biosample_count']:,} biosamples)")
+    print(f"[{time.strftime('%H:%M:%S')}] Processed {processed:,} pairs ({stats['skipped_count']:,} pairs skipped by the skip list)")
+    if shard_count > 1:
+        print(f"[{time.strftime('%H:%M:%S')}] {stats['other_shard_count']:,} pairs belong to other shards")
 
     total_saved = output_collection.count_documents({})
     print(f"\n[{time.strftime('%H:%M:%S')}] ✅ Processing complete!")
     print(f"[{time.strftime('%H:%M:%S')}] Total processed: {processed:,}")
+    if pairs_before:
+        print(f"[{time.strftime('%H:%M:%S')}] Total processed by this shard including earlier runs: "
+              f"{pairs_before + processed:,}")
     print(f"[{time.strftime('%H:%M:%S')}] Total quantities saved: {total_saved:,}")
     print(f"[{time.strftime('%H:%M:%S')}] Results collection: measurement_results_skip_filtered")
 
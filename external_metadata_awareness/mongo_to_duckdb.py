@@ -0,0 +1,174 @@
+"""Stream MongoDB collections into DuckDB tables through Arrow record batches.
+
+Documents are read from a cursor, converted batch by batch into Arrow
+RecordBatches with a fixed schema, and appended to a DuckDB table through a
+registered Arrow stream, so memory stays bounded by the batch size rather
+than the collection size.
+
+The schema is either declared by the caller or inferred with one
+aggregation over the collection: every top-level field (except _id) becomes
+a column, typed BIGINT, DOUBLE, BOOLEAN or TIMESTAMP when all of its values
+have that BSON type, and VARCHAR otherwise. Values in VARCHAR columns are
+stringified, which is how mixed columns such as 281 / '281 degrees' load.
+
+    poetry run export-mongo-to-duckdb --mongo-uri mongodb://localhost:27017/ncbi_metadata \\
+        --output local/ncbi_metadata_flat.duckdb --collection biosamples_flattened
+"""
+
+import logging
+import math
+
+import click
+import duckdb
+import pyarrow as pa
+from pymongo import MongoClient, uri_parser
+
+logging.basicConfig(level=logging.INFO, format="%(message)s")
+log = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 10_000
+
+_STREAM_NAME = "_arrow_stream"
+
+# BSON $type names that may share a typed column; anything else is VARCHAR.
+_NULL_TYPES = {"null", "missing", "undefined"}
+_ARROW_TYPES = [
+    ({"bool"}, pa.bool_()),
+    ({"int", "long"}, pa.int64()),
+    ({"int", "long", "double"}, pa.float64()),
+    ({"date"}, pa.timestamp("us")),
+]
+
+
+def arrow_type_for(bson_types):
+    """Arrow type for a column whose values have the given BSON $type names."""
+    types = set(bson_types) - _NULL_TYPES
+    if types:
+        for allowed, arrow_type in _ARROW_TYPES:
+            if types <= allowed:
+                return arrow_type
+    return pa.string()
+
+
+def infer_collection_schema(collection, query=None):
+    """
+    Build an Arrow schema covering every top-level field of the matching documents.
+
+    One server-side aggregation collects each field's BSON types and earliest
+    position within a document; columns follow that position, then name.
+    """
+    pipeline = [
+        {"$match": query or {}},
+        {"$project": {"_id": 0, "fields": {"$objectToArray": "$$ROOT"}}},
+        {"$unwind": {"path": "$fields", "includeArrayIndex": "position"}},
+        {"$match": {"fields.k": {"$ne": "_id"}}},
+        {"$group": {
+            "_id": "$fields.k",
+            "position": {"$min": "$position"},
+            "types": {"$addToSet": {"$type": "$fields.v"}},
+        }},
+        {"$sort": {"position": 1, "_id": 1}},
+    ]
+    return pa.schema([(field["_id"], arrow_type_for(field["types"]))
+                      for field in collection.aggregate(pipeline, allowDiskUse=True)])
+
+
+def _to_string(value):
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return None
+    return value if isinstance(value, str) else str(value)
+
+
+def _to_float(value):
+    return None if value is None else float(value)
+
+
+def _unchanged(value):
+    return value
+
+
+def _converter(arrow_type):
+    if pa.types.is_string(arrow_type):
+        return _to_string
+    if pa.types.is_floating(arrow_type):
+        return _to_float
+    return _unchanged
+
+
+def record_batches(rows, schema, batch_size=DEFAULT_BATCH_SIZE):
+    """Yield RecordBatches of up to batch_size dict rows, with values converted to the schema's types."""
+    converters = [(field.name, field.type, _converter(field.type)) for field in schema]
+
+    def to_batch(batch):
+        arrays = [pa.array([convert(row.get(name)) for row in batch], type=arrow_type)
+                  for name, arrow_type, convert in converters]
+        return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield to_batch(batch)
+            batch = []
+    if batch:
+        yield to_batch(batch)
+
+
+def load_table(conn, table, rows, schema, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Replace DuckDB table with the dict rows, streamed through Arrow.
+
+    Returns the number of rows loaded. A schema without columns leaves the
+    table untouched, since DuckDB cannot create a table with no columns.
+    """
+    if not len(schema):
+        log.warning(f"  no columns for {table}; skipped")
+        return 0
+    reader = pa.RecordBatchReader.from_batches(schema, record_batches(rows, schema, batch_size))
+    conn.register(_STREAM_NAME, reader)
+    try:
+        conn.execute(f'CREATE OR REPLACE TABLE "{table}" AS SELECT * FROM {_STREAM_NAME}')
+    finally:
+        conn.unregister(_STREAM_NAME)
+    return conn.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0]
+
+
+def export_collection(collection, conn, table=None, schema=None, query=None, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Export a MongoDB collection (without _id) to a DuckDB table of the same name.
+
+    Dots in the collection name become underscores in the table name. The
+    schema is inferred with infer_collection_schema unless one is given.
+    Returns (row count, column count).
+    """
+    table = table or collection.name.replace(".", "_")
+    schema = schema if schema is not None else infer_collection_schema(collection, query)
+    cursor = collection.find(query or {}, {"_id": 0}, batch_size=batch_size)
+    return load_table(conn, table, cursor, schema, batch_size), len(schema)
+
+
+@click.command()
+@click.option("--mongo-uri", default="mongodb://localhost:27017/ncbi_metadata", show_default=True,
+              help="MongoDB connection URI including database name.")
+@click.option("--output", type=click.Path(dir_okay=False), required=True, help="DuckDB file to write tables into.")
+@click.option("--collection", "collections", multiple=True, required=True,
+              help="Collection to export (repeatable); each replaces the table of the same name.")
+@click.option("--batch-size", default=DEFAULT_BATCH_SIZE, show_default=True, type=click.IntRange(min=1),
+              help="Documents per Arrow record batch.")
+def main(mongo_uri, output, collections, batch_size):
+    """Stream MongoDB collections into DuckDB tables through Arrow record batches."""
+    db_name = uri_parser.parse_uri(mongo_uri).get("database")
+    if not db_name:
+        raise click.UsageError("--mongo-uri must include a database name")
+
+    with MongoClient(mongo_uri) as client, duckdb.connect(output) as conn:
+        db = client[db_name]
+        for collection_name in collections:
+            log.info(f"Exporting {collection_name}...")
+            rows, columns = export_collection(db[collection_name], conn, batch_size=batch_size)
+            log.info(f"  {rows} rows, {columns} columns")
+        log.info(f"\nDone. Written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,7 +2,12 @@ import datetime
 import logging
 import os
 import pprint
+import sqlite3
+import threading
+import time
 import urllib.parse
+from collections import OrderedDict
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 from typing import List, Dict
 
 import click
@@ -10,7 +15,7 @@ import requests
 import requests_cache
 from dotenv import load_dotenv
 from prefixmaps.io.parser import load_converter
-from pymongo import uri_parser
+from pymongo import UpdateOne, uri_parser
 from tqdm import tqdm
 
 from external_metadata_awareness.mongodb_connection import get_mongo_client
@@ -50,6 +55,204 @@ dont_map_from = {
 }
 ignore = list(map_to | dont_map_from)
 
+BIOPORTAL_API_URL = "https://data.bioontology.org"
+
+# Responses worth retrying: rate limited or a transient server-side failure
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class ThrottledGetter:
+    """
+    requests.get with per-host rate limiting and retry with exponential backoff.
+
+    Requests to each host are spaced at least 1/requests_per_second apart
+    across all threads (0 disables the limit); responses the installed
+    requests_cache can serve without going to the network are not held
+    back. Connection errors, timeouts and
+    RETRY_STATUSES responses are retried up to max_retries times, waiting
+    backoff_seconds * 2**attempt, or the server's Retry-After if it sent one.
+    """
+
+    def __init__(self, requests_per_second=0, max_retries=3, backoff_seconds=1.0):
+        self.interval = 1.0 / requests_per_second if requests_per_second else 0.0
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.retries = 0
+        self._lock = threading.Lock()
+        self._next_slot = {}
+
+    def _wait_for_slot(self, url):
+        if not self.interval:
+            return
+        host = urllib.parse.urlsplit(url).netloc
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+    @staticmethod
+    def _is_cached(url, headers):
+        cache = requests_cache.get_cache()
+        if cache is None:
+            return False
+        response = cache.get_response(cache.create_key(requests.Request("GET", url, headers=headers).prepare()))
+        return response is not None and not response.is_expired
+
+    def _retry_delay(self, response, attempt):
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after and retry_after.isdigit():
+            return float(retry_after)
+        return self.backoff_seconds * 2 ** attempt
+
+    def get(self, url, headers):
+        for attempt in range(self.max_retries + 1):
+            if not self._is_cached(url, headers):
+                self._wait_for_slot(url)
+            response = None
+            try:
+                response = requests.get(url, headers=headers, timeout=10)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                if attempt == self.max_retries:
+                    raise
+            else:
+                if response.status_code not in RETRY_STATUSES or attempt == self.max_retries:
+                    return response
+            with self._lock:
+                self.retries += 1
+            time.sleep(self._retry_delay(response, attempt))
+
+
+class InFlightRequests:
+    """
+    Coalesces concurrent fetches of the same key into one.
+
+    The first thread to ask for a key runs the fetch; threads asking for it
+    while that fetch is running wait for and share its result. Nothing is kept
+    once the fetch completes.
+    """
+
+    def __init__(self):
+        self.coalesced = 0
+        self._lock = threading.Lock()
+        self._futures = {}
+
+    def run(self, key, fetch):
+        with self._lock:
+            future = self._futures.get(key)
+            owner = future is None
+            if owner:
+                future = self._futures[key] = Future()
+            else:
+                self.coalesced += 1
+        if not owner:
+            return future.result()
+        try:
+            result = fetch()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._futures[key]
+
+
+class MappedTermCache:
+    """
+    self_link -> {prefLabel, obsolete} for mapped BioPortal terms.
+
+    Popular mapping targets are looked up for thousands of source CURIEs. An
+    in-process LRU of maxsize entries answers most of them; behind it, an
+    optional SQLite table keeps just those two fields per self link, so later
+    runs skip both BioPortal and the requests-cache lookup and deserialization.
+    Entries older than max_age are fetched again, like the requests cache.
+    hits/misses count lookups; bytes_avoided sums the response sizes a hit
+    did not have to read.
+    """
+
+    def __init__(self, path=None, maxsize=100_000, max_age=datetime.timedelta(days=30)):
+        self.path = path
+        self.maxsize = maxsize
+        self.max_age_seconds = max_age.total_seconds()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.bytes_avoided = 0
+        self._lock = threading.Lock()
+        self._lru = OrderedDict()
+        self._conn = None
+        if path:
+            self._conn = sqlite3.connect(path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS mapped_terms (self_link TEXT PRIMARY KEY, pref_label TEXT, "
+                "obsolete INTEGER NOT NULL, response_bytes INTEGER NOT NULL, fetched_at REAL NOT NULL)")
+            self._conn.commit()
+
+    def _remember(self, self_link, entry):
+        self._lru[self_link] = entry
+        self._lru.move_to_end(self_link)
+        if len(self._lru) > self.maxsize:
+            self._lru.popitem(last=False)
+
+    def get(self, self_link):
+        """Return {prefLabel, obsolete} for self_link, or None if it has to be fetched."""
+        with self._lock:
+            entry = self._lru.get(self_link)
+            if entry is not None:
+                self._lru.move_to_end(self_link)
+                self.memory_hits += 1
+            elif self._conn is not None:
+                row = self._conn.execute(
+                    "SELECT pref_label, obsolete, response_bytes FROM mapped_terms "
+                    "WHERE self_link = ? AND fetched_at >= ?",
+                    (self_link, time.time() - self.max_age_seconds)).fetchone()
+                if row is not None:
+                    entry = ({"prefLabel": row[0], "obsolete": bool(row[1])}, row[2])
+                    self._remember(self_link, entry)
+                    self.disk_hits += 1
+            if entry is None:
+                self.misses += 1
+                return None
+            info, response_bytes = entry
+            self.bytes_avoided += response_bytes
+            return info
+
+    def peek(self, self_link):
+        """Return the in-memory entry for self_link without counting a lookup."""
+        with self._lock:
+            entry = self._lru.get(self_link)
+        return entry[0] if entry is not None else None
+
+    def put(self, self_link, info, response_bytes):
+        with self._lock:
+            self._remember(self_link, (info, response_bytes))
+            if self._conn is not None:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO mapped_terms VALUES (?, ?, ?, ?, ?)",
+                    (self_link, info["prefLabel"], int(bool(info["obsolete"])), response_bytes, time.time()))
+
+    def close(self):
+        if self._conn is not None:
+            with self._lock:
+                self._conn.commit()
+                self._conn.close()
+                self._conn = None
+
+    def stats_line(self):
+        hits = self.memory_hits + self.disk_hits
+        return (f"Mapped-term cache: {hits} hits ({self.memory_hits} memory, {self.disk_hits} disk), "
+                f"{self.misses} misses, {self.bytes_avoided / 1024:.1f} KiB of responses not re-read")
+
+
+# Shared by every thread; main() replaces http_getter and mapped_term_cache with configured ones
+http_getter = ThrottledGetter()
+mapped_term_requests = InFlightRequests()
+mapped_term_cache = MappedTermCache()
+
 
 def deduplicate_dicts(lst: List[Dict]) -> List[Dict]:
     seen = set()
@@ -80,17 +283,17 @@ def safe_expand(curie):
         return None
 
 
-def get_bioportal_info(term_uri, prefix, api_key):
+def get_bioportal_info(term_uri, prefix, api_key, api_url=BIOPORTAL_API_URL):
     """
     Get term information from BioPortal given a term URI and ontology prefix.
     Returns a dict that includes the mappings_link and the full response data.
     """
     ontology = prefix.upper()
     encoded_uri = urllib.parse.quote(term_uri, safe="")
-    url = f"https://data.bioontology.org/ontologies/{ontology}/classes/{encoded_uri}"
+    url = f"{api_url}/ontologies/{ontology}/classes/{encoded_uri}"
     headers = {"Authorization": f"apikey token={api_key}"}
     try:
-        response = requests.get(url, headers=headers, timeout=10)
+        response = http_getter.get(url, headers)
         response.raise_for_status()
         data = response.json()
         mappings_link = data.get("links", {}).get("mappings")
@@ -115,21 +318,34 @@ def get_bioportal_info(term_uri, prefix, api_key):
 
 def get_mapped_term_info(self_link, api_key):
     """
-    Given a mapped term's self link, fetch its details from BioPortal.
-    Returns the JSON data.
+    Given a mapped term's self link, return its prefLabel and obsolete flag.
+    Answered from mapped_term_cache when possible; concurrent lookups of the
+    same uncached target share one request. Returns {} if the lookup failed.
     """
+    info = mapped_term_cache.get(self_link)
+    if info is not None:
+        return info
+    # Re-check inside run(): another thread may have cached it since the miss
+    return mapped_term_requests.run(
+        self_link, lambda: mapped_term_cache.peek(self_link) or _fetch_mapped_term_info(self_link, api_key))
+
+
+def _fetch_mapped_term_info(self_link, api_key):
     url = self_link
     headers = {"Authorization": f"apikey token={api_key}"}
     try:
-        response = requests.get(url, headers=headers, timeout=10)
+        response = http_getter.get(url, headers)
         response.raise_for_status()
-        return response.json()
+        data = response.json()
     except requests.exceptions.RequestException as e:
         logger.warning("Mapped term request failed for self_link=%s: %s", self_link, e)
         return {}
     except ValueError as e:
         logger.warning("Mapped term JSON decode failed for self_link=%s: %s", self_link, e)
         return {}
+    info = {"prefLabel": data.get("prefLabel"), "obsolete": data.get("obsolete", False)}
+    mapped_term_cache.put(self_link, info, len(response.content))
+    return info
 
 
 def fetch_mappings(mappings_url, api_key, source_class_id, verbose=False):
@@ -140,7 +356,7 @@ def fetch_mappings(mappings_url, api_key, source_class_id, verbose=False):
         headers = {"Authorization": f"apikey token={api_key}"}
         if verbose:
             logger.debug("Following BioPortal mappings link")
-        response = requests.get(mappings_url, headers=headers, timeout=10)
+        response = http_getter.get(mappings_url, headers)
         response.raise_for_status()
         mappings_obj = response.json()
         loom_count = 0
@@ -205,6 +421,16 @@ def process_document(doc, collection, api_key, verbose=False):
     Process a document: expand its CURIE, fetch BioPortal info, and update the document with fetched data and mappings.
     Verbose mode emits generic progress messages without logging CURIEs, labels, or URLs.
     """
+    update_fields = build_update(doc, api_key, verbose)
+    if update_fields is not None:
+        collection.update_one({"_id": doc["_id"]}, {"$set": update_fields})
+
+
+def build_update(doc, api_key, verbose=False, api_url=BIOPORTAL_API_URL):
+    """
+    Fetch BioPortal info and mappings for a document's CURIE.
+    Returns the fields to $set on the document, or None if there is nothing to update.
+    """
     curie = doc.get("curie_uc")
 
     term_uri = safe_expand(curie)
@@ -214,16 +440,16 @@ def process_document(doc, collection, api_key, verbose=False):
     else:
         if verbose:
             logger.debug("CURIE expansion failed")
-        return
+        return None
 
     reverse_engineered = converter.compress(term_uri)
     reverse_engineered_prefix = reverse_engineered.split(":")[0]
 
-    bioportal_info = get_bioportal_info(term_uri, reverse_engineered_prefix, api_key)
+    bioportal_info = get_bioportal_info(term_uri, reverse_engineered_prefix, api_key, api_url)
     if not bioportal_info:
         if verbose:
             logger.debug("Failed to fetch BioPortal info")
-        return
+        return None
 
     data = bioportal_info["data"]
     pref_label = data.get("prefLabel")
@@ -241,7 +467,52 @@ def process_document(doc, collection, api_key, verbose=False):
         if accepted_mappings:
             update_fields["mappings"] = accepted_mappings
 
-    collection.update_one({"_id": doc["_id"]}, {"$set": update_fields})
+    return update_fields
+
+
+def map_documents(docs, collection, api_key, concurrency=8, batch_size=500, verbose=False,
+                  api_url=BIOPORTAL_API_URL, progress=None):
+    """
+    Map documents concurrently and write their updates with unordered bulk_write.
+
+    Up to concurrency documents are fetched at once by a thread pool, with at
+    most concurrency * 4 submitted ahead, so a large cursor is never buffered.
+    Updates are sent batch_size at a time. Returns the number of documents updated.
+    """
+    ops = []
+    updated = 0
+
+    def collect(done):
+        nonlocal updated
+        for future in done:
+            doc, update_fields = future.result()
+            if update_fields is not None:
+                ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": update_fields}))
+            if len(ops) >= batch_size:
+                collection.bulk_write(ops, ordered=False)
+                updated += len(ops)
+                ops.clear()
+            if progress is not None:
+                progress.update(1)
+
+    def fetch(doc):
+        return doc, build_update(doc, api_key, verbose, api_url)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        pending = set()
+        for doc in docs:
+            pending.add(pool.submit(fetch, doc))
+            if len(pending) >= concurrency * 4:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            collect(done)
+
+    if ops:
+        collection.bulk_write(ops, ordered=False)
+        updated += len(ops)
+    return updated
 
 
 @click.command()
@@ -249,7 +520,19 @@ def process_document(doc, collection, api_key, verbose=False):
 @click.option('--env-file', default='local/.env', help='Path to .env file for credentials (should contain MONGO_USER, MONGO_PASSWORD, and BIOPORTAL_API_KEY)')
 @click.option('--collection', default='env_triad_component_curies_uc', help='MongoDB collection name')
 @click.option('--verbose', is_flag=True, help='Show verbose connection and processing output')
-def main(mongo_uri, env_file, collection, verbose):
+@click.option('--concurrency', default=8, show_default=True, type=click.IntRange(min=1),
+              help='Documents fetched from BioPortal at once')
+@click.option('--requests-per-second', default=10.0, show_default=True, type=click.FloatRange(min=0),
+              help='Request rate limit per host across all threads (0 = unlimited)')
+@click.option('--max-retries', default=3, show_default=True, type=click.IntRange(min=0),
+              help='Retries, with exponential backoff, for connection errors, timeouts, 429 and 5xx responses')
+@click.option('--batch-size', default=500, show_default=True, type=click.IntRange(min=1),
+              help='Document updates per unordered bulk_write')
+@click.option('--mapped-term-cache', 'mapped_term_cache_path', default='bioportal-mapped-terms.sqlite', show_default=True,
+              help='SQLite table of mapped-term prefLabel/obsolete, reused across runs (empty string = in-memory only)')
+def main(mongo_uri, env_file, collection, verbose, concurrency, requests_per_second, max_retries, batch_size,
+         mapped_term_cache_path):
+    global http_getter, mapped_term_cache
     # Nothing else configures logging, so every logger.debug guarded by
     # `if verbose` was being dropped: the root logger defaults to WARNING.
     # force=True because basicConfig is a no-op once handlers exist, which
@@ -306,11 +589,20 @@ def main(mongo_uri, env_file, collection, verbose):
 
     print(f"Found {doc_count} documents to process")
 
-    # Process each document. Each call may make multiple BioPortal API requests,
-    # so wrap the iteration in tqdm for a visible progress bar.
-    for doc in tqdm(docs_cursor, total=doc_count, desc="BioPortal mapping", unit="doc"):
-        process_document(doc, mongo_collection, bioportal_api_key, verbose)
-
+    # Each document may need several BioPortal API requests; they are almost all
+    # network wait, so documents are fetched concurrently under a shared rate limit.
+    http_getter = ThrottledGetter(requests_per_second, max_retries)
+    mapped_term_cache = MappedTermCache(mapped_term_cache_path or None)
+    try:
+        with tqdm(total=doc_count, desc="BioPortal mapping", unit="doc") as progress:
+            updated = map_documents(docs_cursor, mongo_collection, bioportal_api_key, concurrency, batch_size,
+                                    verbose, progress=progress)
+    finally:
+        mapped_term_cache.close()
+
+    print(f"Updated {updated} documents ({http_getter.retries} retried requests, "
+          f"{mapped_term_requests.coalesced} mapped-term lookups shared with another thread)")
+    print(mapped_term_cache.stats_line())
     print("Processing complete.")
 
 
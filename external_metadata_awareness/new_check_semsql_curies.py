@@ -7,34 +7,91 @@ For each document whose "prefix" field (case-insensitive) is one of ENVO, UBERON
     and check if the term is obsolete.
   - Updates the document by adding the "label" and "obsolete" fields.
 
+By default the collection is read in one aggregation that keeps only the
+in-scope prefixes, each ontology's CURIEs are resolved in a worker process
+with batched queries against the statements table of its semsql file, and
+the labels are written back with unordered bulk updates. --per-document runs
+the original one-regex-query-per-ontology loop through the OAK adapters.
+
 Before running, ensure that:
   • Your MongoDB connection details (database name, collection, etc.) are correct.
   • The OAK adapter strings match your semantic SQL configurations.
 """
 
+import sqlite3
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
 import click
-from pymongo import uri_parser
+from pymongo import UpdateOne, uri_parser
 from oaklib import get_adapter
 from tqdm import tqdm
 
 from external_metadata_awareness.mongodb_connection import get_mongo_client
 
+# Define the ontologies and their corresponding OAK adapter strings.
+SEMSQL_ONTOLOGIES = {
+    "agro": "sqlite:obo:agro",
+    "bco": "sqlite:obo:bco",
+    "bto": "sqlite:obo:bto",
+    "chebi": "sqlite:obo:chebi",
+    "doid": "sqlite:obo:doid",
+    "ecto": "sqlite:obo:ecto",
+    "efo": "sqlite:obo:efo",
+    "envo": "sqlite:obo:envo",
+    "eupath": "sqlite:obo:eupath",
+    "fma": "sqlite:obo:fma",
+    "foodon": "sqlite:obo:foodon",
+    "go": "sqlite:obo:go",
+    "ma": "sqlite:obo:ma",
+    "mco": "sqlite:obo:mco",
+    "mondo": "sqlite:obo:mondo",
+    "mp": "sqlite:obo:mp",
+    "ncbitaxon": "sqlite:obo:ncbitaxon",
+    "ncit": "sqlite:obo:ncit",
+    "obi": "sqlite:obo:obi",
+    "ohmi": "sqlite:obo:ohmi",
+    "omit": "sqlite:obo:omit",
+    "pato": "sqlite:obo:pato",
+    "pco": "sqlite:obo:pco",
+    "po": "sqlite:obo:po",
+    "uberon": "sqlite:obo:uberon",
+    "vto": "sqlite:obo:vto",
+    "xao": "sqlite:obo:xao",
+    "zfa": "sqlite:obo:zfa",
+}
+
+LABEL_PREDICATE = "rdfs:label"
+DEPRECATED_PREDICATE = "owl:deprecated"
+
+
+def semsql_db_path(adapter_string):
+    """Local path of the semsql SQLite file behind an OAK adapter string, downloading it if needed."""
+    return get_adapter(adapter_string).engine.url.database
+
+
+def canonical_curie(curie_uc, ontology_name):
+    """Upper-case the CURIE's prefix when it is the ontology's own prefix in any case."""
+    prefix, sep, local_id = curie_uc.partition(":")
+    if sep and prefix.lower() == ontology_name.lower():
+        return f"{ontology_name.upper()}:{local_id}"
+    return curie_uc
+
 
-def attempt_oak_labelling(curie, adapter):
+def attempt_oak_labelling(curie, adapter, obsoletes=None):
     """
     Attempts to get the label for a given CURIE using the provided OAK adapter.
-    Also checks if the term is obsolete.
+    Also checks if the term is obsolete (owl:deprecated), against obsoletes,
+    the set of the adapter's obsolete CURIEs, when given.
 
     Returns a dict with the CURIE, label, and obsolete status if found;
     otherwise returns None.
     """
     label = adapter.label(curie)
     if label:
-        try:
-            obsolete = adapter.is_obsolete(curie)
-        except Exception:
-            obsolete = False
-        return {"curie": curie, "label": label, "obsolete": obsolete}
+        if obsoletes is None:
+            obsoletes = set(adapter.obsoletes())
+        return {"curie": curie, "label": label, "obsolete": curie in obsoletes}
     return None
 
 
@@ -49,21 +106,15 @@ def process_documents(collection, query, adapter, ontology_name):
     total = collection.count_documents(query)
     print(f"Found {total} documents with prefix '{ontology_name.lower()}'.")
     cursor = collection.find(query)
+    obsoletes = set(adapter.obsoletes())
 
     for doc in tqdm(cursor, total=total, desc=f"Processing {ontology_name} documents"):
         curie_uc = doc.get("curie_uc")
         if not curie_uc:
             continue
 
-        # Normalize the CURIE: if it starts with the lower-case prefix, convert it to upper-case.
-        prefix, sep, local_id = curie_uc.partition(":")
-        if sep and prefix.lower() == ontology_name.lower():
-            canonical_curie = f"{ontology_name.upper()}:{local_id}"
-        else:
-            canonical_curie = curie_uc
-
         # Retrieve label and obsolete status using the OAK adapter.
-        result = attempt_oak_labelling(canonical_curie, adapter)
+        result = attempt_oak_labelling(canonical_curie(curie_uc, ontology_name), adapter, obsoletes)
         if result:
             update_fields = {"label": result["label"], "obsolete": result["obsolete"]}
         else:
@@ -72,12 +123,111 @@ def process_documents(collection, query, adapter, ontology_name):
         collection.update_one({"_id": doc["_id"]}, {"$set": update_fields})
 
 
+def group_curies_by_ontology(collection, ontologies):
+    """
+    Read {ontology: {curie_uc: [_id, ...]}} for the in-scope prefixes in one aggregation.
+
+    prefix_uc is matched case-insensitively, like the per-ontology regex
+    queries, and documents without a curie_uc are left out.
+    """
+    pipeline = [
+        {"$match": {"curie_uc": {"$nin": [None, ""]}}},
+        {"$project": {"curie_uc": 1, "ontology": {"$toLower": "$prefix_uc"}}},
+        {"$match": {"ontology": {"$in": sorted(ontologies)}}},
+    ]
+    grouped = defaultdict(lambda: defaultdict(list))
+    for doc in collection.aggregate(pipeline, allowDiskUse=True):
+        grouped[doc["ontology"]][doc["curie_uc"]].append(doc["_id"])
+    return grouped
+
+
+def resolve_semsql_curies(ontology_name, db_path, curies, batch_size=500):
+    """
+    Look up labels and obsolete flags for curies in one ontology's semsql file.
+
+    Returns {curie_uc: {"label": ..., "obsolete": ...}} with the values
+    attempt_oak_labelling gives: the term's label and whether it is
+    owl:deprecated, or None for both when the CURIE has no label.
+    """
+    canonical = {curie: canonical_curie(curie, ontology_name) for curie in curies}
+    subjects = sorted(set(canonical.values()))
+    labels = {}
+    deprecated = set()
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        for start in range(0, len(subjects), batch_size):
+            batch = subjects[start:start + batch_size]
+            placeholders = ",".join("?" * len(batch))
+            labels.update(conn.execute(
+                f"SELECT subject, MIN(value) FROM statements WHERE predicate = ? AND subject IN ({placeholders}) "
+                f"AND value IS NOT NULL GROUP BY subject",
+                [LABEL_PREDICATE] + batch))
+            deprecated.update(subject for subject, in conn.execute(
+                f"SELECT DISTINCT subject FROM statements WHERE predicate = ? AND subject IN ({placeholders}) "
+                f"AND value = 'true'",
+                [DEPRECATED_PREDICATE] + batch))
+    finally:
+        conn.close()
+
+    resolved = {}
+    for curie, subject in canonical.items():
+        label = labels.get(subject)
+        resolved[curie] = {"label": label, "obsolete": subject in deprecated if label else None}
+    return resolved
+
+
+def write_resolutions(collection, ids_by_curie, resolved, batch_size=1000):
+    """Set label and obsolete on every document of every resolved CURIE with unordered bulk writes."""
+    ops = []
+    written = 0
+    for curie, ids in ids_by_curie.items():
+        for _id in ids:
+            ops.append(UpdateOne({"_id": _id}, {"$set": resolved[curie]}))
+            if len(ops) >= batch_size:
+                collection.bulk_write(ops, ordered=False)
+                written += len(ops)
+                ops = []
+    if ops:
+        collection.bulk_write(ops, ordered=False)
+        written += len(ops)
+    return written
+
+
+def process_collection(collection, ontologies=SEMSQL_ONTOLOGIES, workers=4, batch_size=1000, db_paths=None):
+    """
+    Label every in-scope document in one pass over the collection.
+
+    ontologies maps ontology names to OAK adapter strings; db_paths, when
+    given, maps them straight to semsql files instead. Each ontology with
+    documents is resolved in its own worker process. Returns the number of
+    documents updated.
+    """
+    grouped = group_curies_by_ontology(collection, ontologies)
+    print(f"Found {sum(len(ids) for curies in grouped.values() for ids in curies.values())} documents "
+          f"with {sum(len(curies) for curies in grouped.values())} CURIEs in {len(grouped)} ontologies.")
+    db_paths = db_paths or {ontology: semsql_db_path(ontologies[ontology]) for ontology in sorted(grouped)}
+
+    updated = 0
+    with ProcessPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {pool.submit(resolve_semsql_curies, ontology, db_paths[ontology], list(curies)): ontology
+                   for ontology, curies in grouped.items()}
+        for future in tqdm(as_completed(futures), total=len(futures), desc="Resolving ontologies"):
+            ontology = futures[future]
+            updated += write_resolutions(collection, grouped[ontology], future.result(), batch_size)
+    return updated
+
+
 @click.command()
 @click.option('--mongo-uri', default='mongodb://localhost:27017/ncbi_metadata', help='MongoDB connection URI (must start with mongodb:// and include database name)')
 @click.option('--env-file', default=None, help='Path to .env file for credentials (should contain MONGO_USER and MONGO_PASSWORD)')
 @click.option('--collection', default='env_triad_component_curies_uc', help='MongoDB collection name')
+@click.option('--workers', default=4, show_default=True, type=int,
+              help='Worker processes resolving ontologies in parallel')
+@click.option('--batch-size', default=1000, show_default=True, type=int, help='Updates per bulk write')
+@click.option('--per-document', is_flag=True,
+              help='Query and update one document at a time through the OAK adapters, ontology by ontology')
 @click.option('--verbose', is_flag=True, help='Show verbose connection output')
-def main(mongo_uri, env_file, collection, verbose):
+def main(mongo_uri, env_file, collection, workers, batch_size, per_document, verbose):
     # Connect to MongoDB
     client = get_mongo_client(
         mongo_uri=mongo_uri,
@@ -94,42 +244,14 @@ def main(mongo_uri, env_file, collection, verbose):
         
     collection = client[db_name][collection]
 
-    # Define the ontologies and their corresponding OAK adapter strings.
-    ontologies = {
-        "agro": "sqlite:obo:agro",
-        "bco": "sqlite:obo:bco",
-        "bto": "sqlite:obo:bto",
-        "chebi": "sqlite:obo:chebi",
-        "doid": "sqlite:obo:doid",
-        "ecto": "sqlite:obo:ecto",
-        "efo": "sqlite:obo:efo",
-        "envo": "sqlite:obo:envo",
-        "eupath": "sqlite:obo:eupath",
-        "fma": "sqlite:obo:fma",
-        "foodon": "sqlite:obo:foodon",
-        "go": "sqlite:obo:go",
-        "ma": "sqlite:obo:ma",
-        "mco": "sqlite:obo:mco",
-        "mondo": "sqlite:obo:mondo",
-        "mp": "sqlite:obo:mp",
-        "ncbitaxon": "sqlite:obo:ncbitaxon",
-        "ncit": "sqlite:obo:ncit",
-        "obi": "sqlite:obo:obi",
-        "ohmi": "sqlite:obo:ohmi",
-        "omit": "sqlite:obo:omit",
-        "pato": "sqlite:obo:pato",
-        "pco": "sqlite:obo:pco",
-        "po": "sqlite:obo:po",
-        "uberon": "sqlite:obo:uberon",
-        "vto": "sqlite:obo:vto",
-        "xao": "sqlite:obo:xao",
-        "zfa": "sqlite:obo:zfa",
-    }
-
-    for ontology, adapter_string in ontologies.items():
-        adapter = get_adapter(adapter_string)
-        query = {"prefix_uc": {"$regex": f"^{ontology}$", "$options": "i"}}
-        process_documents(collection, query, adapter, ontology)
+    if per_document:
+        for ontology, adapter_string in SEMSQL_ONTOLOGIES.items():
+            adapter = get_adapter(adapter_string)
+            query = {"prefix_uc": {"$regex": f"^{ontology}$", "$options": "i"}}
+            process_documents(collection, query, adapter, ontology)
+    else:
+        updated = process_collection(collection, workers=workers, batch_size=batch_size)
+        print(f"Updated {updated} documents.")
 
     print("Processing complete.")
 
@@ -1,12 +1,17 @@
 """
 Standalone script to annotate documents in the env_triad_component_labels collection.
 
-This script first loads a lexical index for text annotation from
-"expanded_envo_po_lexical_index.yaml" if that file exists; otherwise, it builds
-the index from the ENVO connection string and saves it for future use.
-It then uses the lexical index via a TextAnnotatorInterface to annotate the
-"label" field in each document, filtering out short or subsumed annotations,
-computing the combined coverage, and updating the document with:
+This script first loads the expanded ENVO/PO lexical index from its binary
+cache (see lexical_index_cache), which is rebuilt from
+"expanded_envo_po_lexical_index.yaml" when the ENVO/PO semsql files or the YAML
+change. A YAML missing or older than the semsql files is rebuilt first, as
+new_expand_envo_po_lexical_index does, and saved for future use.
+
+The index keys are compiled once into a LexicalAutomaton, which finds every
+key in a label in a single pass with the same matching rules as oaklib's
+TextAnnotatorInterface. Labels are annotated by a process pool, filtering out
+short, partial-word or subsumed annotations, computing the combined coverage,
+and updating the documents with unordered bulk writes of:
   - "oak_text_annotations"
   - "combined_oak_coverage"
   - "oak_annotations_count"
@@ -18,52 +23,66 @@ Notes:
 
 import os
 import re
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
 import click
 
-from oaklib import get_adapter
-from oaklib.datamodels.text_annotator import TextAnnotationConfiguration
-from oaklib.interfaces.text_annotator_interface import TextAnnotatorInterface
-from oaklib.utilities.lexical.lexical_indexer import load_lexical_index, create_lexical_index, save_lexical_index
-from pymongo import uri_parser
+from oaklib.utilities.lexical.lexical_indexer import load_lexical_index, save_lexical_index
+from pymongo import UpdateOne, uri_parser
 from tqdm import tqdm
 
+from external_metadata_awareness.lexical_automaton import LexicalAutomaton
+from external_metadata_awareness.lexical_index_cache import (
+    DEFAULT_INDEX_CACHE,
+    read_index_cache,
+    read_index_header,
+    write_index_cache,
+)
 from external_metadata_awareness.mongodb_connection import get_mongo_client
+from external_metadata_awareness.new_check_semsql_curies import semsql_db_path
+from external_metadata_awareness.new_expand_envo_po_lexical_index import (
+    ENVO_ADAPTER_STRING,
+    PO_ADAPTER_STRING,
+    build_expanded_lexical_index,
+)
 from external_metadata_awareness.oak_helpers import build_element_to_label_map
 
-config = TextAnnotationConfiguration()
-config.match_whole_words_only = True
-
 # Set the minimum annotation length for retaining an annotation.
 MIN_ANNOTATION_LENGTH = 3
 LEX_INDEX_FILE = "expanded_envo_po_lexical_index.yaml"
 
 
-def is_true_whole_word_match(label: str, match_string: str) -> bool:
+def label_words(label: str) -> set:
     """
-    Check if match_string occurs as a full word in the label.
+    The lowercased words of a label, for whole-word checks of single-word matches.
     """
-    words = re.findall(r"\b\w+\b", label.lower())
-    return match_string.lower() in words
+    return set(re.findall(r"\b\w+\b", label.lower()))
 
 
-def annotation_to_dict(ann, label_length):
+def match_to_dict(match, label_length, element_to_label):
     """
-    Convert an annotation object to a dictionary, filtering out keys with None or empty list values.
+    Convert a KeyMatch to the stored annotation dict, leaving out a missing object_label.
     Also calculates and adds the annotation's coverage of the label using 1-based inclusive indexing:
          coverage = (subject_end - subject_start + 1) / label_length.
     """
-    result = {}
-    for key, value in vars(ann).items():
-        # Skip if value is None.
-        if value is None:
-            continue
-        # Skip if value is an empty list.
-        if isinstance(value, list) and len(value) == 0:
-            continue
-        result[key] = value
-    if hasattr(ann, "subject_start") and hasattr(ann, "subject_end"):
-        ann_length = ann.subject_end - ann.subject_start + 1
-        result["coverage"] = ann_length / label_length if label_length > 0 else 0
+    result = {
+        "predicate_id": match.predicate_id,
+        "object_id": match.object_id,
+        "object_label": match.object_label,
+        "match_string": match.match_string,
+        "matches_whole_text": match.matches_whole_text,
+        "subject_start": match.subject_start,
+        "subject_end": match.subject_end,
+    }
+    if result["object_label"] is None:
+        del result["object_label"]
+    ann_length = match.subject_end - match.subject_start + 1
+    result["coverage"] = ann_length / label_length if label_length > 0 else 0
+    result["rdfs_label"] = element_to_label.get(match.object_id)
+    result["prefix_uc"] = match.object_id.split(":")[0].upper()
     return result
 
 
@@ -75,28 +94,23 @@ def filter_subsumed_annotations(annotations):
     such that B.subject_start <= A.subject_start and B.subject_end >= A.subject_end,
     and the ranges are not exactly equal.
 
-    Annotations without range information are retained.
+    Annotations without range information are retained, and the order is kept.
+    The distinct ranges are sorted by start, then by descending end, so a range is
+    subsumed exactly when some earlier range in that order reaches at least as far.
     """
-    filtered = []
-    for i, a in enumerate(annotations):
-        if "subject_start" not in a or "subject_end" not in a:
-            filtered.append(a)
-            continue
-
-        subsumed = False
-        a_start, a_end = a["subject_start"], a["subject_end"]
-        for j, b in enumerate(annotations):
-            if i == j:
-                continue
-            if "subject_start" in b and "subject_end" in b:
-                b_start, b_end = b["subject_start"], b["subject_end"]
-                if b_start <= a_start and b_end >= a_end:
-                    if (b_start, b_end) != (a_start, a_end):
-                        subsumed = True
-                        break
-        if not subsumed:
-            filtered.append(a)
-    return filtered
+    spans = sorted({(a["subject_start"], a["subject_end"]) for a in annotations
+                    if "subject_start" in a and "subject_end" in a},
+                   key=lambda span: (span[0], -span[1]))
+    subsumed = set()
+    furthest_end = None
+    for span in spans:
+        if furthest_end is not None and furthest_end >= span[1]:
+            subsumed.add(span)
+        else:
+            furthest_end = span[1]
+    return [a for a in annotations
+            if "subject_start" not in a or "subject_end" not in a
+            or (a["subject_start"], a["subject_end"]) not in subsumed]
 
 
 def compute_combined_oak_coverage(annotations, label_length):
@@ -129,11 +143,153 @@ def compute_combined_oak_coverage(annotations, label_length):
     return total_covered / label_length
 
 
+def load_annotation_index(cache_file=DEFAULT_INDEX_CACHE, index_file=LEX_INDEX_FILE, adapter_strings=None):
+    """
+    Return (automaton, element_to_label) for the expanded ENVO/PO lexical index.
+
+    adapter_strings are the ENVO and PO adapters followed by any extra
+    ontologies merged into the index. By default they are the ones recorded
+    in the cache, as new_expand_envo_po_lexical_index --extra-adapter wrote
+    them, or just ENVO and PO.
+
+    The binary cache is used while it matches those ontologies' semsql files
+    and the YAML index it was built from. Otherwise the YAML index is loaded,
+    or rebuilt from the same ontologies with new_expand_envo_po_lexical_index
+    when it is missing or older than the semsql files, and the cache is
+    written again.
+    """
+    if adapter_strings is None:
+        header = read_index_header(cache_file) if cache_file else None
+        adapter_strings = (header or {}).get("adapters") or [ENVO_ADAPTER_STRING, PO_ADAPTER_STRING]
+    adapter_strings = list(adapter_strings)
+    semsql_paths = [semsql_db_path(adapter_string) for adapter_string in adapter_strings]
+    source_paths = semsql_paths + [index_file]
+    if cache_file:
+        cached = read_index_cache(cache_file, source_paths)
+        if cached is not None:
+            print(f"Loaded lexical index from {cache_file}")
+            return cached
+        print(f"Lexical index cache {cache_file} missing or out of date.")
+
+    newest_source = max((os.path.getmtime(path) for path in semsql_paths if os.path.exists(path)), default=0)
+    if os.path.exists(index_file) and os.path.getmtime(index_file) >= newest_source:
+        print(f"Loading lexical index from {index_file}...")
+        lexical_index = load_lexical_index(index_file)
+    else:
+        print(f"Lexical index file {index_file} missing or older than the semsql files of "
+              f"{', '.join(adapter_strings)}; rebuilding...")
+        lexical_index = build_expanded_lexical_index(adapter_strings[0], adapter_strings[1], adapter_strings[2:])
+        save_lexical_index(lexical_index, index_file)
+        print(f"Lexical index saved to {index_file}")
+
+    automaton = LexicalAutomaton.from_lexical_index(lexical_index)
+    element_to_label = build_element_to_label_map(lexical_index)
+    if cache_file:
+        write_index_cache(cache_file, automaton, element_to_label, source_paths, adapter_strings)
+        print(f"Lexical index cache saved to {cache_file}")
+    return automaton, element_to_label
+
+
+def annotate_label(label, automaton, element_to_label):
+    """
+    Annotate one label and return the fields stored on its document.
+
+    Annotations shorter than MIN_ANNOTATION_LENGTH and single-word matches
+    that are not a whole word of the label (like "gas" in "gastric") are
+    dropped, then annotations subsumed by a longer one are filtered out.
+    """
+    label_length = len(label)
+    words = None
+    processed_annotations = []
+    for match in automaton.annotate(label):
+        if match.subject_end - match.subject_start + 1 < MIN_ANNOTATION_LENGTH:
+            continue  # Skip too-short annotations.
+
+        # If it's a single-word match_string, make sure it's a whole word in the label
+        if match.match_string and " " not in match.match_string:
+            if words is None:
+                words = label_words(label)
+            if match.match_string.lower() not in words:
+                continue  # Skip partial word matches like "gas" in "gastric"
+
+        processed_annotations.append(match_to_dict(match, label_length, element_to_label))
+
+    filtered_annotations = filter_subsumed_annotations(processed_annotations)
+    return {
+        "oak_text_annotations": filtered_annotations,
+        "combined_oak_coverage": compute_combined_oak_coverage(filtered_annotations, label_length),
+        "oak_annotations_count": len(filtered_annotations),
+    }
+
+
+def _init_annotate_worker(automaton, element_to_label):
+    global _worker_automaton, _worker_element_to_label
+    _worker_automaton = automaton
+    _worker_element_to_label = element_to_label
+
+
+def annotate_chunk(pairs):
+    """Annotate a chunk of (_id, label) pairs in a worker; returns (_id, fields) pairs."""
+    return [(_id, annotate_label(label, _worker_automaton, _worker_element_to_label)) for _id, label in pairs]
+
+
+def annotate_in_pool(pairs, automaton, element_to_label, workers, chunk_size):
+    """
+    Yield (_id, fields) for an iterable of (_id, label) pairs, in input order.
+
+    Workers receive the compiled automaton once, at start-up, and only
+    workers * 2 chunks are in flight. With one worker everything runs inline.
+    """
+    pairs = iter(pairs)
+    if workers <= 1:
+        for _id, label in pairs:
+            yield _id, annotate_label(label, automaton, element_to_label)
+        return
+
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_annotate_worker,
+                             initargs=(automaton, element_to_label)) as pool:
+        def submit():
+            while len(pending) < workers * 2:
+                chunk = list(islice(pairs, chunk_size))
+                if not chunk:
+                    return
+                pending.append(pool.submit(annotate_chunk, chunk))
+
+        submit()
+        while pending:
+            results = pending.popleft().result()
+            submit()
+            yield from results
+
+
+def write_annotations(collection, results, batch_size=1000, progress=None):
+    """Set the annotation fields from (_id, fields) pairs with unordered bulk writes; returns the count."""
+    ops = []
+    documents = 0
+    for _id, update_data in results:
+        ops.append(UpdateOne({"_id": _id}, {"$set": update_data}))
+        documents += 1
+        if len(ops) >= batch_size:
+            collection.bulk_write(ops, ordered=False)
+            ops = []
+        if progress is not None:
+            progress.update(1)
+    if ops:
+        collection.bulk_write(ops, ordered=False)
+    return documents
+
+
 @click.command()
 @click.option('--mongo-uri', default='mongodb://localhost:27017/ncbi_metadata', help='MongoDB connection URI (must start with mongodb:// and include database name)')
 @click.option('--env-file', default=None, help='Path to .env file for credentials (should contain MONGO_USER and MONGO_PASSWORD)')
+@click.option('--workers', default=4, show_default=True, type=int, help='Worker processes annotating labels (1 annotates inline)')
+@click.option('--chunk-size', default=2000, show_default=True, type=int, help='Labels per worker task')
+@click.option('--batch-size', default=1000, show_default=True, type=int, help='Updates per bulk write')
+@click.option('--index-cache', default=DEFAULT_INDEX_CACHE, show_default=True,
+              help="Binary lexical index cache, rebuilt when the ENVO/PO semsql files change ('' to disable)")
 @click.option('--verbose', is_flag=True, help='Show verbose connection output')
-def main(mongo_uri, env_file, verbose):
+def main(mongo_uri, env_file, workers, chunk_size, batch_size, index_cache, verbose):
     # MongoDB connection configuration.
     client = get_mongo_client(
         mongo_uri=mongo_uri,
@@ -151,73 +307,26 @@ def main(mongo_uri, env_file, verbose):
     db = client[db_name]
     collection = db.env_triad_component_labels
 
-    # Attempt to load the lexical index from file if it exists.
-    if os.path.exists(LEX_INDEX_FILE):
-        print(f"Loading lexical index from {LEX_INDEX_FILE}...")
-        lexical_index = load_lexical_index(LEX_INDEX_FILE)
-    else:
-        print(f"Lexical index file {LEX_INDEX_FILE} not found; building from ENVO adapter...")
-        envo_adapter = get_adapter("sqlite:obo:envo")
-        lexical_index = create_lexical_index(envo_adapter)
-        # Optionally save the newly built index for future runs.
-        save_lexical_index(lexical_index, LEX_INDEX_FILE)
-        print(f"Lexical index saved to {LEX_INDEX_FILE}")
-
-    # Set up the TextAnnotatorInterface with the lexical index.
-    annotator = TextAnnotatorInterface()
-    annotator.lexical_index = lexical_index
-
-    element_to_label = build_element_to_label_map(lexical_index)
+    automaton, element_to_label = load_annotation_index(index_cache, LEX_INDEX_FILE)
+    print(f"Lexical index ready: {len(automaton)} keys.")
 
-    total_docs = collection.estimated_document_count()
-    print(f"Processing {total_docs} documents from env_triad_component_labels collection.")
-
-    min_length = 3
     query = {
         "label_digits_only": False,
-        "label_length": {"$gte": min_length}
+        "label_length": {"$gte": MIN_ANNOTATION_LENGTH}
     }
+    total_docs = collection.count_documents(query)
+    print(f"Processing {total_docs} documents from env_triad_component_labels collection.")
+
+    pairs = ((doc["_id"], doc["label"]) for doc in collection.find(query, {"label": 1}) if doc.get("label"))
+    started = time.monotonic()
+    with tqdm(total=total_docs, desc="Annotating documents") as progress:
+        documents = write_annotations(
+            collection, annotate_in_pool(pairs, automaton, element_to_label, workers, chunk_size),
+            batch_size, progress)
+    elapsed = time.monotonic() - started
 
-    for doc in tqdm(collection.find(query), total=total_docs, desc="Annotating documents"):
-        label = doc.get("label")
-        if not label:
-            continue
-
-        # Annotate using the lexical index via the TextAnnotatorInterface.
-        annotations = list(annotator.annotate_text(label, configuration=config))
-        processed_annotations = []
-        label_length = len(label)
-
-        for ann in annotations:
-            if hasattr(ann, "subject_start") and hasattr(ann, "subject_end"):
-                ann_length = ann.subject_end - ann.subject_start + 1
-                if ann_length < MIN_ANNOTATION_LENGTH:
-                    continue  # Skip too-short annotations.
-
-            match_string = getattr(ann, "match_string", None)
-
-            # If it's a single-word match_string, make sure it's a whole word in the label
-            if match_string and " " not in match_string:
-                if not is_true_whole_word_match(label, match_string):
-                    continue  # Skip partial word matches like "gas" in "gastric"
-
-            ann_dict = annotation_to_dict(ann, label_length)
-            ann_dict['rdfs_label'] = element_to_label.get(ann_dict['object_id'])
-            ann_dict['prefix_uc'] = ann_dict['object_id'].split(":")[0].upper()
-            processed_annotations.append(ann_dict)
-
-        filtered_annotations = filter_subsumed_annotations(processed_annotations)
-        combined_coverage = compute_combined_oak_coverage(filtered_annotations, label_length)
-        annotations_count = len(filtered_annotations)
-
-        update_data = {
-            "oak_text_annotations": filtered_annotations,
-            "combined_oak_coverage": combined_coverage,
-            "oak_annotations_count": annotations_count
-        }
-        collection.update_one({"_id": doc["_id"]}, {"$set": update_data})
-
-    print("Annotation processing complete.")
+    print(f"Annotation processing complete: {documents} labels in {elapsed:.1f}s "
+          f"({documents / elapsed if elapsed else 0:.0f} labels/sec).")
 
 
 if __name__ == '__main__':
@@ -1,12 +1,16 @@
 import datetime
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
 import click
 
 import requests
 import requests_cache
-from pymongo import uri_parser
+from pymongo import UpdateMany, uri_parser
 from tqdm import tqdm
 
 from external_metadata_awareness.mongodb_connection import get_mongo_client
+from external_metadata_awareness.semsql_exact_match_index import ExactMatchIndex
 
 # OLS Search API endpoint and query parameters
 OLS_SEARCH_URL = "https://www.ebi.ac.uk/ols/api/search"
@@ -26,6 +30,144 @@ requests_cache_filename="external-metadata-awareness-requests-cache"
 requests_cache.install_cache(requests_cache_filename, expire_after=datetime.timedelta(days=30))
 
 
+def normalize_query(label_raw):
+    """
+    Return the OLS query text for a label (stripped, lowercase), or None if it
+    should not be queried. Labels that normalize to the same text share one query.
+    """
+    if not isinstance(label_raw, str):
+        return None  # skip if label is missing or not a string
+    query_text = label_raw.strip().lower()
+    if not query_text or len(query_text) < MIN_LABEL_LEN:
+        return None
+    return query_text
+
+
+def search_ols(query_text, verbose=False, search_url=OLS_SEARCH_URL):
+    """Page through OLS search results for query_text and return the defining-ontology hits."""
+    start = 0
+    ols_hits = []
+    while True:
+        params = {
+            "q": query_text,
+            "exact": OLS_REQ_EXACT_MATCH,
+            "fieldList": FIELDLIST,
+            "queryFields": QUERYFIELDS,
+            "rows": ROWS,
+            "start": start,
+        }
+
+        try:
+            response = requests.get(search_url, params=params, timeout=10)
+            response.raise_for_status()
+            data = response.json()
+        except Exception as e:
+            if verbose:
+                print(f"Error: {e}")
+            break
+
+        results = data.get("response", {}).get("docs", [])
+        if not results:
+            break
+
+        for result in results:
+            if result.get("is_defining_ontology", True):
+                label_lower = result.get("label", "").lower()
+                exact_match = (label_lower == query_text)
+                synonyms = result.get("synonym", [])
+                exact_synonym_match = any(query_text == synonym.lower() for synonym in synonyms)
+                hit = {
+                    "label": result.get("label", ""),
+                    "synonyms": synonyms,
+                    "exact_label_match": exact_match,
+                    "exact_synonym_match": exact_synonym_match,
+                    "obo_id": result.get("obo_id", ""),
+                    # Store ontology name and prefix in upper case:
+                    "ontology_name_uc": result.get("ontology_name", "").upper(),
+                    "ontology_prefix_uc": result.get("ontology_prefix", "").upper(),
+                }
+                ols_hits.append(hit)
+
+        num_found = data.get("response", {}).get("numFound", 0)
+        start += ROWS
+        if start >= num_found:
+            break
+    return ols_hits
+
+
+def group_by_query(docs):
+    """Map each normalized query text to the _ids of the documents whose label normalizes to it."""
+    ids_by_query = defaultdict(list)
+    for doc in docs:
+        query_text = normalize_query(doc.get("label"))
+        if query_text is not None:
+            ids_by_query[query_text].append(doc["_id"])
+    return ids_by_query
+
+
+def annotate_queries(ids_by_query, collection, concurrency=8, batch_size=500, verbose=False,
+                     search_url=OLS_SEARCH_URL, progress=None, local_index=None):
+    """
+    Run the OLS searches concurrently and write the hits with unordered bulk_write.
+
+    Each distinct query is searched once, at most concurrency at a time, and
+    its hits are $set on every document sharing it with one UpdateMany.
+    Documents with no hits are left unchanged. With a local_index
+    (semsql_exact_match_index.ExactMatchIndex) queries are answered from it
+    in-process instead of by OLS. Returns the number of queries that had hits.
+    """
+    ops = []
+    annotated = 0
+
+    def collect(query_text, ols_hits):
+        nonlocal annotated
+        # If we found any OLS hits, update the documents with the new fields,
+        # including an "ols_annotations_count" field.
+        if ols_hits:
+            ops.append(UpdateMany(
+                {"_id": {"$in": ids_by_query[query_text]}},
+                {"$set": {
+                    "ols_text_annotations": ols_hits,
+                    "ols_annotations_count": len(ols_hits)
+                }}
+            ))
+            annotated += 1
+        if len(ops) >= batch_size:
+            collection.bulk_write(ops, ordered=False)
+            ops.clear()
+        if progress is not None:
+            progress.update(1)
+
+    def collect_done(done):
+        for future in done:
+            collect(*future.result())
+
+    def search(query_text):
+        return query_text, search_ols(query_text, verbose, search_url)
+
+    if local_index is not None:
+        for query_text in ids_by_query:
+            collect(query_text, local_index.lookup(query_text))
+        if ops:
+            collection.bulk_write(ops, ordered=False)
+        return annotated
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        pending = set()
+        for query_text in ids_by_query:
+            pending.add(pool.submit(search, query_text))
+            if len(pending) >= concurrency * 4:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                collect_done(done)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            collect_done(done)
+
+    if ops:
+        collection.bulk_write(ops, ordered=False)
+    return annotated
+
+
 @click.command()
 @click.option('--mongo-uri', default='mongodb://localhost:27017/ncbi_metadata', help='MongoDB connection URI (must start with mongodb:// and include database name)')
 @click.option('--env-file', default=None, help='Path to .env file for credentials (should contain MONGO_USER and MONGO_PASSWORD)')
@@ -33,7 +175,14 @@ requests_cache.install_cache(requests_cache_filename, expire_after=datetime.time
 @click.option('--min-length', default=3, type=int, help='Minimum label length to process')
 @click.option('--max-oak-coverage', default=0.9, type=float, help='Maximum oak coverage to process (documents below this value will be annotated)')
 @click.option('--verbose', is_flag=True, help='Show verbose connection output')
-def main(mongo_uri, env_file, collection, min_length, max_oak_coverage, verbose):
+@click.option('--concurrency', default=8, show_default=True, type=click.IntRange(min=1),
+              help='OLS searches in flight at once')
+@click.option('--batch-size', default=500, show_default=True, type=click.IntRange(min=1),
+              help='Updates per unordered bulk_write')
+@click.option('--local-index', default=None, type=click.Path(exists=True, dir_okay=False),
+              help='Answer queries offline from a build-semsql-exact-match-index file instead of the OLS API')
+def main(mongo_uri, env_file, collection, min_length, max_oak_coverage, verbose, concurrency, batch_size,
+         local_index):
     # Connect to MongoDB
     client = get_mongo_client(
         mongo_uri=mongo_uri,
@@ -59,79 +208,21 @@ def main(mongo_uri, env_file, collection, min_length, max_oak_coverage, verbose)
     }
 
     projection = {"label": 1}
-    docs = list(collection.find(query, projection))
-
-    print(f"Found {len(docs)} documents.")
-
-    # Process each document with a progress bar
-    for doc in tqdm(docs, desc="Processing documents"):
-        label_raw = doc.get("label")
-        if not isinstance(label_raw, str):
-            continue  # skip if label is missing or not a string
-
-        query_text = label_raw.strip().lower()
-        if not query_text or len(query_text) < MIN_LABEL_LEN:
-            continue
-
-        start = 0
-        ols_hits = []
-        while True:
-            params = {
-                "q": query_text,
-                "exact": OLS_REQ_EXACT_MATCH,
-                "fieldList": FIELDLIST,
-                "queryFields": QUERYFIELDS,
-                "rows": ROWS,
-                "start": start,
-            }
-
-            try:
-                response = requests.get(OLS_SEARCH_URL, params=params, timeout=10)
-                response.raise_for_status()
-                data = response.json()
-            except Exception as e:
-                if verbose:
-                    print(f"Error: {e}")
-                break
-
-            results = data.get("response", {}).get("docs", [])
-            if not results:
-                break
-
-            for result in results:
-                if result.get("is_defining_ontology", True):
-                    label_lower = result.get("label", "").lower()
-                    exact_match = (label_lower == query_text)
-                    synonyms = result.get("synonym", [])
-                    exact_synonym_match = any(query_text == synonym.lower() for synonym in synonyms)
-                    hit = {
-                        "label": result.get("label", ""),
-                        "synonyms": synonyms,
-                        "exact_label_match": exact_match,
-                        "exact_synonym_match": exact_synonym_match,
-                        "obo_id": result.get("obo_id", ""),
-                        # Store ontology name and prefix in upper case:
-                        "ontology_name_uc": result.get("ontology_name", "").upper(),
-                        "ontology_prefix_uc": result.get("ontology_prefix", "").upper(),
-                    }
-                    ols_hits.append(hit)
-
-            num_found = data.get("response", {}).get("numFound", 0)
-            start += ROWS
-            if start >= num_found:
-                break
-
-        # If we found any OLS hits, update the document with the new fields,
-        # including an "ols_annotations_count" field.
-        if ols_hits:
-            collection.update_one(
-                {"_id": doc["_id"]},
-                {"$set": {
-                    "ols_text_annotations": ols_hits,
-                    "ols_annotations_count": len(ols_hits)
-                }}
-            )
+    ids_by_query = group_by_query(collection.find(query, projection))
+    doc_count = sum(len(ids) for ids in ids_by_query.values())
+
+    print(f"Found {doc_count} documents with {len(ids_by_query)} distinct query labels.")
+
+    index = ExactMatchIndex(local_index) if local_index else None
+    try:
+        with tqdm(total=len(ids_by_query), desc="Querying local index" if index else "Querying OLS") as progress:
+            annotated = annotate_queries(ids_by_query, collection, concurrency, batch_size, verbose,
+                                         progress=progress, local_index=index)
+    finally:
+        if index is not None:
+            index.close()
 
+    print(f"{annotated} of {len(ids_by_query)} query labels had OLS hits.")
     print("OLS lookups completed and documents updated.")
 
 
@@ -1,21 +1,37 @@
+"""
+Split env triad values into label/CURIE components.
+
+Values are streamed from the collection, split in chunks by a process pool
+and written back with unordered bulk UpdateOne writes, so a collection of any
+size goes through in one pass at constant memory. The OBO and BioPortal
+prefix registries are cached on disk for --registry-max-age-days and turned
+into upper-cased frozensets (PrefixSets) once per run.
+"""
+
 import datetime
+import json
 import os
 import re
 import string
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import NamedTuple
 
 import click
 import requests
-import requests_cache
 import yaml
-from oaklib import get_adapter
+from pymongo import UpdateOne
 from tqdm import tqdm
 
 from external_metadata_awareness.mongodb_connection import get_mongo_client
 
 # todo doesnt' address ENV or ENV0 prefixes, but they are rare
 # seeing OF and TO prefixes that are defined in Bioportal. I'm suspicious.
+EXCLUDED_PREFIXES = frozenset({"OF", "GUT", "RHIZOSPHERE"})
 
-requests_cache_filename = "external-metadata-awareness-requests-cache"
+DEFAULT_REGISTRY_CACHE = "env-triad-prefix-registries.json"
 
 # Precompiled regex patterns (assumed global in your file; repeated here for clarity).
 improved_curie_pattern = re.compile(
@@ -52,7 +68,33 @@ trailing_curie_pattern = re.compile(
     """, re.VERBOSE
 )
 
+repeated_envo_pattern = re.compile(r'\b(ENVO:){2,}', re.IGNORECASE)
+has_bracketed_pattern = re.compile(r'[\[\(\{].+[\]\)\}]')
+delimiter_pattern = re.compile(r'\|+|;+|,+')
+ends_with_curie_pattern = re.compile(r'\s+[A-Za-z][A-Za-z0-9]+[:\-_ \uFF1A][A-Za-z0-9]{2,}\s*$')
+punctuation_pattern = re.compile(rf"[{re.escape(string.punctuation)}]")
+whitespace_pattern = re.compile(r"\s+")
+
 obo_registry_yaml_url = "https://raw.githubusercontent.com/OBOFoundry/OBOFoundry.github.io/refs/heads/master/registry/ontologies.yml"
+bioportal_ontologies_url = "https://data.bioontology.org/ontologies"
+
+
+class PrefixSets(NamedTuple):
+    """Upper-cased ontology prefixes extract_components checks components against."""
+    obo: frozenset
+    bioportal: frozenset
+    known: frozenset
+
+    @classmethod
+    def from_indicators(cls, obo_ontology_indicators_lc, bioportal_ontology_indicators_lc, known_prefixes=None):
+        """Build the sets once; known defaults to OBO plus BioPortal minus EXCLUDED_PREFIXES."""
+        obo = frozenset(x.upper() for x in obo_ontology_indicators_lc or ())
+        bioportal = frozenset(x.upper() for x in bioportal_ontology_indicators_lc or ())
+        if known_prefixes is None:
+            known = (obo | bioportal) - EXCLUDED_PREFIXES
+        else:
+            known = frozenset(known_prefixes)
+        return cls(obo, bioportal, known)
 
 
 def make_plain_component(ann):
@@ -81,9 +123,9 @@ def normalize_label(label):
     # Convert to lowercase
     label = label.lower()
     # Replace punctuation and underscore with space
-    label = re.sub(rf"[{re.escape(string.punctuation)}]", " ", label)
+    label = punctuation_pattern.sub(" ", label)
     # Normalize whitespace
-    label = re.sub(r"\s+", " ", label).strip()
+    label = whitespace_pattern.sub(" ", label).strip()
     return label
 
 
@@ -91,18 +133,28 @@ def extract_components(text,
                        known_envo_curies=None,
                        obo_ontology_indicators_lc=None,
                        bioportal_ontology_indicators_lc=None,
-                       known_prefixes=None):
+                       known_prefixes=None,
+                       prefix_sets=None):
+    """
+    Split one value into components.
+
+    Pass prefix_sets (PrefixSets, built once) when splitting many values;
+    otherwise the sets are rebuilt from the *_lc indicator arguments here.
+    """
     if not isinstance(text, str):
         return []
+    if prefix_sets is None:
+        prefix_sets = PrefixSets.from_indicators(
+            obo_ontology_indicators_lc, bioportal_ontology_indicators_lc, known_prefixes or ())
 
     components = []
 
     # Pre-clean the text.
     text = text.strip().strip('“”"\'')
-    text = re.sub(r'\b(ENVO:){2,}', 'ENVO:', text, flags=re.IGNORECASE)
+    text = repeated_envo_pattern.sub('ENVO:', text)
 
     # If text contains a bracketed CURIE, use that branch.
-    if re.search(r'[\[\(\{].+[\]\)\}]', text):
+    if has_bracketed_pattern.search(text):
         found = False
         for m in bracketed_pattern.finditer(text):
             found = True
@@ -118,18 +170,15 @@ def extract_components(text,
                 'local_digits_only': is_digits_only(m.group('local')),
                 'prefix_uc': m.group('prefix').upper() if m.group('prefix') else None,
                 'raw': raw,
-                'uses_bioportal_prefix': bool(bioportal_ontology_indicators_lc and
-                                              m.group('prefix').upper() in {x.upper() for x in
-                                                                            bioportal_ontology_indicators_lc}),
-                'uses_obo_prefix': bool(obo_ontology_indicators_lc and
-                                        m.group('prefix').upper() in {x.upper() for x in obo_ontology_indicators_lc}),
+                'uses_bioportal_prefix': m.group('prefix').upper() in prefix_sets.bioportal,
+                'uses_obo_prefix': m.group('prefix').upper() in prefix_sets.obo,
             })
         if found:
             return components
         return [make_plain_component(text)]
 
     # Otherwise, split text on delimiters (pipe, semicolon, comma).
-    annotations = re.split(r'\|+|;+|,+', text)
+    annotations = delimiter_pattern.split(text)
     for ann in annotations:
         ann = ann.strip()
         if not ann:
@@ -141,18 +190,18 @@ def extract_components(text,
             continue
 
         ann = ann.strip('“”"\'')
-        ann = re.sub(r'\b(ENVO:){2,}', 'ENVO:', ann, flags=re.IGNORECASE)
+        ann = repeated_envo_pattern.sub('ENVO:', ann)
 
         # If the annotation ends with a CURIE-like pattern, force use of the trailing matcher.
-        if re.search(r'\s+[A-Za-z][A-Za-z0-9]+[:\-_ \uFF1A][A-Za-z0-9]{2,}\s*$', ann):
+        if ends_with_curie_pattern.search(ann):
             m = trailing_curie_pattern.match(ann)
         else:
             m = improved_curie_pattern.match(ann)
 
         if m:
             candidate_prefix = m.group('prefix').upper()
-            # Validate the prefix using the passed-in known_prefixes.
-            if candidate_prefix not in known_prefixes:
+            # Validate the prefix using the known prefixes.
+            if candidate_prefix not in prefix_sets.known:
                 components.append(make_plain_component(ann))
                 continue
 
@@ -175,10 +224,8 @@ def extract_components(text,
                 'local_digits_only': is_digits_only(local),
                 'prefix_uc': prefix,
                 'raw': ann,
-                'uses_bioportal_prefix': bool(bioportal_ontology_indicators_lc and
-                                               prefix in {x.upper() for x in bioportal_ontology_indicators_lc}),
-                'uses_obo_prefix': bool(obo_ontology_indicators_lc and
-                                        prefix in {x.upper() for x in obo_ontology_indicators_lc}),
+                'uses_bioportal_prefix': prefix in prefix_sets.bioportal,
+                'uses_obo_prefix': prefix in prefix_sets.obo,
             })
         else:
             components.append(make_plain_component(ann))
@@ -188,35 +235,8 @@ def extract_components(text,
     return components
 
 
-@click.command()
-@click.option('--mongo-uri', required=True, help='MongoDB connection URI (must start with mongodb:// and include database name)')
-@click.option('--env-file', default=None, help='Path to .env file for credentials (should contain MONGO_USER and MONGO_PASSWORD)')
-@click.option('--collection', required=True, help='MongoDB collection name')
-@click.option('--field', default='env_triad_value', help='Field to parse')
-@click.option('--min-length', default=0, type=int, help='Minimum value of the length field to include a document')
-@click.option('--verbose', is_flag=True, help='Show verbose connection output')
-def main(mongo_uri, env_file, collection, field, min_length, verbose):
-    # Use the unified MongoDB connection utility
-    client = get_mongo_client(
-        mongo_uri=mongo_uri,
-        env_file=env_file,
-        debug=verbose
-    )
-    
-    # Extract database name from URI using pymongo's uri_parser
-    from pymongo import uri_parser
-    parsed = uri_parser.parse_uri(mongo_uri)
-    db_name = parsed.get('database')
-    
-    if not db_name:
-        raise ValueError("MongoDB URI must include a database name")
-        
-    coll = client[db_name][collection]
-
-    envo_adapter_string = "sqlite:obo:envo"
-    envo_adapter = get_adapter(envo_adapter_string)
-    all_envo_curies_and_iris = set(envo_adapter.entities())
-
+def fetch_obo_indicators_lc():
+    """Lower-cased ids and preferred prefixes of the OBO Foundry registry."""
     obo_reg_resp = requests.get(obo_registry_yaml_url)
     obo_reg_resp.raise_for_status()  # Raises an error for bad status codes
 
@@ -228,32 +248,135 @@ def main(mongo_uri, env_file, collection, field, min_length, verbose):
             obo_ontology_indicators_lc.add(i['id'].strip().lower())
         if 'preferredPrefix' in i and len(i['preferredPrefix'].strip()) > 0:
             obo_ontology_indicators_lc.add(i['preferredPrefix'].strip().lower())
+    return obo_ontology_indicators_lc
 
-    # Create a cache that lasts for 30 days
-    requests_cache.install_cache(requests_cache_filename, expire_after=datetime.timedelta(days=30))
-
-    BIOPORTAL_API_KEY = os.getenv("BIOPORTAL_API_KEY")
-
-    bioportal_ontologies_url = f"https://data.bioontology.org/ontologies?apikey={BIOPORTAL_API_KEY}"
-
-    bioportal_ontologies_resp = requests.get(bioportal_ontologies_url)
 
+def fetch_bioportal_indicators_lc(api_key):
+    """Lower-cased acronyms of the BioPortal ontologies."""
+    bioportal_ontologies_resp = requests.get(bioportal_ontologies_url, params={"apikey": api_key})
     bioportal_ontologies = bioportal_ontologies_resp.json()
+    if not isinstance(bioportal_ontologies, list):
+        raise click.ClickException(
+            f"BioPortal ontology list unavailable ({bioportal_ontologies_resp.status_code}); "
+            f"is BIOPORTAL_API_KEY set?")
 
     bioportal_ontology_indicators_lc = set()
-
     for i in bioportal_ontologies:
         if 'acronym' in i and len(i['acronym'].strip()) > 0:
             bioportal_ontology_indicators_lc.add(i['acronym'].strip().lower())
-
-    known_prefixes = {x.upper() for x in (obo_ontology_indicators_lc or [])} | {x.upper() for x in (
-            bioportal_ontology_indicators_lc or [])}
-
-    known_prefixes.discard("OF")
-    known_prefixes.discard("GUT")
-    known_prefixes.discard("RHIZOSPHERE")
-
-    docs = list(coll.find({
+    return bioportal_ontology_indicators_lc
+
+
+def load_prefix_registries(cache_path=DEFAULT_REGISTRY_CACHE, max_age=datetime.timedelta(days=7), api_key=None):
+    """
+    Return (obo_ontology_indicators_lc, bioportal_ontology_indicators_lc).
+
+    Both registries are read from the JSON file at cache_path while it is
+    younger than max_age, and fetched and saved there otherwise. An empty
+    cache_path always fetches.
+    """
+    if cache_path and os.path.exists(cache_path) and time.time() - os.path.getmtime(cache_path) < max_age.total_seconds():
+        with open(cache_path) as f:
+            registries = json.load(f)
+        print(f"Using prefix registries cached in {cache_path} at {registries['fetched_at']}")
+        return set(registries['obo']), set(registries['bioportal'])
+
+    obo_ontology_indicators_lc = fetch_obo_indicators_lc()
+    bioportal_ontology_indicators_lc = fetch_bioportal_indicators_lc(api_key)
+    if cache_path:
+        with open(cache_path, "w") as f:
+            json.dump({
+                'fetched_at': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+                'obo': sorted(obo_ontology_indicators_lc),
+                'bioportal': sorted(bioportal_ontology_indicators_lc),
+            }, f, indent=1)
+    return obo_ontology_indicators_lc, bioportal_ontology_indicators_lc
+
+
+def split_value(value, prefix_sets):
+    """The components of one value, with curie_uc and label_length filled in."""
+    parsed = extract_components(value, prefix_sets=prefix_sets)
+    for comp in parsed:
+        if comp.get("prefix_uc") and comp.get("local"):
+            comp["curie_uc"] = f"{comp['prefix_uc']}:{comp['local'].upper()}"
+        else:
+            comp["curie_uc"] = None
+        if comp["label"]:
+            comp["label_length"] = len(comp["label"])
+        else:
+            comp["label_length"] = 0
+    return parsed
+
+
+_worker_prefix_sets = None
+
+
+def _init_split_worker(prefix_sets):
+    global _worker_prefix_sets
+    _worker_prefix_sets = prefix_sets
+
+
+def split_chunk(pairs):
+    """Split a chunk of (_id, value) pairs in a worker; returns (_id, components) pairs."""
+    return [(_id, split_value(value, _worker_prefix_sets)) for _id, value in pairs]
+
+
+def split_in_pool(pairs, prefix_sets, workers, chunk_size):
+    """
+    Yield (_id, components) for an iterable of (_id, value) pairs, in input order.
+
+    Chunks are split by a process pool whose workers receive prefix_sets once,
+    at start-up. Only workers * 2 chunks are in flight, so the input is read
+    no faster than it is split. With one worker everything runs inline.
+    """
+    pairs = iter(pairs)
+    if workers <= 1:
+        for _id, value in pairs:
+            yield _id, split_value(value, prefix_sets)
+        return
+
+    pending = deque()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_split_worker,
+                             initargs=(prefix_sets,)) as pool:
+        def submit():
+            while len(pending) < workers * 2:
+                chunk = list(islice(pairs, chunk_size))
+                if not chunk:
+                    return
+                pending.append(pool.submit(split_chunk, chunk))
+
+        submit()
+        while pending:
+            results = pending.popleft().result()
+            submit()
+            yield from results
+
+
+def write_components(collection, results, batch_size=1000, progress=None):
+    """
+    Set components and components_count from (_id, components) pairs with unordered bulk writes.
+
+    Returns (documents updated, components written).
+    """
+    ops = []
+    documents = components = 0
+    for _id, parsed in results:
+        ops.append(UpdateOne({"_id": _id}, {"$set": {"components": parsed, "components_count": len(parsed)}}))
+        documents += 1
+        components += len(parsed)
+        if len(ops) >= batch_size:
+            collection.bulk_write(ops, ordered=False)
+            ops = []
+        if progress is not None:
+            progress.update(1)
+    if ops:
+        collection.bulk_write(ops, ordered=False)
+    return documents, components
+
+
+def splitter_query(field, min_length):
+    """Documents with a value in field that are not flagged as digits, equations or missing indicators."""
+    return {
         "$and": [
             {field: {"$exists": True}},
             {
@@ -282,34 +405,59 @@ def main(mongo_uri, env_file, collection, field, min_length, verbose):
             },
             {"length": {"$gte": min_length}}
         ]
-    }))
-
-    for doc in tqdm(docs, desc="Parsing and updating"):
-        value = doc.get(field)
-        parsed = extract_components(value, known_envo_curies=all_envo_curies_and_iris,
-                                    obo_ontology_indicators_lc=obo_ontology_indicators_lc,
-                                    bioportal_ontology_indicators_lc=bioportal_ontology_indicators_lc,
-                                    known_prefixes=known_prefixes)
-
-        for comp in parsed:
-            if comp.get("prefix_uc") and comp.get("local"):
-                comp["curie_uc"] = f"{comp['prefix_uc']}:{comp['local'].upper()}"
-            else:
-                comp["curie_uc"] = None
-            if comp["label"]:
-                comp["label_length"] = len(comp["label"])
-            else:
-                comp["label_length"] = 0
-
-        coll.update_one(
-            {"_id": doc["_id"]},
-            {"$set": {
-                "components": parsed,
-                "components_count": len(parsed)
-            }}
-        )
-
-    print(f"Updated {len(docs)} documents in '{collection}' collection.")
+    }
+
+
+@click.command()
+@click.option('--mongo-uri', required=True, help='MongoDB connection URI (must start with mongodb:// and include database name)')
+@click.option('--env-file', default=None, help='Path to .env file for credentials (should contain MONGO_USER and MONGO_PASSWORD)')
+@click.option('--collection', required=True, help='MongoDB collection name')
+@click.option('--field', default='env_triad_value', help='Field to parse')
+@click.option('--min-length', default=0, type=int, help='Minimum value of the length field to include a document')
+@click.option('--workers', default=4, show_default=True, type=int, help='Worker processes splitting values (1 splits inline)')
+@click.option('--chunk-size', default=1000, show_default=True, type=int, help='Values per worker task')
+@click.option('--batch-size', default=1000, show_default=True, type=int, help='Updates per bulk write')
+@click.option('--registry-cache', default=DEFAULT_REGISTRY_CACHE, show_default=True,
+              help='JSON file caching the OBO and BioPortal prefix registries ("" to always fetch)')
+@click.option('--registry-max-age-days', default=7, show_default=True, type=float,
+              help='Refetch the prefix registries when the cache is older than this')
+@click.option('--verbose', is_flag=True, help='Show verbose connection output')
+def main(mongo_uri, env_file, collection, field, min_length, workers, chunk_size, batch_size,
+         registry_cache, registry_max_age_days, verbose):
+    # Use the unified MongoDB connection utility
+    client = get_mongo_client(
+        mongo_uri=mongo_uri,
+        env_file=env_file,
+        debug=verbose
+    )
+    
+    # Extract database name from URI using pymongo's uri_parser
+    from pymongo import uri_parser
+    parsed = uri_parser.parse_uri(mongo_uri)
+    db_name = parsed.get('database')
+    
+    if not db_name:
+        raise ValueError("MongoDB URI must include a database name")
+        
+    coll = client[db_name][collection]
+
+    obo_ontology_indicators_lc, bioportal_ontology_indicators_lc = load_prefix_registries(
+        registry_cache, datetime.timedelta(days=registry_max_age_days), os.getenv("BIOPORTAL_API_KEY"))
+    prefix_sets = PrefixSets.from_indicators(obo_ontology_indicators_lc, bioportal_ontology_indicators_lc)
+
+    query = splitter_query(field, min_length)
+    total = coll.count_documents(query)
+    cursor = coll.find(query, {field: 1}, batch_size=chunk_size)
+    pairs = ((doc["_id"], doc.get(field)) for doc in cursor)
+
+    start = time.monotonic()
+    with tqdm(total=total, desc="Parsing and updating") as progress:
+        documents, components = write_components(
+            coll, split_in_pool(pairs, prefix_sets, workers, chunk_size), batch_size, progress)
+    elapsed = time.monotonic() - start
+
+    print(f"Updated {documents} documents in '{collection}' collection: {components} components "
+          f"in {elapsed:.1f}s ({components / elapsed if elapsed else 0:,.0f} components/sec).")
 
 
 if __name__ == '__main__':
@@ -6,8 +6,17 @@ This script:
   - Obtains a punctuation-insensitive lexical index from each ontology adapter.
   - Adds obsolete terms from each ontology with the "obsolete " prefix removed.
   - For any term that contains punctuation, creates an alternate entry with punctuation replaced by whitespace.
-  - Merges the two indices.
-  - Saves the merged index as "envo_inc_obsoletes_po_punct_free_index.yaml".
+  - Merges the indices, including those of any --extra-adapter ontologies (e.g. UBERON, FOODON).
+  - Saves the merged index as "expanded_envo_po_lexical_index.yaml".
+  - Compiles it into the binary cache the annotator loads (see lexical_index_cache).
+
+Each ontology is indexed in its own worker process, and the per-ontology
+indices are combined in one pass keyed by term, keeping the groupings in
+first-seen order (ENVO, including obsoletes, then terms new in PO and in any
+extra ontologies), which is the order the annotator reports matches in.
+Relationships are deduplicated through hash-keyed sets, transformation
+pipelines are compiled once, and the labels and aliases of all obsolete terms
+are fetched in bulk.
 
 Requirements:
   • oaklib and its dependencies
@@ -15,7 +24,11 @@ Requirements:
   • A writable location for the output YAML file.
 """
 
+import os
 import re
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
 
 import click
 from oaklib import get_adapter
@@ -28,16 +41,34 @@ from oaklib.datamodels.lexical_index import (
     TransformationType
 )
 from oaklib.datamodels.synonymizer_datamodel import Synonymizer
+from oaklib.datamodels.vocabulary import LABEL_PREDICATE
 from oaklib.utilities.lexical.lexical_indexer import (
     apply_transformation,
     create_lexical_index,
     save_lexical_index
 )
 
+from external_metadata_awareness.lexical_automaton import LexicalAutomaton
+from external_metadata_awareness.lexical_index_cache import DEFAULT_INDEX_CACHE, write_index_cache
+from external_metadata_awareness.oak_helpers import build_element_to_label_map
+
 # Adapter strings for the two ontologies.
 ENVO_ADAPTER_STRING = "sqlite:obo:envo"
 PO_ADAPTER_STRING = "sqlite:obo:po"
 
+# Obsolete terms' labels and aliases are fetched this many entities at a time.
+OBSOLETE_FETCH_CHUNK = 500
+
+# Define a punctuation normalization rule.
+PUNCTUATION_RULE = Synonymizer(
+    description="Replace all punctuation with spaces",
+    match=r"[^\w\s]|_",  # Match any non-alphanumeric, non-whitespace character or underscore.
+    replacement=r" "  # Replace with a space.
+)
+PUNCTUATION_TRANSFORMATION = LexicalTransformation(TransformationType.Synonymization, params=[PUNCTUATION_RULE])
+
+_OBSOLETE_PREFIX = re.compile(r'^obsolete\s+', flags=re.IGNORECASE)
+
 
 def are_pipelines_compatible(pipeline1, pipeline2):
     """
@@ -57,59 +88,121 @@ def are_pipelines_compatible(pipeline1, pipeline2):
     return True
 
 
+def relationship_key(rel):
+    """
+    The attributes that make two relationships functionally equal, as a hashable tuple.
+    """
+    return (getattr(rel, 'predicate', None), getattr(rel, 'element', None),
+            getattr(rel, 'element_term', None), getattr(rel, 'source', None))
+
+
 def relationship_equals(rel1, rel2):
     """
     Compare two relationships for functional equality.
     """
-    key_attrs = ['predicate', 'element', 'element_term', 'source']
-    return all(getattr(rel1, attr, None) == getattr(rel2, attr, None)
-               for attr in key_attrs)
+    return relationship_key(rel1) == relationship_key(rel2)
+
+
+def unique_relationships(relationships):
+    """
+    The relationships without functional duplicates, keeping the first of each in order.
+    """
+    seen = set()
+    unique = []
+    for rel in relationships:
+        key = relationship_key(rel)
+        if key not in seen:
+            seen.add(key)
+            unique.append(rel)
+    return unique
 
 
 def deduplicate_lexical_index(lexical_index):
     """
     Remove duplicate relationships from all groupings in a lexical index.
     """
-    for term, grouping in lexical_index.groupings.items():
-        unique_relationships = []
-        for rel in grouping.relationships:
-            if not any(relationship_equals(rel, unique_rel) for unique_rel in unique_relationships):
-                unique_relationships.append(rel)
-        grouping.relationships = unique_relationships
+    for grouping in lexical_index.groupings.values():
+        grouping.relationships = unique_relationships(grouping.relationships)
     return lexical_index
 
 
-def merge_lexical_indexes(index1, index2, validate_pipelines=True):
+def compile_transformations(transformations):
     """
-    Merge two lexical indexes ensuring pipeline compatibility.
+    Compile a sequence of LexicalTransformations into one str -> str function.
+
+    The result is what applying each with oaklib's apply_transformation in turn
+    gives, keeping only the text of synonymization results, but with the
+    synonymizer regexes compiled once.
     """
-    merged_index = LexicalIndex()
-    if validate_pipelines:
-        for name, pipeline1 in index1.pipelines.items():
-            if name in index2.pipelines:
-                pipeline2 = index2.pipelines[name]
-                if not are_pipelines_compatible(pipeline1, pipeline2):
-                    raise ValueError(
-                        f"Pipeline '{name}' is defined differently in the two indexes. "
-                        "Set validate_pipelines=False to override this check."
-                    )
-    for name, pipeline in index1.pipelines.items():
-        merged_index.pipelines[name] = pipeline
-    for name, pipeline in index2.pipelines.items():
-        if name not in merged_index.pipelines:
-            merged_index.pipelines[name] = pipeline
-    # Copy groupings from index1.
-    for term, grouping in index1.groupings.items():
-        merged_index.groupings[term] = LexicalGrouping(term=term)
-        merged_index.groupings[term].relationships = list(grouping.relationships)
-    # Merge groupings from index2.
-    for term, grouping in index2.groupings.items():
-        if term not in merged_index.groupings:
-            merged_index.groupings[term] = LexicalGrouping(term=term)
-            merged_index.groupings[term].relationships = list(grouping.relationships)
+    steps = []
+    for transformation in transformations:
+        typ = str(transformation.type)
+        if typ == TransformationType.CaseNormalization.text:
+            steps.append(str.lower)
+        elif typ == TransformationType.WhitespaceNormalization.text:
+            multiple_spaces = re.compile(" {2,}")
+            steps.append(lambda text, pattern=multiple_spaces: pattern.sub(" ", text.strip()))
+        elif typ == TransformationType.Synonymization.text:
+            rules = [(re.compile(rule.match), rule.replacement) for rule in transformation.params]
+
+            def synonymize(text, rules=rules):
+                # apply_transformation strips the text only when some rule changed it.
+                result = text
+                for pattern, replacement in rules:
+                    result = pattern.sub(replacement, result)
+                return result.strip() if result != text else text
+
+            steps.append(synonymize)
         else:
-            merged_index.groupings[term].relationships.extend(grouping.relationships)
-    return deduplicate_lexical_index(merged_index)
+            def apply_other(text, transformation=transformation):
+                result = apply_transformation(text, transformation)
+                return result[1] if isinstance(result, tuple) else result
+
+            steps.append(apply_other)
+
+    def transform(text):
+        for step in steps:
+            text = step(text)
+        return text
+
+    return transform
+
+
+def strip_obsolete_prefix(text):
+    """
+    Remove a leading "obsolete " from a label or alias.
+    """
+    if text.lower().startswith("obsolete "):
+        return _OBSOLETE_PREFIX.sub('', text)
+    return text
+
+
+def fetch_obsolete_terms(oi, obsolete_entities):
+    """
+    Return [(entity, label, alias map)] for the obsolete entities that have a label.
+
+    Labels come from one bulk labels() call. Synonyms come from has_synonym_statement
+    in chunks of OBSOLETE_FETCH_CHUNK when the adapter is a semsql one, and
+    entity_alias_map otherwise; the alias maps match entity_alias_map's.
+    """
+    labels = {}
+    for entity, label in oi.labels(obsolete_entities):
+        if label and entity not in labels:
+            labels[entity] = label
+    entities = [entity for entity in obsolete_entities if entity in labels]
+
+    if not hasattr(oi, 'session'):
+        return [(entity, labels[entity], oi.entity_alias_map(entity)) for entity in entities]
+
+    from semsql.sqla.semsql import HasSynonymStatement
+
+    synonyms = defaultdict(lambda: defaultdict(list))
+    remaining = iter(entities)
+    while chunk := list(islice(remaining, OBSOLETE_FETCH_CHUNK)):
+        for row in oi.session.query(HasSynonymStatement).filter(HasSynonymStatement.subject.in_(chunk)):
+            synonyms[row.subject][row.predicate].append(row.value)
+    return [(entity, labels[entity], {LABEL_PREDICATE: [labels[entity]], **synonyms.get(entity, {})})
+            for entity in entities]
 
 
 def add_obsolete_terms_to_lexical_index(oi, lexical_index):
@@ -120,97 +213,52 @@ def add_obsolete_terms_to_lexical_index(oi, lexical_index):
     obsolete_classes = list(oi.obsoletes())
     print(f"Found {len(obsolete_classes)} obsolete classes")
 
-    # Define a punctuation normalization rule.
-    punctuation_rule = Synonymizer(
-        description="Replace all punctuation with spaces",
-        match=r"[^\w\s]|_",  # Match any non-alphanumeric, non-whitespace character or underscore.
-        replacement=r" "  # Replace with a space.
-    )
-
-    for obsolete_entity in obsolete_classes:
-        orig_label = oi.label(obsolete_entity)
-        if not orig_label:
-            continue
-        if orig_label.lower().startswith("obsolete "):
-            clean_label = re.sub(r'^obsolete\s+', '', orig_label, flags=re.IGNORECASE)
-        else:
-            clean_label = orig_label
+    # The punctuation rule, then the pipeline's own transformations.
+    pipelines = {name: compile_transformations([PUNCTUATION_TRANSFORMATION] + list(pipeline.transformations))
+                 for name, pipeline in lexical_index.pipelines.items()}
+    # (element, predicate) pairs already in each grouping, filled in as groupings are touched.
+    present = {}
+
+    def add(term, rel):
+        grouping = lexical_index.groupings.get(term)
+        if grouping is None:
+            lexical_index.groupings[term] = LexicalGrouping(term=term)
+            lexical_index.groupings[term].relationships = [rel]
+            present[term] = {(rel.element, rel.predicate)}
+            return
+        if term not in present:
+            present[term] = {(existing.element, existing.predicate) for existing in grouping.relationships}
+        if (rel.element, rel.predicate) not in present[term]:
+            grouping.relationships.append(rel)
+            present[term].add((rel.element, rel.predicate))
+
+    for obsolete_entity, orig_label, alias_map in fetch_obsolete_terms(oi, obsolete_classes):
+        clean_label = strip_obsolete_prefix(orig_label)
 
         # Process the main label through each pipeline.
-        for pipeline_name, pipeline in lexical_index.pipelines.items():
-            transformed_label = clean_label
-            punctuation_transformation = LexicalTransformation(
-                TransformationType.Synonymization,
-                params=[punctuation_rule]
-            )
-            result = apply_transformation(transformed_label, punctuation_transformation)
-            if isinstance(result, tuple):
-                transformed_label = result[1]
-            else:
-                transformed_label = result
-            for transformation in pipeline.transformations:
-                result = apply_transformation(transformed_label, transformation)
-                if isinstance(result, tuple):
-                    transformed_label = result[1]
-                else:
-                    transformed_label = result
-
-            rel = RelationshipToTerm(
+        for pipeline_name, transform in pipelines.items():
+            add(transform(clean_label), RelationshipToTerm(
                 predicate='rdfs:label',
                 element=obsolete_entity,
                 element_term=clean_label,
                 pipeline=[pipeline_name],
                 synonymized=False
-            )
-            if transformed_label not in lexical_index.groupings:
-                lexical_index.groupings[transformed_label] = LexicalGrouping(term=transformed_label)
-                lexical_index.groupings[transformed_label].relationships = [rel]
-            else:
-                exists = any(existing_rel.element == rel.element and existing_rel.predicate == rel.predicate
-                             for existing_rel in lexical_index.groupings[transformed_label].relationships)
-                if not exists:
-                    lexical_index.groupings[transformed_label].relationships.append(rel)
+            ))
 
         # Process aliases for the obsolete entity.
-        alias_map = oi.entity_alias_map(obsolete_entity)
-        for pipeline_name, pipeline in lexical_index.pipelines.items():
+        for pipeline_name, transform in pipelines.items():
             for predicate, aliases in alias_map.items():
                 for alias in aliases:
                     if alias == orig_label and predicate == 'rdfs:label':
                         continue
-                    if alias.lower().startswith("obsolete "):
-                        clean_alias = re.sub(r'^obsolete\s+', '', alias, flags=re.IGNORECASE)
-                    else:
-                        clean_alias = alias
-
-                    transformed_alias = clean_alias
-                    result = apply_transformation(transformed_alias, punctuation_transformation)
-                    if isinstance(result, tuple):
-                        transformed_alias = result[1]
-                    else:
-                        transformed_alias = result
-                    for transformation in pipeline.transformations:
-                        result = apply_transformation(transformed_alias, transformation)
-                        if isinstance(result, tuple):
-                            transformed_alias = result[1]
-                        else:
-                            transformed_alias = result
-
-                    rel = RelationshipToTerm(
+                    clean_alias = strip_obsolete_prefix(alias)
+                    add(transform(clean_alias), RelationshipToTerm(
                         predicate=predicate,
                         element=obsolete_entity,
                         element_term=clean_alias,
                         pipeline=[pipeline_name],
                         synonymized=False
-                    )
-                    if transformed_alias not in lexical_index.groupings:
-                        lexical_index.groupings[transformed_alias] = LexicalGrouping(term=transformed_alias)
-                        lexical_index.groupings[transformed_alias].relationships = [rel]
-                    else:
-                        exists = any(existing_rel.element == rel.element and existing_rel.predicate == rel.predicate
-                                     for existing_rel in lexical_index.groupings[transformed_alias].relationships)
-                        if not exists:
-                            lexical_index.groupings[transformed_alias].relationships.append(rel)
+                    ))
     return deduplicate_lexical_index(lexical_index)
 
 
@@ -218,17 +266,10 @@ def create_punctuation_insensitive_index(oi):
     """
     Create a lexical index that is insensitive to punctuation by replacing all punctuation with spaces.
     """
-    punctuation_rules = [
-        Synonymizer(
-            description="Replace all punctuation with spaces",
-            match=r"[^\w\s]|_",
-            replacement=r" "
-        )
-    ]
     pipeline = LexicalTransformationPipeline(
         name="punctuation_insensitive",
         transformations=[
-            LexicalTransformation(TransformationType.Synonymization, params=punctuation_rules),
+            PUNCTUATION_TRANSFORMATION,
             LexicalTransformation(TransformationType.CaseNormalization),
             LexicalTransformation(TransformationType.WhitespaceNormalization)
         ]
@@ -236,45 +277,133 @@ def create_punctuation_insensitive_index(oi):
     lexical_index = create_lexical_index(
         oi,
         pipelines=[pipeline],
-        synonym_rules=punctuation_rules
+        synonym_rules=[PUNCTUATION_RULE]
     )
     return lexical_index
 
 
+def merge_lexical_index_list(indexes, validate_pipelines=True):
+    """
+    Merge lexical indexes in one pass over their groupings.
+
+    Pipelines keep their first definition; with validate_pipelines, a later
+    index defining a pipeline differently raises ValueError. The merged
+    groupings are in first-seen order (all of the first index's terms, then
+    the terms new in each later one), each with the relationships of every
+    index in index order, without functional duplicates.
+    """
+    merged_index = LexicalIndex()
+    for index in indexes:
+        for name, pipeline in index.pipelines.items():
+            if name not in merged_index.pipelines:
+                merged_index.pipelines[name] = pipeline
+            elif validate_pipelines and not are_pipelines_compatible(merged_index.pipelines[name], pipeline):
+                raise ValueError(
+                    f"Pipeline '{name}' is defined differently in the indexes being merged. "
+                    "Set validate_pipelines=False to override this check."
+                )
+
+    relationships_by_term = {}
+    for index in indexes:
+        for term, grouping in index.groupings.items():
+            relationships_by_term.setdefault(term, []).extend(grouping.relationships)
+    for term, relationships in relationships_by_term.items():
+        merged_index.groupings[term] = LexicalGrouping(term=term)
+        merged_index.groupings[term].relationships = unique_relationships(relationships)
+    return merged_index
+
+
+def merge_lexical_indexes(index1, index2, validate_pipelines=True):
+    """
+    Merge two lexical indexes ensuring pipeline compatibility.
+    """
+    return merge_lexical_index_list([index1, index2], validate_pipelines)
+
+
+def build_ontology_index(adapter_string, include_obsoletes=False):
+    """
+    Build one ontology's punctuation-insensitive index, optionally with its obsolete terms.
+    """
+    oi = get_adapter(adapter_string)
+    print(f"Creating {adapter_string} punctuation-insensitive index...")
+    lexical_index = create_punctuation_insensitive_index(oi)
+    if include_obsoletes:
+        print(f"Adding obsolete {adapter_string} terms...")
+        lexical_index = add_obsolete_terms_to_lexical_index(oi, lexical_index)
+    return lexical_index
+
+
+def build_indexes(specs, workers=None):
+    """
+    Build the index for each (adapter string, include_obsoletes) spec, in spec order.
+
+    Each ontology is indexed in its own worker process, up to workers at a
+    time (default: one per spec, capped at the CPU count). With one worker
+    everything runs inline.
+    """
+    specs = list(specs)
+    workers = workers or min(len(specs), os.cpu_count() or 1)
+    if workers <= 1 or len(specs) <= 1:
+        return [build_ontology_index(adapter_string, include_obsoletes) for adapter_string, include_obsoletes in specs]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(build_ontology_index, adapter_string, include_obsoletes)
+                   for adapter_string, include_obsoletes in specs]
+        return [future.result() for future in futures]
+
+
+def build_expanded_lexical_index(envo_adapter_string=ENVO_ADAPTER_STRING, po_adapter_string=PO_ADAPTER_STRING,
+                                 extra_adapter_strings=(), workers=None):
+    """
+    Build the merged, punctuation-insensitive ENVO (including obsoletes), PO and extra-ontology lexical index.
+    """
+    # (If you wish to add obsolete terms for PO or the extra ontologies as well, set their include_obsoletes.)
+    specs = [(envo_adapter_string, True), (po_adapter_string, False)]
+    specs += [(adapter_string, False) for adapter_string in extra_adapter_strings]
+    indexes = build_indexes(specs, workers)
+
+    # Merge the indices.
+    try:
+        return merge_lexical_index_list(indexes, validate_pipelines=True)
+    except ValueError as e:
+        print(f"Merging failed: {e}\nProceeding with pipeline validation disabled.")
+        return merge_lexical_index_list(indexes, validate_pipelines=False)
+
+
+def write_binary_index_cache(lexical_index, cache_file, source_paths, adapter_strings=()):
+    """Compile the index and write it to the binary cache the annotator loads."""
+    automaton = LexicalAutomaton.from_lexical_index(lexical_index)
+    write_index_cache(cache_file, automaton, build_element_to_label_map(lexical_index), source_paths,
+                      adapter_strings)
+    print(f"Binary lexical index cache ({len(automaton)} keys) saved to {cache_file}")
+
+
 @click.command()
 @click.option("--envo-adapter", "envo_adapter_string", default=ENVO_ADAPTER_STRING,
               show_default=True, help="oaklib adapter string for ENVO.")
 @click.option("--po-adapter", "po_adapter_string", default=PO_ADAPTER_STRING,
               show_default=True, help="oaklib adapter string for PO.")
+@click.option("--extra-adapter", "extra_adapter_strings", multiple=True,
+              help="oaklib adapter string of another ontology to merge in, e.g. sqlite:obo:uberon. Repeatable.")
+@click.option("--workers", type=click.IntRange(min=1), default=None,
+              help="Ontologies indexed concurrently [default: one per ontology, up to the CPU count].")
 @click.option("--output", "output_file", default="expanded_envo_po_lexical_index.yaml",
               show_default=True, help="Path of the merged lexical index YAML to write.")
-def main(envo_adapter_string, po_adapter_string, output_file):
+@click.option("--cache-output", "cache_file", default=DEFAULT_INDEX_CACHE, show_default=True,
+              help="Path of the binary index cache to write alongside the YAML ('' to skip).")
+def main(envo_adapter_string, po_adapter_string, extra_adapter_strings, workers, output_file, cache_file):
     """Combine punctuation-insensitive ENVO and PO lexical indices into one YAML."""
-    # Obtain ontology adapters.
-    envo_adapter = get_adapter(envo_adapter_string)
-    po_adapter = get_adapter(po_adapter_string)
-
-    # Create punctuation-insensitive lexical indices for each ontology.
-    print("Creating ENVO punctuation-insensitive index...")
-    envo_index = create_punctuation_insensitive_index(envo_adapter)
-    print("Adding obsolete ENVO terms...")
-    envo_index = add_obsolete_terms_to_lexical_index(envo_adapter, envo_index)
-
-    print("Creating PO punctuation-insensitive index...")
-    po_index = create_punctuation_insensitive_index(po_adapter)
-    # (If you wish to add obsolete terms for PO as well, you can call add_obsolete_terms_to_lexical_index for PO.)
-
-    # Merge the two indices.
-    try:
-        merged_index = merge_lexical_indexes(envo_index, po_index, validate_pipelines=True)
-    except ValueError as e:
-        print(f"Merging failed: {e}\nProceeding with pipeline validation disabled.")
-        merged_index = merge_lexical_indexes(envo_index, po_index, validate_pipelines=False)
+    merged_index = build_expanded_lexical_index(envo_adapter_string, po_adapter_string,
+                                                extra_adapter_strings, workers)
 
     # Save the merged lexical index to a YAML file.
     save_lexical_index(merged_index, output_file)
     print(f"Merged lexical index saved to {output_file}")
 
+    if cache_file:
+        adapter_strings = (envo_adapter_string, po_adapter_string) + tuple(extra_adapter_strings)
+        source_paths = [get_adapter(adapter_string).engine.url.database for adapter_string in adapter_strings]
+        write_binary_index_cache(merged_index, cache_file, source_paths + [output_file], adapter_strings)
+
 
 if __name__ == "__main__":
     main()
@@ -2,13 +2,17 @@
 import os
 import re
 import csv
+import hashlib
 import json
+import sqlite3
 import click
 import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timezone
+from itertools import pairwise
 from dotenv import dotenv_values
 from tqdm import tqdm
-from pymongo import MongoClient
+from pymongo import InsertOne, MongoClient, ReplaceOne, UpdateOne
 from pymongo.uri_parser import parse_uri
 from linkml_runtime import SchemaView
 from oaklib import get_adapter
@@ -66,7 +70,171 @@ def _restore_secondary_indexes(collection, specs):
 # =============================================================================
 # FETCH NMDC SUBMISSIONS FROM THE API
 # =============================================================================
-def fetch_nmdc_submissions(mongo_url, env_path, base_url="https://data.microbiomedata.org"):
+def submission_write_op(doc):
+    """
+    Returns the bulk write op that upserts one submission.
+
+    Keyed on '_id' when present, otherwise on the API's 'id'; a document with
+    neither is inserted, as in the sequential loop.
+    """
+    if doc.get('_id') is not None:
+        return ReplaceOne({'_id': doc['_id']}, doc, upsert=True)
+    if doc.get('id') is not None:
+        return ReplaceOne({'id': doc['id']}, doc, upsert=True)
+    return InsertOne(doc)
+
+
+def fetch_submission_page(session, url_submissions, headers, offset, page_size, column_sort='created'):
+    """Fetch one page of submissions; returns the decoded JSON body or raises on a non-200 answer."""
+    params = {
+        'column_sort': column_sort,
+        'sort_order': 'desc',
+        'offset': offset,
+        'limit': page_size
+    }
+    response = session.get(url_submissions, headers=headers, params=params)
+    if response.status_code != 200:
+        raise requests.HTTPError(
+            f"Failed to fetch submissions at offset {offset}: {response.status_code}\n{response.text}")
+    return response.json()
+
+
+def fetch_submissions_concurrently(collection, url_submissions, headers, page_size=25, concurrency=8):
+    """
+    Fetch every submission page in parallel and upsert each page in one bulk write.
+
+    The first page supplies the total 'count'; the remaining offsets are
+    requested over a pooled keep-alive session by concurrency threads, and
+    each page is written with an unordered bulk_write of ReplaceOne ops as
+    soon as it arrives. Returns the number of submissions written.
+    """
+    written = 0
+
+    def upsert(data):
+        results = data.get('results', [])
+        if results:
+            collection.bulk_write([submission_write_op(doc) for doc in results], ordered=False)
+        return len(results)
+
+    with requests.Session() as session:
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=concurrency)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+
+        first_page = fetch_submission_page(session, url_submissions, headers, 0, page_size)
+        written += upsert(first_page)
+        total_count = first_page.get('count') or 0
+        offsets = range(page_size, total_count, page_size)
+        click.echo(f"{total_count} submissions reported; fetching {len(offsets)} more pages "
+                   f"with {concurrency} concurrent requests")
+
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            futures = [pool.submit(fetch_submission_page, session, url_submissions, headers, offset, page_size)
+                       for offset in offsets]
+            for future in as_completed(futures):
+                written += upsert(future.result())
+    return written
+
+
+# Incremental refresh bookkeeping: one document per submission id holding
+# the hash of the submission as last fetched (fetched_sha256), its
+# date_last_modified, and the hash each derived stage last processed
+# (flattened_sha256, rows_sha256, compliance_sha256). A stage is pending for
+# a submission while its hash differs from fetched_sha256.
+REFRESH_STATE_COLLECTION = 'nmdc_submissions_refresh_state'
+
+
+def submission_sha256(doc):
+    """Content hash of a submission as returned by the API."""
+    return hashlib.sha256(json.dumps(doc, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def fetch_changed_submissions(collection, state_collection, url_submissions, headers, page_size=25):
+    """
+    Fetch only the submissions modified since the last incremental fetch.
+
+    Pages are requested newest date_last_modified first and paging stops at
+    the first page reaching below the high-water mark, the newest
+    date_last_modified recorded in state_collection. Of the submissions
+    fetched, only those whose content hash differs from the recorded one are
+    upserted and marked pending for the derived stages. If the API returns
+    a page out of date_last_modified order, every page is read instead.
+    Returns the ids of the changed submissions.
+    """
+    newest = state_collection.find_one(
+        {'date_last_modified': {'$ne': None}}, sort=[('date_last_modified', -1)])
+    high_water_mark = newest['date_last_modified'] if newest else None
+    click.echo(f"High-water mark: {high_water_mark or 'none, fetching everything'}")
+    known_hashes = {doc['_id']: doc.get('fetched_sha256')
+                    for doc in state_collection.find({}, {'fetched_sha256': 1})}
+
+    changed = []
+    offset = 0
+    stop_at_mark = high_water_mark is not None
+    with requests.Session() as session:
+        while True:
+            data = fetch_submission_page(
+                session, url_submissions, headers, offset, page_size, column_sort='date_last_modified')
+            results = data.get('results', [])
+            if not results:
+                break
+
+            ops = []
+            state_ops = []
+            for doc in results:
+                digest = submission_sha256(doc)
+                api_id = doc.get('id')
+                if api_id is not None and known_hashes.get(api_id) == digest:
+                    continue
+                ops.append(submission_write_op(doc))
+                if api_id is not None:
+                    known_hashes[api_id] = digest
+                    changed.append(api_id)
+                    state_ops.append(UpdateOne(
+                        {'_id': api_id},
+                        {'$set': {'fetched_sha256': digest, 'date_last_modified': doc.get('date_last_modified')}},
+                        upsert=True))
+            if ops:
+                collection.bulk_write(ops, ordered=False)
+            if state_ops:
+                state_collection.bulk_write(state_ops, ordered=False)
+
+            offset += page_size
+            total_count = data.get('count')
+            if total_count and offset >= total_count:
+                break
+            dates = [doc.get('date_last_modified') or '' for doc in results]
+            if stop_at_mark and any(earlier < later for earlier, later in pairwise(dates)):
+                click.echo("API pages are not ordered by date_last_modified; reading every page.")
+                stop_at_mark = False
+            if stop_at_mark and dates[-1] < high_water_mark:
+                break
+    return changed
+
+
+def pending_submissions(db, stage_field):
+    """Returns {submission id: fetched hash} for submissions whose stage_field lags their fetched hash."""
+    return {
+        doc['_id']: doc['fetched_sha256']
+        for doc in db[REFRESH_STATE_COLLECTION].find(
+            {'$expr': {'$ne': ['$fetched_sha256', f'${stage_field}']}}, {'fetched_sha256': 1})
+    }
+
+
+def mark_stage_done(db, stage_field, pending):
+    """
+    Records that a stage has processed the given {submission id: hash} pairs.
+
+    A submission refetched with a new hash in the meantime stays pending.
+    """
+    ops = [UpdateOne({'_id': submission_id, 'fetched_sha256': digest}, {'$set': {stage_field: digest}})
+           for submission_id, digest in pending.items()]
+    if ops:
+        db[REFRESH_STATE_COLLECTION].bulk_write(ops, ordered=False)
+
+
+def fetch_nmdc_submissions(mongo_url, env_path, base_url="https://data.microbiomedata.org",
+                           page_size=25, concurrency=1, incremental=False):
     """
     Fetch NMDC submissions from the API and insert them into the MongoDB
     collection 'nmdc_submissions'.
@@ -76,6 +244,12 @@ def fetch_nmdc_submissions(mongo_url, env_path, base_url="https://data.microbiom
         env_path: Path to .env file containing NMDC_DATA_SUBMISSION_REFRESH_TOKEN.
         base_url: Portal base URL. Use "https://data-dev.microbiomedata.org"
                   for the dev environment.
+        page_size: Submissions requested per API page.
+        concurrency: Pages fetched at once. Above 1, pages are fetched in
+                     parallel and upserted with one bulk write per page
+                     (fetch_submissions_concurrently); 1 pages sequentially.
+        incremental: Fetch only submissions changed since the last
+                     incremental fetch (fetch_changed_submissions).
     """
     # Load environment variables from .env file
     env_vars = dotenv_values(env_path)
@@ -114,7 +288,7 @@ def fetch_nmdc_submissions(mongo_url, env_path, base_url="https://data.microbiom
         'column_sort': 'created',
         'sort_order': 'desc',
         'offset': 0,
-        'limit': 25
+        'limit': page_size
     }
 
     # Connect to MongoDB
@@ -124,6 +298,26 @@ def fetch_nmdc_submissions(mongo_url, env_path, base_url="https://data.microbiom
         db = client[db_name]
         collection = db['nmdc_submissions']
 
+        if incremental:
+            try:
+                changed = fetch_changed_submissions(
+                    collection, db[REFRESH_STATE_COLLECTION], url_submissions, headers, page_size)
+            except requests.HTTPError as e:
+                click.echo(str(e))
+                return False
+            click.echo(f"Upserted {len(changed)} changed submissions.")
+            return True
+
+        if concurrency > 1:
+            try:
+                written = fetch_submissions_concurrently(
+                    collection, url_submissions, headers, page_size, concurrency)
+            except requests.HTTPError as e:
+                click.echo(str(e))
+                return False
+            click.echo(f"Upserted {written} submissions.")
+            return True
+
         # Paginate through API results
         while True:
             click.echo(f"Request sent at: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
@@ -183,28 +377,76 @@ def build_ontology_adapters(ontology_names):
     return adapters
 
 
-def generate_label_cache(entities, adapter, ontology_name):
+LABEL_PREDICATE = "rdfs:label"
+DEFAULT_LABEL_CACHE_FILE = "ontology-label-cache.sqlite"
+
+_LABEL_CACHE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sources (ontology TEXT PRIMARY KEY, db_path TEXT NOT NULL,
+                                    size INTEGER NOT NULL, mtime REAL NOT NULL);
+CREATE TABLE IF NOT EXISTS labels (ontology TEXT NOT NULL, curie TEXT NOT NULL, label TEXT NOT NULL,
+                                   PRIMARY KEY (ontology, curie)) WITHOUT ROWID;
+"""
+
+
+def semsql_label_rows(db_path):
     """
-    Generates a label cache mapping CURIEs to their labels.
+    Yields (curie, label) for every rdfs:label statement in a semsql database.
+
+    One streaming query replaces an adapter.label() call per entity.
+    Blank nodes are skipped.
     """
-    temp_label_cache = {}
-    for curie in tqdm(entities, desc=f"Generating label cache for {ontology_name}"):
-        label = adapter.label(curie)
-        if label:
-            temp_label_cache[curie] = label
-    return temp_label_cache
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        yield from conn.execute(
+            "SELECT subject, value FROM statements WHERE predicate = ? AND value IS NOT NULL "
+            "AND subject NOT LIKE '\\_:%' ESCAPE '\\'",
+            (LABEL_PREDICATE,))
+    finally:
+        conn.close()
 
 
-def load_ontology_labels(ont_adapters):
+def refresh_label_cache(conn, semsql_paths):
     """
-    Aggregates label caches from multiple ontology adapters.
+    Brings the persistent label cache up to date with {ontology: semsql db path}.
+
+    An ontology's labels are reloaded only when its semsql file's path, size
+    or mtime differs from the one recorded when they were loaded.
     """
-    aggregated_label_cache = {}
-    for ontology, adapter in tqdm(ont_adapters.items(), desc="Loading ontology labels"):
-        entities = sorted(list(adapter.entities()))
-        tmp_cache = generate_label_cache(entities, adapter, ontology)
-        aggregated_label_cache.update(tmp_cache)
-    return aggregated_label_cache
+    conn.executescript(_LABEL_CACHE_SCHEMA)
+    loaded = {row[0]: tuple(row[1:]) for row in conn.execute("SELECT ontology, db_path, size, mtime FROM sources")}
+    for ontology, db_path in semsql_paths.items():
+        stat = os.stat(db_path)
+        stamp = (db_path, stat.st_size, stat.st_mtime)
+        if loaded.get(ontology) == stamp:
+            continue
+        conn.execute("DELETE FROM labels WHERE ontology = ?", (ontology,))
+        conn.executemany(
+            "INSERT OR IGNORE INTO labels (ontology, curie, label) VALUES (?, ?, ?)",
+            ((ontology, curie, label) for curie, label in semsql_label_rows(db_path)))
+        conn.execute("INSERT OR REPLACE INTO sources VALUES (?, ?, ?, ?)", (ontology,) + stamp)
+        conn.commit()
+        click.echo(f"Loaded {ontology} labels from {db_path}")
+
+
+def load_ontology_labels(ont_adapters, label_cache_file=DEFAULT_LABEL_CACHE_FILE):
+    """
+    Aggregates CURIE-to-label maps from multiple semsql ontology adapters.
+
+    Labels are read in bulk from each adapter's semsql file and kept in the
+    SQLite file label_cache_file, which later runs reuse until an ontology
+    file changes. An empty label_cache_file keeps the cache in memory only.
+    """
+    semsql_paths = {ontology: adapter.engine.url.database for ontology, adapter in ont_adapters.items()}
+    conn = sqlite3.connect(label_cache_file or ":memory:")
+    try:
+        refresh_label_cache(conn, semsql_paths)
+        aggregated_label_cache = {}
+        for ontology in semsql_paths:
+            aggregated_label_cache.update(
+                conn.execute("SELECT curie, label FROM labels WHERE ontology = ?", (ontology,)))
+        return aggregated_label_cache
+    finally:
+        conn.close()
 
 
 def parse_label_curie(text):
@@ -291,12 +533,45 @@ def flatten_sample(sample):
 # =============================================================================
 # MONGODB PROCESSING & TSV EXPORT
 # =============================================================================
-def process_submissions(mongo_url, output_file):
+# Fields check_value_set_compliance adds to flattened_submission_biosamples;
+# left out of the TSV, which holds what process_submissions produces.
+COMPLIANCE_FIELDS = ['value_set_enum_suffix'] + [
+    f"{slot}_in_value_set" for slot in ("env_broad_scale", "env_local_scale", "env_medium")]
+
+
+def write_biosamples_tsv(submission_biosamples, output_file):
+    """Writes flattened samples to a TSV file with sorted columns."""
+    all_keys = set()
+    for sample in submission_biosamples:
+        all_keys.update(sample.keys())
+    all_keys = sorted(all_keys)
+    with open(output_file, 'w', newline='', encoding='utf-8') as tsvfile:
+        writer = csv.DictWriter(tsvfile, fieldnames=all_keys, delimiter='\t')
+        writer.writeheader()
+        writer.writerows(submission_biosamples)
+    click.echo(f"TSV file '{output_file}' written successfully.")
+
+
+def process_submissions(mongo_url, output_file, label_cache_file=DEFAULT_LABEL_CACHE_FILE, incremental=False):
     """
     Processes the NMDC submissions stored in MongoDB, performs flattening,
     environmental context parsing and label checks, then exports to TSV and
     inserts the flattened documents into a target collection.
+
+    With incremental, only submissions pending in the refresh state are
+    processed: their flattened documents are replaced in place, and the TSV
+    is re-exported from the whole collection.
     """
+    pending = None
+    if incremental:
+        with MongoClient(mongo_url) as client:
+            db_name = parse_uri(mongo_url).get('database') or 'misc_metadata'
+            pending = pending_submissions(client[db_name], 'flattened_sha256')
+        if not pending:
+            click.echo("No submissions changed since they were last processed.")
+            return True
+        click.echo(f"Processing {len(pending)} changed submissions.")
+
     # Load schema and setup ontology variables
     nmdc_schema_url = (
         "https://raw.githubusercontent.com/microbiomedata/nmdc-schema/refs/heads/main/nmdc_schema/nmdc_materialized_patterns.yaml"
@@ -319,7 +594,7 @@ def process_submissions(mongo_url, output_file):
     # Build ontology adapters and load labels/obsolete terms
     ontology_list = ["envo", "pato", "uberon", "po"]
     ontology_adapters = build_ontology_adapters(ontology_list)
-    label_cache = load_ontology_labels(ontology_adapters)
+    label_cache = load_ontology_labels(ontology_adapters, label_cache_file)
     obsolete_terms_set = set(find_obsolete_terms(ontology_adapters))
 
     # Connect to MongoDB
@@ -334,8 +609,9 @@ def process_submissions(mongo_url, output_file):
             'emsl_data', 'host_associated_data', 'jgi_mg_data', 'jgi_mg_lr_data', 'jgi_mt_data'
         ]
 
-        total_docs = submissions_collection.count_documents({})
-        for doc in tqdm(submissions_collection.find(), total=total_docs, desc="Processing submissions"):
+        query = {} if pending is None else {'id': {'$in': list(pending)}}
+        total_docs = submissions_collection.count_documents(query)
+        for doc in tqdm(submissions_collection.find(query), total=total_docs, desc="Processing submissions"):
             if 'metadata_submission' in doc and 'sampleData' in doc['metadata_submission']:
                 sample_data = doc['metadata_submission']['sampleData']
                 for key, sample_list in tqdm(sample_data.items(), total=len(sample_data),
@@ -385,20 +661,26 @@ def process_submissions(mongo_url, output_file):
                     # Check if parsed label matches canonical label
                     sample[f"{field}_match"] = (parsed["label"] == sample.get(f"{field}_canonical_label"))
 
+        flattened_collection_name = 'flattened_submission_biosamples'
+        if pending is not None:
+            # Patch the changed submissions' samples in place, then export the
+            # whole collection so the TSV matches a full run.
+            flattened_collection = submissions_db[flattened_collection_name]
+            deleted = flattened_collection.delete_many({'submission_id': {'$in': list(pending)}})
+            if submission_biosamples:
+                flattened_collection.insert_many(submission_biosamples)
+            mark_stage_done(submissions_db, 'flattened_sha256', pending)
+            click.echo(f"Replaced {deleted.deleted_count} with {len(submission_biosamples)} documents "
+                       f"in '{flattened_collection_name}'.")
+            projection = dict.fromkeys(['_id'] + COMPLIANCE_FIELDS, 0)
+            write_biosamples_tsv(list(flattened_collection.find({}, projection)), output_file)
+            return True
+
         # Write flattened samples to a TSV file with sorted columns
         if submission_biosamples:
-            all_keys = set()
-            for sample in submission_biosamples:
-                all_keys.update(sample.keys())
-            all_keys = sorted(all_keys)
-            with open(output_file, 'w', newline='', encoding='utf-8') as tsvfile:
-                writer = csv.DictWriter(tsvfile, fieldnames=all_keys, delimiter='\t')
-                writer.writeheader()
-                writer.writerows(submission_biosamples)
-            click.echo(f"TSV file '{output_file}' written successfully.")
+            write_biosamples_tsv(submission_biosamples, output_file)
 
         # Insert flattened samples into the target collection
-        flattened_collection_name = 'flattened_submission_biosamples'
         if submission_biosamples:
             unique_suffix = datetime.now(timezone.utc).strftime("%Y%m%d%H%M%S%f")
             temp_collection_name = f"{flattened_collection_name}_tmp_{unique_suffix}_{os.getpid()}"
@@ -437,12 +719,15 @@ def process_submissions(mongo_url, output_file):
 # =============================================================================
 # BIOSAMPLE ROWS TRANSFORMATION (AS IN THE NOTEBOOK)
 # =============================================================================
-def create_biosample_rows(mongo_url):
+def create_biosample_rows(mongo_url, incremental=False):
     """
     Transforms each submission's sampleData into individual biosample rows.
     Each row document includes the submission_id, the key (template name),
     and a list of field/value pairs from the row.
     Inserts the resulting documents into the collection 'submission_biosample_rows'.
+
+    With incremental, only the rows of submissions pending in the refresh
+    state are replaced.
     """
     with MongoClient(mongo_url) as client:
         # Use provided database or default to 'misc_metadata'
@@ -450,9 +735,15 @@ def create_biosample_rows(mongo_url):
         db = client[db_name]
         submissions_collection = db['nmdc_submissions']
         biosample_rows = []
-        total_docs = submissions_collection.count_documents({})
 
-        for record in tqdm(submissions_collection.find(), total=total_docs, desc="Creating biosample rows"):
+        pending = pending_submissions(db, 'rows_sha256') if incremental else None
+        if pending is not None and not pending:
+            click.echo("No submissions changed since their rows were last created.")
+            return True
+        query = {} if pending is None else {'id': {'$in': list(pending)}}
+        total_docs = submissions_collection.count_documents(query)
+
+        for record in tqdm(submissions_collection.find(query), total=total_docs, desc="Creating biosample rows"):
             submission_id = record.get('id', 'N/A')
             sample_data = record.get('metadata_submission', {}).get('sampleData', {})
             for key, rows in sample_data.items():
@@ -466,10 +757,15 @@ def create_biosample_rows(mongo_url):
                         biosample_rows.append(transformed_doc)
 
         biosample_rows_collection = db["submission_biosample_rows"]
-        biosample_rows_collection.delete_many({})  # Clear existing data
+        if pending is None:
+            biosample_rows_collection.delete_many({})  # Clear existing data
+        else:
+            biosample_rows_collection.delete_many({'submission_id': {'$in': list(pending)}})
         if biosample_rows:
             result = biosample_rows_collection.insert_many(biosample_rows)
             click.echo(f"Inserted {len(result.inserted_ids)} documents into 'submission_biosample_rows' collection.")
+        if pending is not None:
+            mark_stage_done(db, 'rows_sha256', pending)
 
     return True
 
@@ -555,7 +851,7 @@ def load_submission_schema_enums():
     return enum_lookup
 
 
-def check_value_set_compliance(mongo_url):
+def check_value_set_compliance(mongo_url, incremental=False):
     """
     For each document in flattened_submission_biosamples, check whether the
     env_broad_scale, env_local_scale, and env_medium values are in the
@@ -568,6 +864,9 @@ def check_value_set_compliance(mongo_url):
         value_set_enum_suffix: the CamelCase suffix used for lookup (e.g. "Soil")
 
     None means no enum exists for that extension+slot combination.
+
+    With incremental, only the documents of submissions pending in the
+    refresh state are checked.
     """
     click.echo("Loading submission schema enums...")
     enum_lookup = load_submission_schema_enums()
@@ -579,9 +878,11 @@ def check_value_set_compliance(mongo_url):
         db = client[db_name]
         collection = db['flattened_submission_biosamples']
 
-        total = collection.count_documents({})
+        pending = pending_submissions(db, 'compliance_sha256') if incremental else None
+        query = {} if pending is None else {'submission_id': {'$in': list(pending)}}
+        total = collection.count_documents(query)
         updated = 0
-        for doc in tqdm(collection.find(), total=total, desc="Checking value set compliance"):
+        for doc in tqdm(collection.find(query), total=total, desc="Checking value set compliance"):
             sample_data_key = doc.get('sampleData')
             suffix = SAMPLE_DATA_KEY_TO_ENUM_SUFFIX.get(sample_data_key)
 
@@ -606,6 +907,8 @@ def check_value_set_compliance(mongo_url):
 
             collection.update_one({"_id": doc["_id"]}, {"$set": updates})
             updated += 1
+        if pending:
+            mark_stage_done(db, 'compliance_sha256', pending)
 
     click.echo(f"Updated {updated} documents with value set compliance fields.")
     return True
@@ -631,13 +934,22 @@ def cli():
 
 _ENV_PATH_HELP = ('Path to .env file. Holds NMDC_DATA_SUBMISSION_REFRESH_TOKEN'
                   ' and per-env config (MONGO_URI, BASE_URL, OUTPUT_FILE).')
+_PAGE_SIZE_HELP = 'Submissions requested per API page'
+_CONCURRENCY_HELP = 'API pages fetched in parallel and bulk-upserted (1 fetches sequentially)'
+_INCREMENTAL_HELP = (f'Only handle submissions changed since the last incremental run'
+                     f' (tracked in {REFRESH_STATE_COLLECTION}).')
+_LABEL_CACHE_HELP = ('SQLite file of ontology labels, reused until a semsql file changes.'
+                     ' Pass "" to keep labels in memory only.')
 
 
 @cli.command('fetch')
 @click.option('--env-path', required=True, help=_ENV_PATH_HELP)
 @click.option('--mongo-url', default=None, help='Overrides MONGO_URI from env file')
 @click.option('--base-url', default=None, help='Overrides BASE_URL from env file')
-def fetch_cmd(env_path, mongo_url, base_url):
+@click.option('--page-size', default=25, show_default=True, type=click.IntRange(min=1), help=_PAGE_SIZE_HELP)
+@click.option('--concurrency', default=1, show_default=True, type=click.IntRange(min=1), help=_CONCURRENCY_HELP)
+@click.option('--incremental', is_flag=True, help=_INCREMENTAL_HELP)
+def fetch_cmd(env_path, mongo_url, base_url, page_size, concurrency, incremental):
     """Fetch NMDC submissions from the API and store in MongoDB."""
     cfg = resolve_env_config(env_path, mongo_uri=mongo_url, base_url=base_url)
     if not cfg['MONGO_URI']:
@@ -646,7 +958,7 @@ def fetch_cmd(env_path, mongo_url, base_url):
         )
     base = cfg['BASE_URL'] or 'https://data.microbiomedata.org'
     click.echo(f"Fetching NMDC submissions from {base} ...")
-    success = fetch_nmdc_submissions(cfg['MONGO_URI'], env_path, base)
+    success = fetch_nmdc_submissions(cfg['MONGO_URI'], env_path, base, page_size, concurrency, incremental)
     if success:
         click.echo("Submissions fetched successfully.")
     else:
@@ -656,10 +968,13 @@ def fetch_cmd(env_path, mongo_url, base_url):
 @cli.command('process')
 @click.option('--mongo-url', required=True, help='MongoDB connection URL')
 @click.option('--output-file', default='flattened_submission_biosamples.tsv', help='Output TSV file path')
-def process_cmd(mongo_url, output_file):
+@click.option('--label-cache-file', default=DEFAULT_LABEL_CACHE_FILE, show_default=True,
+              help=_LABEL_CACHE_HELP)
+@click.option('--incremental', is_flag=True, help=_INCREMENTAL_HELP)
+def process_cmd(mongo_url, output_file, label_cache_file, incremental):
     """Process submissions to create flattened biosamples and export to TSV."""
     click.echo("Processing submissions...")
-    success = process_submissions(mongo_url, output_file)
+    success = process_submissions(mongo_url, output_file, label_cache_file, incremental)
     if success:
         click.echo(f"Processed submissions successfully. Output written to {output_file}")
     else:
@@ -668,10 +983,11 @@ def process_cmd(mongo_url, output_file):
 
 @cli.command('create-rows')
 @click.option('--mongo-url', required=True, help='MongoDB connection URL')
-def create_rows_cmd(mongo_url):
+@click.option('--incremental', is_flag=True, help=_INCREMENTAL_HELP)
+def create_rows_cmd(mongo_url, incremental):
     """Transform submissions into individual biosample rows."""
     click.echo("Creating biosample rows...")
-    success = create_biosample_rows(mongo_url)
+    success = create_biosample_rows(mongo_url, incremental)
     if success:
         click.echo("Biosample rows created successfully.")
     else:
@@ -692,10 +1008,11 @@ def aggregate_cmd(mongo_url):
 
 @cli.command('check-compliance')
 @click.option('--mongo-url', required=True, help='MongoDB connection URL')
-def check_compliance_cmd(mongo_url):
+@click.option('--incremental', is_flag=True, help=_INCREMENTAL_HELP)
+def check_compliance_cmd(mongo_url, incremental):
     """Check env triad values against submission schema value sets."""
     click.echo("Checking value set compliance...")
-    success = check_value_set_compliance(mongo_url)
+    success = check_value_set_compliance(mongo_url, incremental)
     if success:
         click.echo("Value set compliance check completed successfully.")
     else:
@@ -707,7 +1024,12 @@ def check_compliance_cmd(mongo_url):
 @click.option('--mongo-url', default=None, help='Overrides MONGO_URI from env file')
 @click.option('--output-file', default=None, help='Overrides OUTPUT_FILE from env file')
 @click.option('--base-url', default=None, help='Overrides BASE_URL from env file')
-def run_all_cmd(env_path, mongo_url, output_file, base_url):
+@click.option('--page-size', default=25, show_default=True, type=click.IntRange(min=1), help=_PAGE_SIZE_HELP)
+@click.option('--concurrency', default=1, show_default=True, type=click.IntRange(min=1), help=_CONCURRENCY_HELP)
+@click.option('--label-cache-file', default=DEFAULT_LABEL_CACHE_FILE, show_default=True,
+              help=_LABEL_CACHE_HELP)
+@click.option('--incremental', is_flag=True, help=_INCREMENTAL_HELP)
+def run_all_cmd(env_path, mongo_url, output_file, base_url, page_size, concurrency, label_cache_file, incremental):
     """Run the complete extraction and processing pipeline."""
     cfg = resolve_env_config(
         env_path,
@@ -726,17 +1048,17 @@ def run_all_cmd(env_path, mongo_url, output_file, base_url):
     click.echo(f"Running the complete pipeline against {base_url} ...")
 
     click.echo("\n1. Fetching submissions...")
-    if not fetch_nmdc_submissions(mongo_url, env_path, base_url):
+    if not fetch_nmdc_submissions(mongo_url, env_path, base_url, page_size, concurrency, incremental):
         click.echo("Failed to fetch submissions. Aborting pipeline.")
         return
 
     click.echo("\n2. Processing submissions...")
-    if not process_submissions(mongo_url, output_file):
+    if not process_submissions(mongo_url, output_file, label_cache_file, incremental):
         click.echo("Failed to process submissions. Aborting pipeline.")
         return
 
     click.echo("\n3. Creating biosample rows...")
-    if not create_biosample_rows(mongo_url):
+    if not create_biosample_rows(mongo_url, incremental):
         click.echo("Failed to create biosample rows. Aborting pipeline.")
         return
 
@@ -746,7 +1068,7 @@ def run_all_cmd(env_path, mongo_url, output_file, base_url):
         return
 
     click.echo("\n5. Checking value set compliance...")
-    if not check_value_set_compliance(mongo_url):
+    if not check_value_set_compliance(mongo_url, incremental):
         click.echo("Failed to check value set compliance. Aborting pipeline.")
         return
 
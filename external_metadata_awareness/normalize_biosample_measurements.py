@@ -6,14 +6,13 @@
 import datetime
 import sys
 import time
-from copy import deepcopy
 
 import click
-from pymongo import uri_parser
-from quantulum3 import parser
+from pymongo import InsertOne, UpdateOne, uri_parser
 from tqdm import tqdm
 
 from external_metadata_awareness.mongodb_connection import get_mongo_client
+from external_metadata_awareness.quantulum_parse_cache import DEFAULT_PARSE_CACHE, open_parse_cache, parse_quantities
 
 # these don't appear as a harmonized name attribute at all
 
@@ -189,7 +188,25 @@ def format_quantity_value(q):
         return f"{q['value']} {unit_name}".strip()
 
 
-def aggregate_measurements(client, db_name, input_collection, output_collection, field_name, extra_verbose, overwrite):
+def flush_bulk(collection, ops):
+    """Send queued write ops as one unordered bulk_write and empty the queue."""
+    if ops:
+        collection.bulk_write(ops, ordered=False)
+        ops.clear()
+
+
+def value_doc(field_name, value, count):
+    """Output document for one distinct value of one field."""
+    return {
+        "_id": f"{field_name}:{value}",  # Namespace the ID to avoid collisions
+        "original_value": value,
+        "harmonized_name": field_name,
+        "count": count
+    }
+
+
+def aggregate_measurements(client, db_name, input_collection, output_collection, field_name, extra_verbose, overwrite,
+                           batch_size=1000):
     """Aggregate measurements from the specified field."""
     db = client[db_name]
 
@@ -244,23 +261,87 @@ def aggregate_measurements(client, db_name, input_collection, output_collection,
     # Insert documents with the harmonized_name field
     click.echo(
         f"[{timestamp()}] Adding {len(result)} documents for field '{field_name}' to collection '{output_collection}'...")
+    ops = []
     with tqdm(total=len(result), desc=f"[{timestamp()}] Inserting documents", unit="doc") as pbar:
         for doc in result:
-            db[output_collection].insert_one({
-                "_id": f"{field_name}:{doc['_id']}",  # Namespace the ID to avoid collisions
-                "original_value": doc["_id"],
-                "harmonized_name": field_name,
-                "count": doc["count"]
-            })
-            pbar.update(1)
+            ops.append(InsertOne(value_doc(field_name, doc["_id"], doc["count"])))
+            if len(ops) >= batch_size:
+                pbar.update(len(ops))
+                flush_bulk(db[output_collection], ops)
+        pbar.update(len(ops))
+        flush_bulk(db[output_collection], ops)
 
     click.echo(
         f"[{timestamp()}] Successfully added {len(result)} documents for field '{field_name}' to collection '{output_collection}'")
     return field_name
 
 
-def parse_measurements(client, db_name, collection_name, field_name, extra_verbose):
-    """Parse measurements using quantulum3."""
+def aggregate_all_measurements(client, db_name, input_collection, output_collection, field_names, overwrite,
+                               batch_size=1000):
+    """Aggregate the distinct values of many fields with a single $group over the input collection.
+
+    Used by --all-harmonized-names: one pass with $objectToArray replaces an
+    index build, aggregation and index drop per field. Returns the fields that
+    were aggregated (fields already in the output are skipped unless overwrite).
+    """
+    db = client[db_name]
+    output_col = db[output_collection]
+
+    click.echo(f"[{timestamp()}] Step 1: Aggregating unique values for {len(field_names)} fields "
+               f"from collection '{input_collection}' in one pass...")
+
+    if input_collection not in db.list_collection_names():
+        click.echo(
+            f"[{timestamp()}] Error: Input collection '{input_collection}' does not exist in database '{db_name}'",
+            err=True)
+        sys.exit(1)
+
+    existing = {doc["_id"]: doc["count"] for doc in output_col.aggregate([
+        {"$match": {"harmonized_name": {"$in": list(field_names)}}},
+        {"$group": {"_id": "$harmonized_name", "count": {"$sum": 1}}},
+    ])}
+    if existing:
+        if overwrite:
+            click.echo(f"[{timestamp()}] Removing {sum(existing.values())} existing documents for "
+                       f"{len(existing)} fields from '{output_collection}'...")
+            output_col.delete_many({"harmonized_name": {"$in": list(existing)}})
+        else:
+            click.echo(f"[{timestamp()}] Warning: {len(existing)} fields already exist in '{output_collection}'; "
+                       f"skipping them. Use --overwrite to replace existing data.")
+            field_names = [f for f in field_names if f not in existing]
+    if not field_names:
+        return []
+
+    pipeline = [
+        {"$project": {"kv": {"$objectToArray": "$$ROOT"}}},
+        {"$unwind": "$kv"},
+        {"$match": {"kv.k": {"$in": list(field_names)}, "kv.v": {"$ne": None}}},
+        {"$group": {"_id": {"field": "$kv.k", "value": "$kv.v"}, "count": {"$sum": 1}}},
+    ]
+
+    click.echo(f"[{timestamp()}] Running aggregation pipeline...")
+    start_time = time.time()
+    ops = []
+    inserted = 0
+    with tqdm(desc=f"[{timestamp()}] Inserting documents", unit="doc") as pbar:
+        for doc in db[input_collection].aggregate(pipeline, allowDiskUse=True):
+            ops.append(InsertOne(value_doc(doc["_id"]["field"], doc["_id"]["value"], doc["count"])))
+            if len(ops) >= batch_size:
+                inserted += len(ops)
+                pbar.update(len(ops))
+                flush_bulk(output_col, ops)
+        inserted += len(ops)
+        pbar.update(len(ops))
+        flush_bulk(output_col, ops)
+
+    click.echo(f"[{timestamp()}] Added {inserted} documents for {len(field_names)} fields to "
+               f"'{output_collection}' in {time.time() - start_time:.2f} seconds")
+    return field_names
+
+
+def parse_measurements(client, db_name, collection_name, field_name, extra_verbose, parse_cache=None,
+                       batch_size=1000):
+    """Parse measurements using quantulum3, through parse_cache when one is given."""
     db = client[db_name]
     col = db[collection_name]
 
@@ -273,6 +354,7 @@ def parse_measurements(client, db_name, collection_name, field_name, extra_verbo
 
     parsed_count = 0
     skipped_count = 0
+    ops = []
 
     # Iterate over documents with progress bar
     with tqdm(total=total_docs, desc=f"[{timestamp()}] Parsing measurements", unit="doc") as pbar:
@@ -280,7 +362,10 @@ def parse_measurements(client, db_name, collection_name, field_name, extra_verbo
             raw_val = doc["original_value"]
 
             try:
-                parsed = parser.parse(str(raw_val))  # Ensure it's a string
+                if parse_cache is not None:
+                    parsed = parse_cache.parse(str(raw_val))  # Ensure it's a string
+                else:
+                    parsed = parse_quantities(raw_val)
             except Exception as e:
                 if extra_verbose:
                     click.echo(f"[{timestamp()}] Error parsing '{raw_val}': {str(e)}")
@@ -295,34 +380,9 @@ def parse_measurements(client, db_name, collection_name, field_name, extra_verbo
                 pbar.update(1)
                 continue
 
-            # Convert Quantity objects to JSON-serializable dicts
-            parsed_dicts = []
-            for q in parsed:
-                try:
-                    # Create a copy of the object's dict
-                    q_dict = deepcopy(q.__dict__)
-
-                    # Convert unit object to a simple dictionary
-                    if 'unit' in q_dict and hasattr(q_dict['unit'], 'name'):
-                        q_dict['unit'] = {
-                            'name': q_dict['unit'].name,
-                            'entity': q_dict['unit'].entity.name if hasattr(q_dict['unit'].entity, 'name') else str(
-                                q_dict['unit'].entity),
-                            'uri': str(q_dict['unit'].uri) if hasattr(q_dict['unit'], 'uri') else None
-                        }
-
-                    # Convert span tuple to list for better MongoDB compatibility
-                    if 'span' in q_dict and isinstance(q_dict['span'], tuple):
-                        q_dict['span'] = list(q_dict['span'])
-
-                    # Clean the dictionary
-                    cleaned_dict = clean_dict(q_dict)
-                    parsed_dicts.append(cleaned_dict)
-                except Exception as e:
-                    if extra_verbose:
-                        click.echo(f"[{timestamp()}] Error processing parsed result for '{raw_val}': {str(e)}")
-
-            # Remove any completely empty results
+            # Quantities arrive as JSON-serializable dicts (unit as {name, entity, uri},
+            # span as a list); drop their empty fields and any completely empty results
+            parsed_dicts = [clean_dict(q) for q in parsed]
             parsed_dicts = [pd for pd in parsed_dicts if pd]
 
             if parsed_dicts:
@@ -331,14 +391,14 @@ def parse_measurements(client, db_name, collection_name, field_name, extra_verbo
                     # Generate reconstructed values
                     reconstructed_values = [format_quantity_value(q) for q in parsed_dicts]
 
-                    # Update the document with parsed quantities
-                    col.update_one(
+                    # Queue the update with parsed quantities
+                    ops.append(UpdateOne(
                         {"_id": doc["_id"]},
                         {"$set": {
                             "parsed_quantity": parsed_dicts,
                             "reconstructed": reconstructed_values
                         }}
-                    )
+                    ))
                     parsed_count += 1
 
                     if extra_verbose:
@@ -346,15 +406,19 @@ def parse_measurements(client, db_name, collection_name, field_name, extra_verbo
                             f"[{timestamp()}] Successfully parsed '{raw_val}' → {', '.join(reconstructed_values)}")
                 except Exception as e:
                     if extra_verbose:
-                        click.echo(f"[{timestamp()}] Error updating document for '{raw_val}': {str(e)}")
+                        click.echo(f"[{timestamp()}] Error formatting parsed results for '{raw_val}': {str(e)}")
                     skipped_count += 1
             else:
                 skipped_count += 1
                 if extra_verbose:
                     click.echo(f"[{timestamp()}] No valid parsed results for '{raw_val}'")
 
+            if len(ops) >= batch_size:
+                flush_bulk(col, ops)
             pbar.update(1)
 
+    flush_bulk(col, ops)
+
     # Summary statistics
     if total_docs > 0:
         click.echo(f"[{timestamp()}] Parsing summary for field '{field_name}':")
@@ -379,7 +443,14 @@ def parse_measurements(client, db_name, collection_name, field_name, extra_verbo
 @click.option('-v', '--verbosity', type=click.Choice(['quiet', 'normal', 'verbose']), default='normal',
               help='Verbosity level')
 @click.option('--overwrite', is_flag=True, help='Overwrite existing data for the specified field(s)')
-def main(mongodb_uri, env_file, input_collection, output_collection, field, all_harmonized_names, verbosity, overwrite):
+@click.option('--parse-cache', default=DEFAULT_PARSE_CACHE, show_default=True,
+              help='SQLite file of quantulum3 parses shared with measurement-discovery-efficient; '
+                   'values parsed by an earlier run are not parsed again. Pass an empty string to disable.')
+@click.option('--batch-size', default=1000, show_default=True, type=click.IntRange(min=1),
+              help='Inserts/updates sent to MongoDB per unordered bulk_write')
+def main(mongodb_uri, env_file, input_collection, output_collection, field, all_harmonized_names, verbosity, overwrite,
+         parse_cache, batch_size):
+    parse_cache = open_parse_cache(parse_cache)
     try:
         is_quiet = verbosity == 'quiet'
         is_verbose = verbosity == 'verbose'
@@ -451,55 +522,68 @@ def main(mongodb_uri, env_file, input_collection, output_collection, field, all_
         fields_processed = 0
         total_parsed = 0
 
-        for i, current_field in enumerate(field, 1):
-            if not is_quiet:
-                click.echo(f"[{timestamp()}] ============================================================")
-                click.echo(f"[{timestamp()}] Processing field {i}/{len(field)}: '{current_field}'")
-
-            # Quick pre-check to avoid unnecessary indexing
-            quick_count = input_col.count_documents({current_field: {"$exists": True, "$ne": None}})
-            if quick_count == 0:
-                click.echo(f"[{timestamp()}] ⚠️  Field '{current_field}' has no documents - skipping (should not happen after diagnostics)")
-                continue
-
-            click.echo(f"[{timestamp()}] Field '{current_field}' has {quick_count:,} documents with content")
-            click.echo(f"[{timestamp()}] Creating index on '{current_field}' in '{input_collection}'...")
-
-            field_start_time = time.time()
-            ensure_index(input_col, current_field)
-
-            # Step 1: Aggregate
-            processed_field = aggregate_measurements(
-                client, db_name, input_collection, output_collection,
-                current_field, is_verbose, overwrite
-            )
-
-            if processed_field is None:
-                click.echo(f"[{timestamp()}] Skipping field '{current_field}' (likely due to overwrite=False)")
-                continue
-
+        if all_harmonized_names:
+            # Step 1 for every field in one $group, no per-field indexes; then Step 2 per field
+            aggregated_fields = aggregate_all_measurements(
+                client, db_name, input_collection, output_collection, field, overwrite, batch_size)
             ensure_index(output_col, "harmonized_name")
+            for i, current_field in enumerate(aggregated_fields, 1):
+                if not is_quiet:
+                    click.echo(f"[{timestamp()}] ============================================================")
+                    click.echo(f"[{timestamp()}] Parsing field {i}/{len(aggregated_fields)}: '{current_field}'")
+                total_parsed += parse_measurements(
+                    client, db_name, output_collection, current_field, is_verbose, parse_cache, batch_size)
+                fields_processed += 1
+        else:
+            for i, current_field in enumerate(field, 1):
+                if not is_quiet:
+                    click.echo(f"[{timestamp()}] ============================================================")
+                    click.echo(f"[{timestamp()}] Processing field {i}/{len(field)}: '{current_field}'")
+
+                # Quick pre-check to avoid unnecessary indexing
+                quick_count = input_col.count_documents({current_field: {"$exists": True, "$ne": None}})
+                if quick_count == 0:
+                    click.echo(f"[{timestamp()}] ⚠️  Field '{current_field}' has no documents - skipping (should not happen after diagnostics)")
+                    continue
+
+                click.echo(f"[{timestamp()}] Field '{current_field}' has {quick_count:,} documents with content")
+                click.echo(f"[{timestamp()}] Creating index on '{current_field}' in '{input_collection}'...")
+
+                field_start_time = time.time()
+                ensure_index(input_col, current_field)
+
+                # Step 1: Aggregate
+                processed_field = aggregate_measurements(
+                    client, db_name, input_collection, output_collection,
+                    current_field, is_verbose, overwrite, batch_size
+                )
+
+                if processed_field is None:
+                    click.echo(f"[{timestamp()}] Skipping field '{current_field}' (likely due to overwrite=False)")
+                    continue
+
+                ensure_index(output_col, "harmonized_name")
+
+                # Step 2: Parse
+                parsed_count = parse_measurements(
+                    client, db_name, output_collection, current_field, is_verbose, parse_cache, batch_size
+                )
+
+                # Drop index on input field
+                click.echo(f"[{timestamp()}] Dropping index on '{current_field}' from '{input_collection}'...")
+                try:
+                    input_col.drop_index(f"{current_field}_1")
+                    click.echo(f"[{timestamp()}] Index '{current_field}_1' dropped successfully.")
+                except Exception as e:
+                    click.echo(f"[{timestamp()}] Warning: Failed to drop index '{current_field}_1': {str(e)}")
 
-            # Step 2: Parse
-            parsed_count = parse_measurements(
-                client, db_name, output_collection, current_field, is_verbose
-            )
-
-            # Drop index on input field
-            click.echo(f"[{timestamp()}] Dropping index on '{current_field}' from '{input_collection}'...")
-            try:
-                input_col.drop_index(f"{current_field}_1")
-                click.echo(f"[{timestamp()}] Index '{current_field}_1' dropped successfully.")
-            except Exception as e:
-                click.echo(f"[{timestamp()}] Warning: Failed to drop index '{current_field}_1': {str(e)}")
-
-            # Summary per field
-            field_end_time = time.time()
-            click.echo(
-                f"[{timestamp()}] Field '{current_field}' processed in {field_end_time - field_start_time:.2f} seconds")
+                # Summary per field
+                field_end_time = time.time()
+                click.echo(
+                    f"[{timestamp()}] Field '{current_field}' processed in {field_end_time - field_start_time:.2f} seconds")
 
-            fields_processed += 1
-            total_parsed += parsed_count
+                fields_processed += 1
+                total_parsed += parsed_count
 
         total_end_time = time.time()
         if not is_quiet:
@@ -507,11 +591,16 @@ def main(mongodb_uri, env_file, input_collection, output_collection, field, all_
             click.echo(f"[{timestamp()}] Fields processed: {fields_processed} of {len(field)}")
             click.echo(f"[{timestamp()}] Total parsed documents: {total_parsed}")
             click.echo(f"[{timestamp()}] Total processing time: {total_end_time - total_start_time:.2f} seconds")
+            if parse_cache is not None:
+                click.echo(f"[{timestamp()}] {parse_cache.stats_line()}")
             click.echo(f"[{timestamp()}] Operation complete.")
 
     except Exception as e:
         click.echo(f"[{timestamp()}] ERROR: {str(e)}")
         raise
+    finally:
+        if parse_cache is not None:
+            parse_cache.close()
 
 
 if __name__ == "__main__":
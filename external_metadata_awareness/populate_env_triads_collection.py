@@ -1,6 +1,19 @@
+"""
+Populate the env_triads collection: one document per biosample accession with
+its env_broad_scale, env_local_scale and env_medium values split into
+annotated components.
+
+The label, CURIE and triad-value lookups are built by streaming their source
+collections into dicts of shared, interned tuples. biosamples_flattened is then
+streamed once, sorted by accession with all three triad fields projected, and
+complete env_triads documents are inserted in unordered insert_many batches
+into a freshly created collection, whose accession index is built afterwards.
+"""
+
+import sys
 from collections import defaultdict
-from collections.abc import Mapping
 from datetime import datetime
+from typing import NamedTuple
 
 import click
 from pymongo import uri_parser
@@ -8,6 +21,8 @@ from tqdm import tqdm
 
 from external_metadata_awareness.mongodb_connection import get_mongo_client
 
+TRIAD_FIELDS = ("env_broad_scale", "env_local_scale", "env_medium")
+
 
 def component_has_valid_label(components, min_len):
     return any(
@@ -28,56 +43,153 @@ def recreate_index(collection, keys, **kwargs):
     print(f"   ↪ Created index: {index_name}")
 
 
-def normalize_annotations(annotations):
-    normalized = []
-    for ann in annotations:
-        if ann is None:
-            continue
-        elif isinstance(ann, Mapping):
-            normalized.append(ann)
-        elif isinstance(ann, list):
-            for sub_ann in ann:
-                if isinstance(sub_ann, Mapping):
-                    normalized.append(sub_ann)
-                else:
-                    print(f"⚠️ Skipping non-dict in nested list: {sub_ann}")
-        else:
-            print(f"⚠️ Skipping unknown annotation shape: {ann}")
-    return normalized
-
-
-def deduplicate_annotations(annotations):
+class Annotation(NamedTuple):
+    """One candidate annotation of a triad component, as stored in env_triads components."""
+    id: str | None
+    label: str
+    prefix_uc: str | None
+    source: str
+
+
+def unique_annotations(annotations):
+    """The annotations without repeats that differ only in source, keeping the first of each."""
     seen = set()
-    deduped = []
+    unique = []
     for ann in annotations:
-        ann_tuple = tuple(sorted((k, v) for k, v in ann.items() if k != "source"))
-        if ann_tuple not in seen:
-            seen.add(ann_tuple)
-            deduped.append(ann)
-    return deduped
+        key = ann[:3]
+        if key not in seen:
+            seen.add(key)
+            unique.append(ann)
+    return unique
+
+
+class _Interner:
+    """Share one copy of each string and annotation tuple across the lookup maps."""
 
+    def __init__(self):
+        self._annotations = {}
+
+    def annotation(self, id, label, prefix_uc, source):
+        ann = Annotation(*(sys.intern(value) if isinstance(value, str) else value
+                           for value in (id, label, prefix_uc, source)))
+        return self._annotations.setdefault(ann, ann)
+
+
+def build_label_annotations(oak_docs, ols_docs, acceptable_prefix, min_label_length, interner):
+    """Map each component label to its deduplicated OAK then OLS annotations, as a tuple."""
+    label_to_annotations = defaultdict(list)
+    for item in oak_docs:
+        for ann in item.get("oak_text_annotations", []):
+            label = ann.get("rdfs_label") or ann.get("object_label")
+            prefix_uc = ann.get("prefix_uc")
+            if prefix_uc in acceptable_prefix and isinstance(label, str) and len(label) >= min_label_length:
+                label_to_annotations[item["label"]].append(
+                    interner.annotation(ann.get("object_id"), label, prefix_uc, "OAK"))
+    for item in ols_docs:
+        for ann in item.get("ols_text_annotations", []):
+            label = ann.get("label")
+            prefix_uc = ann.get("ontology_prefix_uc")
+            if prefix_uc in acceptable_prefix and isinstance(label, str) and len(label) >= min_label_length:
+                label_to_annotations[item["label"]].append(
+                    interner.annotation(ann.get("obo_id"), label, prefix_uc, "OLS"))
+    return {sys.intern(label): tuple(unique_annotations(annotations))
+            for label, annotations in label_to_annotations.items()}
 
-def add_triads_to_samples(field_name, collection, sample_map, annotation_map):
-    query = {field_name: {"$ne": None}}
-    projection = {"accession": 1, field_name: 1, "_id": 0}
-    docs = list(collection.find(query, projection))
 
+def build_curie_annotations(curie_docs, min_label_length, interner):
+    """Map each asserted CURIE to its own label and its mappings' labels, as a tuple."""
+    curie_uc_to_annotation = defaultdict(list)
+    for item in curie_docs:
+        curie_uc = item.get("curie_uc")
+        label = item.get("label")
+        if curie_uc and isinstance(label, str) and len(label) >= min_label_length:
+            curie_uc_to_annotation[curie_uc].append(
+                interner.annotation(curie_uc, label, item.get("prefix_uc"), "asserted CURIe"))
+            for mapping in item.get("mappings", []):
+                label_lc = mapping.get("label_lc")
+                if isinstance(label_lc, str) and len(label_lc) >= min_label_length:
+                    curie_uc_to_annotation[curie_uc].append(
+                        interner.annotation(mapping.get("curie"), label_lc, mapping.get("prefix"),
+                                            "asserted CURIe mapping"))
+    return {sys.intern(curie_uc): tuple(annotations) for curie_uc, annotations in curie_uc_to_annotation.items()}
+
+
+def build_triad_components(triad_docs, label_to_annotations, curie_uc_to_annotation, min_label_length):
+    """
+    Map each env triad value to its components, as a tuple of (raw, Annotation or None).
+
+    A component gets the first of its label's and CURIE's annotations, and
+    components repeated within a value (regardless of source) are dropped.
+    """
+    env_triad_to_components = defaultdict(list)
+    for item in triad_docs:
+        if not component_has_valid_label(item.get("components", []), min_label_length):
+            continue
+        raw_value = item.get("env_triad_value")
+        for comp in item.get("components", []):
+            annotations = unique_annotations(
+                label_to_annotations.get(comp.get("label"), ()) + curie_uc_to_annotation.get(comp.get("curie_uc"), ()))
+            env_triad_to_components[raw_value].append(
+                (comp.get("raw", comp.get("label")), annotations[0] if annotations else None))
+
+    triad_components = {}
+    for raw_value, components in env_triad_to_components.items():
+        seen = set()
+        unique = []
+        for raw, ann in components:
+            key = (raw, ann[:3] if ann else None)
+            if key not in seen:
+                seen.add(key)
+                unique.append((raw, ann))
+        triad_components[raw_value] = tuple(unique)
+    return triad_components
+
+
+def component_dicts(components):
+    """The stored form of a value's components: {"raw", "id", "label", "prefix_uc", "source"}."""
+    return [{"raw": raw, **ann._asdict()} if ann else {"raw": raw} for raw, ann in components]
+
+
+def env_triad_documents(samples, triad_components):
+    """
+    Yield one env_triads document per accession from samples sorted by accession.
+
+    Each document has the accession and, for every triad field with a value,
+    {"raw": value, "components": [...]}. Consecutive samples with the same
+    accession are combined.
+    """
+    current = None
+    for sample in samples:
+        accession = sample["accession"]
+        if current is None or current["accession"] != accession:
+            if current is not None and len(current) > 1:
+                yield current
+            current = {"accession": accession}
+        for field in TRIAD_FIELDS:
+            raw_value = sample.get(field)
+            if raw_value is not None:
+                current[field] = {
+                    "raw": raw_value,
+                    "components": component_dicts(triad_components.get(raw_value, ())),
+                }
+    if current is not None and len(current) > 1:
+        yield current
+
+
+def insert_in_batches(collection, docs, batch_size=10_000, progress=None):
+    """insert_many the documents in unordered batches; returns the number inserted."""
+    batch = []
+    inserted = 0
     for doc in docs:
-        accession = doc["accession"]
-        raw_value = doc[field_name]
-        components = []
-        for component in annotation_map.get(raw_value, []):
-            components.append({
-                "raw": component.get("raw", raw_value),
-                **{k: v for k, v in component.items() if k != "raw"}
-            })
-
-        if accession not in sample_map:
-            sample_map[accession] = {}
-        sample_map[accession][field_name] = {
-            "raw": raw_value,
-            "components": components
-        }
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            inserted += len(collection.insert_many(batch, ordered=False).inserted_ids)
+            batch = []
+        if progress is not None:
+            progress.update(1)
+    if batch:
+        inserted += len(collection.insert_many(batch, ordered=False).inserted_ids)
+    return inserted
 
 
 @click.command()
@@ -88,8 +200,11 @@ def add_triads_to_samples(field_name, collection, sample_map, annotation_map):
 @click.option('--recreate-indices/--no-recreate-indices', default=True, help='Whether to recreate indices')
 @click.option('--acceptable-prefix', multiple=True,
               default=["DOID", "ENVO", "FOODON", "MONDO", "NCBITAXON", "PO", "UBERON"])
+@click.option('--batch-size', default=10_000, show_default=True, type=click.IntRange(min=1),
+              help='Documents per insert_many batch (and per biosamples_flattened cursor batch)')
 @click.option('--verbose', is_flag=True, help='Show verbose connection output')
-def populate(mongo_uri, env_file, dest_collection, min_label_length, acceptable_prefix, recreate_indices, verbose):
+def populate(mongo_uri, env_file, dest_collection, min_label_length, acceptable_prefix, recreate_indices, batch_size,
+             verbose):
     # Connect to MongoDB
     client = get_mongo_client(
         mongo_uri=mongo_uri,
@@ -111,9 +226,9 @@ def populate(mongo_uri, env_file, dest_collection, min_label_length, acceptable_
     env_triad_component_labels = db["env_triad_component_labels"]
     env_triad_component_curies_uc = db["env_triad_component_curies_uc"]
 
-    # Drop existing destination collection if it exists
+    # Start from a fresh destination collection; its accession index is built after loading
     db.drop_collection(dest_collection)
-    env_triads = db[dest_collection]
+    env_triads = db.create_collection(dest_collection)
 
     if recreate_indices:
         print("Creating indexes...")
@@ -135,132 +250,53 @@ def populate(mongo_uri, env_file, dest_collection, min_label_length, acceptable_
         recreate_index(env_triad_component_curies_uc, [("curie_uc", 1)])
         recreate_index(env_triad_component_curies_uc, [("prefix_uc", 1)])
 
-        recreate_index(env_triads, [("accession", 1)], unique=True)
         print("✅ Index setup complete.\n")
 
-    print("Retrieving triad documents with labels... (this takes ~5 minutes)")
-    triad_docs = list(biosamples_env_triad_value_counts_gt_1.find(
-        {"components": {"$elemMatch": {"label": {"$exists": True}}}},
-        {"env_triad_value": 1, "components.label": 1, "components.curie_uc": 1, "components.raw": 1, "_id": 0}))
-
-    # Filter documents to only include those with valid labels of sufficient length
-    triad_docs = [doc for doc in triad_docs if component_has_valid_label(doc.get("components", []), min_label_length)]
-    print(f"Found {len(triad_docs)} triad documents with valid labels")
-
-    print("Retrieving OAK annotations...")
-    oak_annotations = list(env_triad_component_labels.find(
-        {'oak_text_annotations': {'$elemMatch': {'prefix_uc': {'$in': list(acceptable_prefix)}}}},
-        {'_id': 0, 'label': 1, 'oak_text_annotations': 1}))
-    print(f"Found {len(oak_annotations)} OAK annotations")
-
-    print("Retrieving OLS annotations...")
-    ols_annotations = list(env_triad_component_labels.find(
-        {'ols_text_annotations': {'$elemMatch': {'ontology_prefix_uc': {'$in': list(acceptable_prefix)}}}},
-        {'_id': 0, 'label': 1, 'ols_text_annotations': 1}))
-    print(f"Found {len(ols_annotations)} OLS annotations")
-
-    # Map labels to their annotations
-    label_to_annotations = defaultdict(list)
-
-    print("Processing OAK annotations...")
-    for item in oak_annotations:
-        for ann in item.get("oak_text_annotations", []):
-            label = ann.get("rdfs_label") or ann.get("object_label")
-            prefix_uc = ann.get("prefix_uc")
-            if prefix_uc in acceptable_prefix and isinstance(label, str) and len(label) >= min_label_length:
-                label_to_annotations[item["label"]].append({
-                    "id": ann.get("object_id"),
-                    "label": label,
-                    "prefix_uc": prefix_uc,
-                    "source": "OAK"
-                })
-
-    print("Processing OLS annotations...")
-    for item in ols_annotations:
-        for ann in item.get("ols_text_annotations", []):
-            label = ann.get("label")
-            prefix_uc = ann.get("ontology_prefix_uc")
-            if prefix_uc in acceptable_prefix and isinstance(label, str) and len(label) >= min_label_length:
-                label_to_annotations[item["label"]].append({
-                    "id": ann.get("obo_id"),
-                    "label": label,
-                    "prefix_uc": prefix_uc,
-                    "source": "OLS"
-                })
+    acceptable_prefix = list(acceptable_prefix)
+    interner = _Interner()
 
-    # Deduplicate annotations for each label
-    for label in label_to_annotations:
-        label_to_annotations[label] = deduplicate_annotations(label_to_annotations[label])
+    print("Retrieving OAK and OLS annotations...")
+    oak_annotations = env_triad_component_labels.find(
+        {'oak_text_annotations': {'$elemMatch': {'prefix_uc': {'$in': acceptable_prefix}}}},
+        {'_id': 0, 'label': 1, 'oak_text_annotations': 1})
+    ols_annotations = env_triad_component_labels.find(
+        {'ols_text_annotations': {'$elemMatch': {'ontology_prefix_uc': {'$in': acceptable_prefix}}}},
+        {'_id': 0, 'label': 1, 'ols_text_annotations': 1})
+    label_to_annotations = build_label_annotations(
+        oak_annotations, ols_annotations, acceptable_prefix, min_label_length, interner)
+    print(f"Found annotations for {len(label_to_annotations)} labels")
 
     print("Retrieving CURIE lookup data...")
-    curie_lookup = list(env_triad_component_curies_uc.find(
-        {"curie_uc": {"$exists": True}, "prefix_uc": {"$in": list(acceptable_prefix)}, "label": {"$exists": True}},
-        {"curie_uc": 1, "label": 1, "prefix_uc": 1, "mappings": 1, "_id": 0}))
-    print(f"Found {len(curie_lookup)} CURIE lookup entries")
-
-    # Map CURIEs to their annotations
-    curie_uc_to_annotation = defaultdict(list)
-    for item in curie_lookup:
-        curie_uc = item.get("curie_uc")
-        label = item.get("label")
-        if curie_uc and isinstance(label, str) and len(label) >= min_label_length:
-            curie_uc_to_annotation[curie_uc].append({
-                "id": curie_uc,
-                "label": label,
-                "prefix_uc": item.get("prefix_uc"),
-                "source": "asserted CURIe"
-            })
-            for mapping in item.get("mappings", []):
-                label_lc = mapping.get("label_lc")
-                if isinstance(label_lc, str) and len(label_lc) >= min_label_length:
-                    curie_uc_to_annotation[curie_uc].append({
-                        "id": mapping.get("curie"),
-                        "label": label_lc,
-                        "prefix_uc": mapping.get("prefix"),
-                        "source": "asserted CURIe mapping"
-                    })
-
-    print("Building environmental triad annotations map...")
-    env_triad_to_annotations = defaultdict(list)
-    for item in tqdm(triad_docs, desc="Processing triad documents"):
-        raw_value = item.get("env_triad_value")
-        for comp in item.get("components", []):
-            label = comp.get("label")
-            curie_uc = comp.get("curie_uc")
-            annotations = []
-            if label in label_to_annotations:
-                annotations.extend(label_to_annotations[label])
-            if curie_uc in curie_uc_to_annotation:
-                annotations.extend(curie_uc_to_annotation[curie_uc])
-            normalized = deduplicate_annotations(normalize_annotations(annotations))
-            if normalized:
-                env_triad_to_annotations[raw_value].append({
-                    "raw": comp.get("raw", label),
-                    **normalized[0]  # Only use the first deduplicated, normalized annotation
-                })
-            else:
-                env_triad_to_annotations[raw_value].append({
-                    "raw": comp.get("raw", label)
-                })
-
-    # Deduplicate the components for each environmental triad value
-    for key in env_triad_to_annotations:
-        env_triad_to_annotations[key] = deduplicate_annotations(env_triad_to_annotations[key])
-
-    print("Building accession-to-structured-sample map...")
-    accession_to_structured_sample = {}
-    for field in ["env_broad_scale", "env_local_scale", "env_medium"]:
-        print(f"Processing {field}...")
-        add_triads_to_samples(field, biosamples_flattened, accession_to_structured_sample, env_triad_to_annotations)
+    curie_lookup = env_triad_component_curies_uc.find(
+        {"curie_uc": {"$exists": True}, "prefix_uc": {"$in": acceptable_prefix}, "label": {"$exists": True}},
+        {"curie_uc": 1, "label": 1, "prefix_uc": 1, "mappings": 1, "_id": 0})
+    curie_uc_to_annotation = build_curie_annotations(curie_lookup, min_label_length, interner)
+    print(f"Found annotations for {len(curie_uc_to_annotation)} CURIEs")
+
+    print("Building environmental triad components map...")
+    triad_docs = biosamples_env_triad_value_counts_gt_1.find(
+        {"components": {"$elemMatch": {"label": {"$exists": True}}}},
+        {"env_triad_value": 1, "components.label": 1, "components.curie_uc": 1, "components.raw": 1, "_id": 0})
+    triad_components = build_triad_components(
+        tqdm(triad_docs, desc="Processing triad documents"),
+        label_to_annotations, curie_uc_to_annotation, min_label_length)
+    print(f"Found {len(triad_components)} triad values with valid labels")
+
+    print(f"Streaming biosamples_flattened into {dest_collection}...")
+    samples = biosamples_flattened.find(
+        {"$or": [{field: {"$ne": None}} for field in TRIAD_FIELDS]},
+        {"accession": 1, **{field: 1 for field in TRIAD_FIELDS}, "_id": 0},
+        sort=[("accession", 1)],
+        batch_size=batch_size,
+        allow_disk_use=True)
+    with tqdm(desc=f"Inserting {dest_collection}", unit=" docs") as progress:
+        inserted = insert_in_batches(env_triads, env_triad_documents(samples, triad_components),
+                                     batch_size, progress)
 
     print(f"Creating index on {dest_collection}.accession...")
-    env_triads.create_index("accession", unique=True)
-    
-    print(f"Upserting {len(accession_to_structured_sample)} documents to {dest_collection}...")
-    for accession, triad_data in tqdm(accession_to_structured_sample.items(), desc="Upserting env_triads"):
-        env_triads.update_one({"accession": accession}, {"$set": triad_data}, upsert=True)
+    recreate_index(env_triads, [("accession", 1)], unique=True)
 
-    print(f"Successfully populated {dest_collection} collection with {len(accession_to_structured_sample)} documents")
+    print(f"Successfully populated {dest_collection} collection with {inserted} documents")
 
 
 if __name__ == '__main__':
@@ -0,0 +1,145 @@
+"""
+Persistent cache of quantulum3 parses, shared by the measurement pipelines.
+
+measurement_discovery_efficient and normalize_biosample_measurements both run
+quantulum3 over attribute values, and most values ("25 m", "7.2", ...) recur
+across harmonized names and across monthly refreshes. Parses are stored in a
+SQLite file keyed by a hash of the content and the installed quantulum3
+version, so a refresh only parses values it has not seen before and a
+quantulum3 upgrade starts a fresh set of entries.
+
+Each quantity is stored as a plain dict; callers derive their own document
+shapes from it:
+
+    {'value', 'unit': {'name', 'entity', 'uri'} or None, 'surface', 'span': [start, end],
+     'uncertainty', 'lang'}
+
+Parses that raise are cached too, as their error message.
+"""
+
+import hashlib
+import importlib.metadata
+import json
+import sqlite3
+
+from quantulum3 import parser
+
+QUANTULUM_VERSION = importlib.metadata.version("quantulum3")
+
+DEFAULT_PARSE_CACHE = "quantulum-parse-cache.sqlite"
+
+_COMMIT_EVERY = 1000
+
+
+class QuantulumParseError(ValueError):
+    """quantulum3 raised on a value (possibly on an earlier, cached run)."""
+
+
+def quantity_to_dict(quantity):
+    """Convert a quantulum3 Quantity to the JSON-serializable dict stored in the cache."""
+    unit = quantity.unit
+    if unit is not None:
+        entity = unit.entity
+        unit = {
+            'name': unit.name,
+            'entity': entity.name if hasattr(entity, 'name') else None,
+            'uri': str(unit.uri) if getattr(unit, 'uri', None) is not None else None,
+        }
+    return {
+        'value': quantity.value,
+        'unit': unit,
+        'surface': getattr(quantity, 'surface', None),
+        'span': list(quantity.span) if quantity.span else None,
+        'uncertainty': quantity.uncertainty,
+        'lang': getattr(quantity, 'lang', None),
+    }
+
+
+def parse_quantities(content):
+    """Parse one value with quantulum3, without the cache."""
+    return [quantity_to_dict(quantity) for quantity in parser.parse(str(content))]
+
+
+def content_key(content):
+    """Cache key: sha256 over the quantulum3 version and the content string."""
+    return hashlib.sha256(f"{QUANTULUM_VERSION}\0{content}".encode("utf-8")).hexdigest()
+
+
+class ParseCache:
+    """SQLite-backed map from content to its quantulum3 parse, with hit/miss counts.
+
+    Writes are committed every _COMMIT_EVERY new entries and on close(), so an
+    interrupted run keeps almost everything it parsed.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._uncommitted = 0
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS parses (key TEXT PRIMARY KEY, result TEXT NOT NULL)")
+        self._conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def get(self, content):
+        """Return the cached result (a list of quantity dicts, or an error message string), or None."""
+        row = self._conn.execute(
+            "SELECT result FROM parses WHERE key = ?", (content_key(content),)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, content, result):
+        """Store a list of quantity dicts, or the message of the error quantulum3 raised."""
+        self._conn.execute(
+            "INSERT OR REPLACE INTO parses (key, result) VALUES (?, ?)",
+            (content_key(content), json.dumps(result)))
+        self._uncommitted += 1
+        if self._uncommitted >= _COMMIT_EVERY:
+            self.commit()
+
+    def parse(self, content):
+        """Return the quantity dicts for content, parsing only on a cache miss.
+
+        Raises QuantulumParseError if quantulum3 raises, now or on the run that
+        cached the value.
+        """
+        result = self.get(content)
+        if result is None:
+            try:
+                result = parse_quantities(content)
+            except Exception as e:
+                result = str(e)
+            self.put(content, result)
+        if isinstance(result, str):
+            raise QuantulumParseError(result)
+        return result
+
+    def commit(self):
+        self._conn.commit()
+        self._uncommitted = 0
+
+    def close(self):
+        self.commit()
+        self._conn.close()
+
+    def stats_line(self):
+        lookups = self.hits + self.misses
+        hit_rate = (self.hits / lookups * 100) if lookups else 0
+        return (f"quantulum3 parse cache {self.path}: {self.hits:,} hits, {self.misses:,} misses "
+                f"({hit_rate:.1f}% hit rate)")
+
+
+def open_parse_cache(path):
+    """Open the cache at path, or return None when caching is disabled with an empty path."""
+    return ParseCache(path) if path else None
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Local exact label/synonym match index over the semsql ontologies.
+
+new_env_triad_ols_annotator only uses OLS for exact (case-insensitive) matches
+of a label against term labels and synonyms. This module builds the same
+lookup from the semsql SQLite files that OAK already downloads for the
+ontologies in new_check_semsql_curies.SEMSQL_ONTOLOGIES, into one SQLite index:
+
+    terms(ontology, obo_id, label, synonyms, is_defining)
+    matches(query, ontology, obo_id, is_defining)   -- indexed on query
+
+where query is a label or synonym stripped and lowercased. A term is
+defining when its CURIE prefix is the ontology's own (ENVO terms in envo,
+not the UBERON terms envo imports), like OLS's is_defining_ontology.
+ExactMatchIndex.lookup answers with the annotator's OLS hit schema, so the
+OLS phase can run offline.
+
+Each ontology is re-read only when its semsql file's size or mtime changes.
+
+    poetry run build-semsql-exact-match-index --index-file local/semsql-exact-match-index.sqlite
+"""
+
+import json
+import os
+import sqlite3
+from itertools import groupby
+
+import click
+from tqdm import tqdm
+
+from external_metadata_awareness.new_check_semsql_curies import SEMSQL_ONTOLOGIES, semsql_db_path
+
+LABEL_PREDICATE = "rdfs:label"
+SYNONYM_PREDICATES = (
+    "oio:hasExactSynonym",
+    "oio:hasRelatedSynonym",
+    "oio:hasBroadSynonym",
+    "oio:hasNarrowSynonym",
+)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sources (ontology TEXT PRIMARY KEY, db_path TEXT NOT NULL,
+                                    size INTEGER NOT NULL, mtime REAL NOT NULL);
+CREATE TABLE IF NOT EXISTS terms (ontology TEXT NOT NULL, obo_id TEXT NOT NULL, label TEXT NOT NULL,
+                                  synonyms TEXT NOT NULL, is_defining INTEGER NOT NULL,
+                                  PRIMARY KEY (ontology, obo_id));
+CREATE TABLE IF NOT EXISTS matches (query TEXT NOT NULL, ontology TEXT NOT NULL, obo_id TEXT NOT NULL,
+                                    is_defining INTEGER NOT NULL);
+CREATE INDEX IF NOT EXISTS matches_query ON matches (query);
+"""
+
+
+def normalize_text(text):
+    """The match key for a label, synonym or query: stripped and lowercased."""
+    return text.strip().lower()
+
+
+def iter_semsql_terms(db_path):
+    """Yield (curie, label, [synonyms]) for every labelled CURIE in a semsql database."""
+    predicates = (LABEL_PREDICATE,) + SYNONYM_PREDICATES
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        rows = conn.execute(
+            f"SELECT subject, predicate, value FROM statements "
+            f"WHERE predicate IN ({','.join('?' * len(predicates))}) AND value IS NOT NULL "
+            f"AND subject NOT LIKE '\\_:%' ESCAPE '\\' AND subject NOT LIKE '%://%' "
+            f"ORDER BY subject, predicate, value",
+            predicates)
+        for subject, statements in groupby(rows, key=lambda row: row[0]):
+            label = None
+            synonyms = []
+            for _, predicate, value in statements:
+                if predicate == LABEL_PREDICATE:
+                    label = label or value
+                elif value not in synonyms:
+                    synonyms.append(value)
+            if label:
+                yield subject, label, synonyms
+    finally:
+        conn.close()
+
+
+def _source_stamp(db_path):
+    stat = os.stat(db_path)
+    return stat.st_size, stat.st_mtime
+
+
+def index_ontology(conn, ontology, db_path):
+    """Replace one ontology's rows in the index with the terms in its semsql file."""
+    conn.execute("DELETE FROM terms WHERE ontology = ?", (ontology,))
+    conn.execute("DELETE FROM matches WHERE ontology = ?", (ontology,))
+    term_count = 0
+    for curie, label, synonyms in iter_semsql_terms(db_path):
+        is_defining = int(curie.partition(":")[0].lower() == ontology.lower())
+        conn.execute("INSERT OR REPLACE INTO terms VALUES (?, ?, ?, ?, ?)",
+                     (ontology, curie, label, json.dumps(synonyms), is_defining))
+        keys = {normalize_text(text) for text in [label] + synonyms}
+        conn.executemany("INSERT INTO matches VALUES (?, ?, ?, ?)",
+                         [(key, ontology, curie, is_defining) for key in keys if key])
+        term_count += 1
+    size, mtime = _source_stamp(db_path)
+    conn.execute("INSERT OR REPLACE INTO sources VALUES (?, ?, ?, ?)", (ontology, db_path, size, mtime))
+    conn.commit()
+    return term_count
+
+
+def build_index(index_path, db_paths):
+    """
+    Bring the index at index_path up to date with {ontology: semsql db path}.
+
+    Ontologies whose semsql file is unchanged since it was indexed are left
+    as they are. Returns the ontologies that were (re)indexed.
+    """
+    conn = sqlite3.connect(index_path)
+    try:
+        conn.executescript(_SCHEMA)
+        indexed = {row[0]: tuple(row[1:]) for row in conn.execute("SELECT ontology, db_path, size, mtime FROM sources")}
+        rebuilt = []
+        for ontology, db_path in db_paths.items():
+            if indexed.get(ontology) == (db_path,) + _source_stamp(db_path):
+                continue
+            term_count = index_ontology(conn, ontology, db_path)
+            print(f"Indexed {term_count} {ontology} terms from {db_path}")
+            rebuilt.append(ontology)
+        return rebuilt
+    finally:
+        conn.close()
+
+
+class ExactMatchIndex:
+    """Read-only exact label/synonym lookups against an index built by build_index."""
+
+    def __init__(self, index_path):
+        self._conn = sqlite3.connect(f"file:{index_path}?mode=ro", uri=True)
+
+    def close(self):
+        self._conn.close()
+
+    def lookup(self, query_text, defining_only=True):
+        """
+        Return the OLS-style hits whose label or a synonym equals query_text.
+
+        Each hit has the keys new_env_triad_ols_annotator stores: label,
+        synonyms, exact_label_match, exact_synonym_match, obo_id,
+        ontology_name_uc and ontology_prefix_uc.
+        """
+        query_text = normalize_text(query_text)
+        rows = self._conn.execute(
+            "SELECT t.ontology, t.obo_id, t.label, t.synonyms FROM matches m "
+            "JOIN terms t ON t.ontology = m.ontology AND t.obo_id = m.obo_id "
+            "WHERE m.query = ? AND (m.is_defining OR NOT ?) ORDER BY t.ontology, t.obo_id",
+            (query_text, defining_only))
+        hits = []
+        for ontology, obo_id, label, synonyms in rows:
+            synonyms = json.loads(synonyms)
+            hits.append({
+                "label": label,
+                "synonyms": synonyms,
+                "exact_label_match": label.lower() == query_text,
+                "exact_synonym_match": any(query_text == synonym.lower() for synonym in synonyms),
+                "obo_id": obo_id,
+                "ontology_name_uc": ontology.upper(),
+                "ontology_prefix_uc": ontology.upper(),
+            })
+        return hits
+
+
+@click.command()
+@click.option('--index-file', required=True, type=click.Path(dir_okay=False),
+              help='SQLite index to create or bring up to date')
+@click.option('--ontology', 'ontologies', multiple=True, type=click.Choice(sorted(SEMSQL_ONTOLOGIES)),
+              help='Ontology to index (repeatable); default: every ontology in SEMSQL_ONTOLOGIES')
+def main(index_file, ontologies):
+    """Build or refresh the local exact-match index from the semsql ontology files."""
+    ontologies = ontologies or tuple(SEMSQL_ONTOLOGIES)
+    db_paths = {}
+    for ontology in tqdm(ontologies, desc="Locating semsql files"):
+        db_paths[ontology] = semsql_db_path(SEMSQL_ONTOLOGIES[ontology])
+    rebuilt = build_index(index_file, db_paths)
+    print(f"Reindexed {len(rebuilt)} of {len(db_paths)} ontologies into {index_file}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+"""Split large single-root XML files into byte ranges of whole records.
+
+NCBI's BioSample and BioProject dumps are one root element holding millions of
+sibling records. Cutting the file at record opening tags gives ranges that can
+be parsed independently (and in parallel) once wrapped in a synthetic root.
+"""
+
+import os
+from typing import Optional
+
+import lxml.etree as ET
+
+# Bytes that may follow "<TagName" when it opens the tag itself rather than a
+# longer tag sharing the prefix (<BioSample vs <BioSampleSet).
+_TAG_NAME_TERMINATORS = b" \t\r\n>/"
+_SCAN_CHUNK_BYTES = 1 << 20
+_SHARD_READ_BYTES = 8 << 20
+# Synthetic root wrapped around each shard so a run of sibling records parses
+# as one well-formed document.
+_SHARD_ROOT = "shard"
+
+
+def find_next_node_start(fh, offset: int, node_type: str, limit: Optional[int] = None) -> Optional[int]:
+    """
+    Return the byte offset of the first "<node_type" opening tag at or after offset.
+
+    Returns None if no opening tag is found before limit (or end of file).
+    """
+    marker = f"<{node_type}".encode()
+    overlap = len(marker)
+    position = offset
+    carry = b""
+    while limit is None or position < limit:
+        fh.seek(position)
+        chunk = fh.read(_SCAN_CHUNK_BYTES)
+        if not chunk:
+            return None
+        window = carry + chunk
+        window_start = position - len(carry)
+        search_from = 0
+        while True:
+            hit = window.find(marker, search_from)
+            if hit == -1:
+                break
+            after = hit + len(marker)
+            if after >= len(window):
+                # The terminator byte is in the next chunk; let the carry
+                # pick this candidate up again.
+                break
+            if window[after] in _TAG_NAME_TERMINATORS:
+                found = window_start + hit
+                return found if limit is None or found < limit else None
+            search_from = hit + 1
+        carry = window[-overlap:]
+        position += len(chunk)
+    return None
+
+
+def find_last_node_end(fh, file_size: int, node_type: str) -> Optional[int]:
+    """Return the byte offset just past the last "</node_type>" closing tag."""
+    marker = f"</{node_type}>".encode()
+    end = file_size
+    while end > 0:
+        start = max(0, end - _SCAN_CHUNK_BYTES - len(marker))
+        fh.seek(start)
+        window = fh.read(end - start)
+        hit = window.rfind(marker)
+        if hit != -1:
+            return start + hit + len(marker)
+        if start == 0:
+            return None
+        end = start + len(marker)
+    return None
+
+
+def compute_shard_ranges(file_path: str, node_type: str, shard_size: int,
+                         start_offset: int = 0) -> list[tuple[int, int]]:
+    """
+    Split an XML file into byte ranges that each hold only whole node_type records.
+
+    Every range starts at a "<node_type" opening tag; the last one ends just past
+    the final "</node_type>" so the document's closing root tag is excluded.
+    This assumes node_type elements are direct children of the root and are not
+    nested inside one another, which holds for BioSample, Package and Attribute
+    in the NCBI dumps.
+    """
+    file_size = os.path.getsize(file_path)
+    with open(file_path, 'rb') as fh:
+        data_end = find_last_node_end(fh, file_size, node_type)
+        if data_end is None:
+            return []
+        start = find_next_node_start(fh, start_offset, node_type, limit=data_end)
+        ranges = []
+        while start is not None:
+            boundary = find_next_node_start(fh, start + shard_size, node_type, limit=data_end)
+            end = boundary if boundary is not None else data_end
+            ranges.append((start, end))
+            start = boundary
+    return ranges
+
+
+def iter_shard_events(file_path: str, start: int, end: int, events=('end',),
+                      tag: Optional[str] = None, **parser_options):
+    """
+    Yield (event, element) pairs for the byte range [start, end) of an XML file.
+
+    The range is fed incrementally to a pull parser under a synthetic root,
+    whose own events are not reported, so elements directly inside the range
+    have that root as their parent. Callers are responsible for clearing
+    elements they are done with.
+    """
+    parser = ET.XMLPullParser(events=events, tag=tag, huge_tree=True, **parser_options)
+    parser.feed(f"<{_SHARD_ROOT}>".encode())
+
+    def read_events():
+        for event, elem in parser.read_events():
+            if elem.tag == _SHARD_ROOT and elem.getparent() is None:
+                continue
+            yield event, elem
+
+    with open(file_path, 'rb') as fh:
+        fh.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            chunk = fh.read(min(_SHARD_READ_BYTES, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            parser.feed(chunk)
+            yield from read_events()
+    parser.feed(f"</{_SHARD_ROOT}>".encode())
+    yield from read_events()
+    parser.close()
@@ -1,10 +1,355 @@
+import json
+import os
+import resource
+import sys
 import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from typing import Optional
 from urllib.parse import urlparse
 
+import bson
 import click
 import lxml.etree as ET
+from bson.raw_bson import RawBSONDocument
+from pymongo import ReplaceOne
+from pymongo.errors import BulkWriteError
 from external_metadata_awareness.mongodb_connection import get_mongo_client
+from external_metadata_awareness.xml_shards import compute_shard_ranges, iter_shard_events
+
+_RSS_REPORT_INTERVAL = 1_000_000
+_MISSING = object()
+_intern = sys.intern
+
+
+def _new_element_doc(elem) -> dict:
+    """Start the dictionary for one element: its stripped text, then its attributes."""
+    doc = {}
+    text = elem.text
+    if text:
+        text = text.strip()
+        if text:
+            doc['content'] = text
+    for name, value in elem.attrib.items():
+        doc[_intern(name)] = value
+    return doc
+
+
+def element_to_dict(elem) -> dict:
+    """
+    Convert an XML element to a nested dictionary.
+
+    Each element becomes a dict holding its stripped text under 'content', its
+    attributes, and one key per child tag; repeated child tags become lists.
+    The tree is walked with an explicit stack, so deep documents cannot hit the
+    recursion limit, and tag and attribute names are interned so the millions
+    of documents in a load share one copy of each key. Comments and processing
+    instructions are skipped.
+    """
+    root = _new_element_doc(elem)
+    stack = [(iter(elem), root)]
+    while stack:
+        children, doc = stack[-1]
+        child = next(children, None)
+        if child is None:
+            stack.pop()
+            continue
+        tag = child.tag
+        if not isinstance(tag, str):
+            continue
+        tag = _intern(tag)
+        child_doc = _new_element_doc(child)
+        existing = doc.get(tag, _MISSING)
+        if existing is _MISSING:
+            doc[tag] = child_doc
+        elif isinstance(existing, list):
+            existing.append(child_doc)
+        else:
+            doc[tag] = [existing, child_doc]
+        if len(child):
+            stack.append((iter(child), child_doc))
+    return root
+
+
+def element_to_raw_bson(elem) -> RawBSONDocument:
+    """
+    Convert an XML element to an encoded BSON document.
+
+    pymongo sends RawBSONDocument bytes as-is, so encoding here (in a parser
+    process, in sharded mode) takes that work off the inserting thread and
+    makes the documents cheap to pass between processes. MongoDB assigns _id
+    on insert since raw documents cannot be amended client-side.
+    """
+    return RawBSONDocument(bson.encode(element_to_dict(elem)))
+
+
+# Output codecs selectable with --codec; each turns one node_type element
+# into something insert_many accepts.
+CODECS = {
+    'dict': element_to_dict,
+    'bson': element_to_raw_bson,
+}
+
+# How batches are written (--write-mode). 'insert' lets MongoDB assign _id, so
+# replaying records after a crash duplicates them; the keyed modes set _id from
+# the node's ID attribute so a replay is idempotent.
+WRITE_MODES = ('insert', 'keyed-insert', 'upsert')
+_DUPLICATE_KEY_ERROR = 11000
+
+
+def convert_node(elem, codec: str = 'dict', key_field: Optional[str] = None):
+    """
+    Convert one node_type element with the given codec.
+
+    With key_field, the element's key_field attribute becomes the document's
+    _id (placed first, as MongoDB stores it).
+    """
+    if key_field is None:
+        return CODECS[codec](elem)
+    key = elem.get(key_field)
+    if key is None:
+        raise ValueError(f"{elem.tag} element has no {key_field!r} attribute to use as _id")
+    doc = {'_id': key}
+    doc.update(element_to_dict(elem))
+    return RawBSONDocument(bson.encode(doc)) if codec == 'bson' else doc
+
+
+def write_batch(collection, batch: list, write_mode: str = 'insert') -> None:
+    """
+    Write one batch of documents in the given write mode.
+
+    'keyed-insert' ignores duplicate-key errors, which only arise for records
+    a previous run already loaded; 'upsert' replaces each document by _id.
+    """
+    if write_mode == 'upsert':
+        collection.bulk_write([ReplaceOne({'_id': doc['_id']}, doc, upsert=True) for doc in batch],
+                              ordered=False)
+        return
+    try:
+        collection.insert_many(batch, ordered=False)
+    except BulkWriteError as e:
+        if write_mode != 'keyed-insert':
+            raise
+        errors = e.details.get('writeErrors', [])
+        if e.details.get('writeConcernErrors') or any(
+                err.get('code') != _DUPLICATE_KEY_ERROR for err in errors):
+            raise
+
+
+def read_checkpoint(checkpoint_file: str) -> Optional[dict]:
+    """Return the checkpoint manifest in checkpoint_file, or None if there is none yet."""
+    if not os.path.exists(checkpoint_file):
+        return None
+    with open(checkpoint_file) as f:
+        return json.load(f)
+
+
+def write_checkpoint(checkpoint_file: str, manifest: dict) -> None:
+    """Atomically replace the checkpoint manifest, so a crash never leaves half a file."""
+    tmp_path = f"{checkpoint_file}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, checkpoint_file)
+
+
+def new_checkpoint(file_path: str, node_type: str, collection_name: str, id_field: str) -> dict:
+    """Start a manifest for a load of file_path, identifying the file by size and mtime."""
+    stat = os.stat(file_path)
+    return {
+        'file_path': os.path.abspath(file_path),
+        'file_size': stat.st_size,
+        'file_mtime': stat.st_mtime,
+        'node_type': node_type,
+        'collection': collection_name,
+        'id_field': id_field,
+        'offset': 0,
+        'last_id': None,
+        'records_loaded': 0,
+        'complete': False,
+    }
+
+
+def check_checkpoint_matches(manifest: dict, expected: dict) -> None:
+    """Raise click.ClickException if a manifest was written for a different load."""
+    for field in ('file_size', 'file_mtime', 'node_type', 'collection'):
+        if manifest.get(field) != expected[field]:
+            raise click.ClickException(
+                f"Checkpoint {field} is {manifest.get(field)!r} but this load has {expected[field]!r}; "
+                f"the checkpoint belongs to a different file or collection. "
+                f"Remove it to start over.")
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process so far, in MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and in kilobytes on Linux.
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def iter_nodes(file_path: str, node_type: str):
+    """
+    Stream the node_type elements of an XML file at constant memory.
+
+    iterparse only reports node_type end events and drops whitespace-only
+    text, and each element is cleared and detached together with any siblings
+    before it once the caller asks for the next one. Without the detaching, the
+    root keeps every emptied record and memory grows with the file.
+    """
+    context = ET.iterparse(file_path, events=('end',), tag=node_type,
+                           huge_tree=True, remove_blank_text=True)
+    for _, elem in context:
+        yield elem
+        elem.clear()
+        while elem.getprevious() is not None:
+            del elem.getparent()[0]
+
+
+def parse_shard(file_path: str, start: int, end: int, node_type: str,
+                codec: str = 'dict', key_field: Optional[str] = None) -> list:
+    """
+    Parse the node_type records in the byte range [start, end) of an XML file.
+
+    Each record is cleared and detached once converted, so memory stays
+    proportional to the returned documents rather than the shard size.
+    """
+    docs = []
+    for _, elem in iter_shard_events(file_path, start, end, tag=node_type, remove_blank_text=True):
+        docs.append(convert_node(elem, codec, key_field))
+        elem.clear()
+        while elem.getprevious() is not None:
+            del elem.getparent()[0]
+    return docs
+
+
+def load_sharded(file_path: str, collection, node_type: str, workers: int, writers: int,
+                 batch_size: int, shard_size: int, resume_from_offset: int = 0,
+                 max_elements: Optional[int] = None, codec: str = 'dict',
+                 write_mode: str = 'insert', id_field: str = 'id',
+                 checkpoint_file: Optional[str] = None, checkpoint: Optional[dict] = None,
+                 verbose: bool = False) -> int:
+    """
+    Load node_type records into a collection with parallel parsing and writing.
+
+    The file is split into shards at record boundaries; shards are parsed in a
+    process pool and their documents are written by a thread pool of writers.
+    Shards are consumed in file order and only a bounded number of parse and
+    write jobs are in flight at once. Progress lines report the offset up to
+    which every record has been written; pass it to --resume-from-offset to
+    continue an interrupted load. With checkpoint_file, the checkpoint manifest
+    is rewritten each time that offset advances.
+
+    Returns the number of documents written.
+    """
+    key_field = id_field if write_mode in ('keyed-insert', 'upsert') else None
+    shards = compute_shard_ranges(file_path, node_type, shard_size, resume_from_offset)
+    if verbose:
+        print(f"Split {file_path} into {len(shards)} shards of ~{shard_size} bytes "
+              f"starting at offset {shards[0][0] if shards else resume_from_offset}")
+
+    start_time = time.time()
+    processed_count = 0
+    stopped_early = False
+    safe_offset = shards[0][0] if shards else resume_from_offset
+    next_report = 10000
+    next_rss_report = _RSS_REPORT_INTERVAL
+
+    def save_checkpoint(shard_end, last_id, shard_count, complete=False):
+        checkpoint['offset'] = shard_end
+        if last_id is not None:
+            checkpoint['last_id'] = last_id
+        checkpoint['records_loaded'] += shard_count
+        checkpoint['complete'] = complete
+        write_checkpoint(checkpoint_file, checkpoint)
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as parse_pool, \
+                ThreadPoolExecutor(max_workers=writers) as write_pool:
+            # (future, shard_done) pairs in file order. shard_done is
+            # (shard_end, last_id, record_count) on the last write of each
+            # shard, so completing it advances the resume offset.
+            pending_writes = deque()
+
+            def drain_writes(max_pending):
+                nonlocal safe_offset
+                while len(pending_writes) > max_pending:
+                    future, shard_done = pending_writes.popleft()
+                    if future is not None:
+                        future.result()
+                    if shard_done is not None:
+                        safe_offset = shard_done[0]
+                        if checkpoint_file:
+                            save_checkpoint(*shard_done)
+
+            pending_parses = deque()
+            shard_iter = iter(shards)
+
+            def submit_parses():
+                while len(pending_parses) < workers * 2:
+                    shard = next(shard_iter, None)
+                    if shard is None:
+                        return
+                    pending_parses.append(
+                        (shard, parse_pool.submit(parse_shard, file_path, shard[0], shard[1],
+                                                  node_type, codec, key_field)))
+
+            submit_parses()
+            while pending_parses:
+                (_, shard_end), parse_future = pending_parses.popleft()
+                docs = parse_future.result()
+                submit_parses()
+
+                shard_done = (shard_end, docs[-1].get(id_field) if docs else None, len(docs))
+                if max_elements and processed_count + len(docs) > max_elements:
+                    # A truncated shard is not fully loaded, so it must not
+                    # advance the resume offset.
+                    docs = docs[:max_elements - processed_count]
+                    shard_done = None
+                batches = [docs[i:i + batch_size] for i in range(0, len(docs), batch_size)]
+                if not batches:
+                    pending_writes.append((None, shard_done))
+                for i, batch in enumerate(batches):
+                    future = write_pool.submit(write_batch, collection, batch, write_mode)
+                    pending_writes.append((future, shard_done if i == len(batches) - 1 else None))
+                processed_count += len(docs)
+                drain_writes(writers * 2)
+
+                if processed_count >= next_report:
+                    elapsed_time = time.time() - start_time
+                    print(f"Processed {processed_count} {node_type} nodes, "
+                          f"elapsed time: {elapsed_time:.2f} seconds "
+                          f"({processed_count / elapsed_time:.0f}/s), "
+                          f"resume offset: {safe_offset}")
+                    next_report = (processed_count // 10000 + 1) * 10000
+
+                if processed_count >= next_rss_report:
+                    print(f"Peak RSS after {processed_count} {node_type} nodes: "
+                          f"{peak_rss_mb():.1f} MB (loader process)")
+                    next_rss_report = (processed_count // _RSS_REPORT_INTERVAL + 1) * _RSS_REPORT_INTERVAL
+
+                if max_elements and processed_count >= max_elements:
+                    print(f"Reached max_elements ({max_elements}). Stopping.")
+                    stopped_early = True
+                    for _, parse_future in pending_parses:
+                        parse_future.cancel()
+                    break
+
+            drain_writes(0)
+    except BaseException:
+        if checkpoint_file:
+            print(f"Load stopped after {processed_count} {node_type} nodes; rerun with "
+                  f"--checkpoint-file {checkpoint_file} to resume from offset {safe_offset}")
+        else:
+            print(f"Load stopped after {processed_count} {node_type} nodes; "
+                  f"resume with --resume-from-offset {safe_offset}")
+        raise
+
+    if checkpoint_file and not stopped_early:
+        save_checkpoint(checkpoint['offset'], None, 0, complete=True)
+
+    elapsed_time = time.time() - start_time
+    print(f"Wrote {processed_count} {node_type} nodes in {elapsed_time:.2f} seconds; "
+          f"all records before offset {safe_offset} are loaded")
+    return processed_count
 
 
 @click.command()
@@ -20,39 +365,72 @@ from external_metadata_awareness.mongodb_connection import get_mongo_client
 @click.option('--env-file', default=None, help='Path to .env file for credentials (should contain MONGO_USER and MONGO_PASSWORD).')
 @click.option('--batch-size', default=1000, type=int,
               help='Documents per bulk insert (default 1000). Larger batches trade memory for throughput.')
+@click.option('--codec', default='dict', type=click.Choice(sorted(CODECS)),
+              help="Document encoding: 'dict' (pymongo encodes on insert) or 'bson' "
+                   "(encoded while parsing; in sharded mode this runs in the parser processes).")
+@click.option('--workers', default=1, type=int,
+              help='Parser processes (default 1). Above 1, the file is split into shards at '
+                   'node boundaries and parsed in parallel.')
+@click.option('--writers', default=4, type=int,
+              help='Concurrent insert_many writers in sharded mode (default 4).')
+@click.option('--shard-size-mb', default=64, type=int,
+              help='Approximate shard size in MB for sharded mode (default 64).')
+@click.option('--resume-from-offset', default=0, type=int,
+              help='Byte offset to resume a sharded load from, as reported by a previous run. '
+                   'Implies sharded mode.')
+@click.option('--write-mode', default='insert', type=click.Choice(WRITE_MODES),
+              help="'insert' (default) lets MongoDB assign _id. 'keyed-insert' sets _id to the "
+                   "--id-field attribute and skips records already loaded; 'upsert' replaces them. "
+                   "Use a keyed mode when resuming so replayed records are not duplicated.")
+@click.option('--checkpoint-file', default=None, type=click.Path(dir_okay=False),
+              help='JSON manifest recording the file offset and last ID after each loaded shard. '
+                   'If it exists, the load resumes from it. Implies sharded mode.')
 @click.option('--verbose', is_flag=True, help='Show verbose connection output.')
 def load_xml_to_mongodb(file_path: str, collection_name: str, node_type: str,
                         id_field: str, max_elements: Optional[int] = None,
                         anticipated_last_id: Optional[int] = None, mongo_uri: str = None,
                         env_file: Optional[str] = None, batch_size: int = 1000,
+                        codec: str = 'dict', workers: int = 1, writers: int = 4,
+                        shard_size_mb: int = 64, resume_from_offset: int = 0,
+                        write_mode: str = 'insert', checkpoint_file: Optional[str] = None,
                         verbose: bool = False):
     """
     Loads data from an XML file into MongoDB, preserving the nested structure.
 
     This script uses lxml's iterparse for incremental processing, handles
     different node types, and allows specifying the ID attribute for progress
-    calculation.
-    """
-
-    def element_to_dict(elem):
-        """
-        Recursively converts an XML element to a nested dictionary.
-        """
-        doc = {}
-        if elem.text and elem.text.strip():
-            doc['content'] = elem.text.strip()
-        doc.update(elem.attrib)
-        for child in elem:
-            child_doc = element_to_dict(child)
-            if child.tag in doc:
-                if isinstance(doc[child.tag], list):
-                    doc[child.tag].append(child_doc)
-                else:
-                    doc[child.tag] = [doc[child.tag], child_doc]
-            else:
-                doc[child.tag] = child_doc
-        return doc
+    calculation. Parsed records are released as it goes, so memory stays flat
+    over the whole file; peak RSS is printed every million records.
+
+    With --workers above 1 (or --resume-from-offset or --checkpoint-file), the
+    file is instead split into byte-range shards at node boundaries, parsed in
+    a process pool and inserted by a pool of writer threads. Sharded mode
+    requires node_type elements to be direct children of the root.
 
+    With --checkpoint-file, the offset of the last fully loaded shard is saved
+    as the load goes, and rerunning the same command picks up from there.
+    """
+    checkpoint = None
+    if checkpoint_file:
+        expected = new_checkpoint(file_path, node_type, collection_name, id_field)
+        checkpoint = read_checkpoint(checkpoint_file)
+        if checkpoint is None:
+            checkpoint = expected
+        else:
+            check_checkpoint_matches(checkpoint, expected)
+            if checkpoint['complete']:
+                print(f"Checkpoint {checkpoint_file} records a complete load of "
+                      f"{checkpoint['records_loaded']} {node_type} nodes; nothing to do.")
+                return
+            resume_from_offset = resume_from_offset or checkpoint['offset']
+            print(f"Resuming from checkpoint: offset {checkpoint['offset']}, "
+                  f"last {id_field} {checkpoint['last_id']}, "
+                  f"{checkpoint['records_loaded']} {node_type} nodes already loaded")
+        if write_mode == 'insert':
+            print("Warning: --write-mode insert may duplicate records written after the last "
+                  "checkpoint if the load is interrupted; consider keyed-insert or upsert.")
+
+    client = None
     try:
         client = get_mongo_client(
             mongo_uri=mongo_uri,
@@ -70,48 +448,61 @@ def load_xml_to_mongodb(file_path: str, collection_name: str, node_type: str,
         db = client[db_name]
         collection = db[collection_name]
 
+        if workers > 1 or resume_from_offset or checkpoint_file:
+            load_sharded(file_path, collection, node_type, workers=workers, writers=writers,
+                         batch_size=batch_size, shard_size=shard_size_mb * 1024 * 1024,
+                         resume_from_offset=resume_from_offset, max_elements=max_elements,
+                         codec=codec, write_mode=write_mode, id_field=id_field,
+                         checkpoint_file=checkpoint_file, checkpoint=checkpoint,
+                         verbose=verbose)
+            return
+
+        key_field = id_field if write_mode in ('keyed-insert', 'upsert') else None
         start_time = time.time()
         processed_count = 0
         batch = []
 
         def flush(batch):
             if batch:
-                collection.insert_many(batch, ordered=False)
+                write_batch(collection, batch, write_mode)
                 batch.clear()
 
-        for event, elem in ET.iterparse(file_path, events=('end',)):
-            if elem.tag == node_type:
-                batch.append(element_to_dict(elem))
-                processed_count += 1
+        for elem in iter_nodes(file_path, node_type):
+            batch.append(convert_node(elem, codec, key_field))
+            processed_count += 1
 
-                if len(batch) >= batch_size:
-                    flush(batch)
+            if len(batch) >= batch_size:
+                flush(batch)
 
-                # Show progress based on max_elements if provided, otherwise use anticipated_last_id
-                if processed_count % 10000 == 0:
-                    if max_elements:
-                        progress = (processed_count / max_elements) * 100
-                    elif anticipated_last_id:
-                        progress = (int(elem.attrib.get(id_field, 0)) / anticipated_last_id) * 100
-                    else:
-                        progress = 0
+            # Show progress based on max_elements if provided, otherwise use anticipated_last_id
+            if processed_count % 10000 == 0:
+                if max_elements:
+                    progress = (processed_count / max_elements) * 100
+                elif anticipated_last_id:
+                    progress = (int(elem.attrib.get(id_field, 0)) / anticipated_last_id) * 100
+                else:
+                    progress = 0
 
-                    elapsed_time = time.time() - start_time
-                    print(f"Processed {processed_count} {node_type} nodes ({progress:.2f}%), "
-                          f"elapsed time: {elapsed_time:.2f} seconds")
+                elapsed_time = time.time() - start_time
+                print(f"Processed {processed_count} {node_type} nodes ({progress:.2f}%), "
+                      f"elapsed time: {elapsed_time:.2f} seconds")
 
-                if max_elements and processed_count >= max_elements:
-                    print(f"Reached max_elements ({max_elements}). Stopping.")
-                    break
+            if processed_count % _RSS_REPORT_INTERVAL == 0:
+                print(f"Peak RSS after {processed_count} {node_type} nodes: {peak_rss_mb():.1f} MB")
 
-                elem.clear()
+            if max_elements and processed_count >= max_elements:
+                print(f"Reached max_elements ({max_elements}). Stopping.")
+                break
 
         flush(batch)
 
+    except click.ClickException:
+        raise
     except Exception as e:
-        print(f"An error occurred: {e}")
+        raise click.ClickException(f"An error occurred: {e}") from e
     finally:
-        client.close()
+        if client is not None:
+            client.close()
 
 
 if __name__ == "__main__":
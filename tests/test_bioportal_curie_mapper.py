@@ -2,12 +2,21 @@
 
 fetch_mappings ends in a bare `except Exception: return []`, so anything that
 raises mid-loop discards every mapping for the source term rather than just
-the offending entry. These tests cover that boundary.
+the offending entry. These tests cover that boundary, and run the concurrent
+mapping engine against a local stub BioPortal server.
 """
 
+import collections
+import concurrent.futures
+import http.server
+import json
+import threading
+import time
 import types
+import urllib.parse
 
 import pytest
+import requests_cache
 
 from external_metadata_awareness import new_bioportal_curie_mapper as mapper
 
@@ -117,3 +126,185 @@ def test_non_loom_sources_are_ignored(stub_bioportal):
     result = mapper.fetch_mappings("https://example.invalid/mappings", "key", _SOURCE_ID)
 
     assert result == []
+
+
+class _StubBioPortal(http.server.BaseHTTPRequestHandler):
+    """Local BioPortal stand-in: every PATO class maps (LOOM) to one shared UBERON class.
+
+    The first request for each class answers 429 once, to exercise the retry path.
+    """
+
+    hits = collections.Counter()
+    rate_limited = set()
+
+    def do_GET(self):
+        base = f"http://{self.server.server_address[0]}:{self.server.server_address[1]}"
+        self.hits[self.path] += 1
+        if self.path.startswith("/ontologies/PATO/classes/"):
+            if self.path not in self.rate_limited:
+                self.rate_limited.add(self.path)
+                return self._send(429, {"error": "slow down"}, {"Retry-After": "0"})
+            term_uri = urllib.parse.unquote(self.path.rsplit("/", 1)[1])
+            number = term_uri.rsplit("_", 1)[1]
+            return self._send(200, {"prefLabel": f"quality {number}", "obsolete": False,
+                                    "links": {"mappings": f"{base}/mappings/{number}"}})
+        if self.path.startswith("/mappings/"):
+            number = self.path.rsplit("/", 1)[1]
+            return self._send(200, [{"source": "LOOM", "classes": [
+                _class(f"http://purl.obolibrary.org/obo/PATO_{number}", f"{base}/ontologies/PATO"),
+                _class("http://purl.obolibrary.org/obo/UBERON_0000001", f"{base}/ontologies/UBERON",
+                       f"{base}/uberon/0000001"),
+            ]}])
+        if self.path == "/uberon/0000001":
+            return self._send(200, {"prefLabel": "Shared Target", "obsolete": False})
+        return self._send(404, {})
+
+    def _send(self, status, payload, headers=None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def stub_server(monkeypatch):
+    _StubBioPortal.hits.clear()
+    _StubBioPortal.rate_limited.clear()
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _StubBioPortal)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setattr(mapper, "http_getter", mapper.ThrottledGetter(max_retries=2, backoff_seconds=0))
+    monkeypatch.setattr(mapper, "mapped_term_cache", mapper.MappedTermCache())
+    with requests_cache.disabled():
+        yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+class _BulkCollection:
+    def __init__(self):
+        self.batches = []
+
+    def bulk_write(self, ops, ordered=True):
+        assert ordered is False
+        self.batches.append(list(ops))
+
+
+def test_concurrent_mapping_against_stub_server(stub_server):
+    docs = [{"_id": i, "curie_uc": f"PATO:{i:07d}"} for i in range(1, 13)]
+    collection = _BulkCollection()
+
+    updated = mapper.map_documents(docs, collection, "key", concurrency=4, batch_size=5, api_url=stub_server)
+
+    assert updated == 12
+    assert [len(batch) for batch in collection.batches] == [5, 5, 2]
+    updates = {op._filter["_id"]: op._doc["$set"] for batch in collection.batches for op in batch}
+    assert updates[3] == {
+        "label": "quality 0000003",
+        "obsolete": False,
+        "mappings": [{"curie": "UBERON:0000001", "prefix": "UBERON", "label_lc": "shared target",
+                      "obsolete": False}],
+    }
+    assert mapper.http_getter.retries == 12
+    assert _StubBioPortal.hits["/uberon/0000001"] == 1
+    assert mapper.mapped_term_cache.memory_hits + mapper.mapped_term_requests.coalesced >= 11
+
+
+def test_rate_limiter_spaces_requests_per_host(monkeypatch):
+    getter = mapper.ThrottledGetter(requests_per_second=20)
+    clock = [100.0]
+    sleeps = []
+    monkeypatch.setattr(mapper.time, "monotonic", lambda: clock[0])
+    monkeypatch.setattr(mapper.time, "sleep", sleeps.append)
+
+    for _ in range(3):
+        getter._wait_for_slot("https://data.bioontology.org/a")
+    getter._wait_for_slot("https://other.example/b")
+
+    assert sleeps == pytest.approx([0.05, 0.10])
+
+
+def test_cached_responses_are_not_throttled(stub_server, tmp_path, monkeypatch):
+    getter = mapper.ThrottledGetter(requests_per_second=1)
+    sleeps = []
+    monkeypatch.setattr(mapper.time, "sleep", sleeps.append)
+    url = f"{stub_server}/uberon/0000001"
+
+    with requests_cache.enabled(str(tmp_path / "http-cache")):
+        responses = [getter.get(url, headers={"Authorization": "apikey token=key"}) for _ in range(5)]
+
+    assert [response.json()["prefLabel"] for response in responses] == ["Shared Target"] * 5
+    assert [response.from_cache for response in responses] == [False] + [True] * 4
+    assert _StubBioPortal.hits["/uberon/0000001"] == 1
+    assert sleeps == []
+    assert getter._next_slot[urllib.parse.urlsplit(url).netloc] - time.monotonic() <= 1
+
+
+def test_in_flight_requests_share_one_fetch():
+    in_flight = mapper.InFlightRequests()
+    release = threading.Event()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        release.wait(5)
+        return {"prefLabel": "x"}
+
+    with concurrent.futures.ThreadPoolExecutor(4) as pool:
+        futures = [pool.submit(in_flight.run, "self-link", fetch) for _ in range(4)]
+        while in_flight.coalesced < 3:
+            time.sleep(0.01)
+        release.set()
+        results = [f.result() for f in futures]
+
+    assert results == [{"prefLabel": "x"}] * 4
+    assert len(calls) == 1
+
+
+def test_mapped_term_cache_persists_label_and_obsolete(tmp_path, stub_server, monkeypatch):
+    path = str(tmp_path / "mapped_terms.sqlite")
+    self_link = f"{stub_server}/uberon/0000001"
+
+    first = mapper.MappedTermCache(path)
+    monkeypatch.setattr(mapper, "mapped_term_cache", first)
+    assert mapper.get_mapped_term_info(self_link, "key") == {"prefLabel": "Shared Target", "obsolete": False}
+    assert mapper.get_mapped_term_info(self_link, "key") == {"prefLabel": "Shared Target", "obsolete": False}
+    first.close()
+    assert (first.memory_hits, first.misses) == (1, 1)
+    assert first.bytes_avoided > 0
+
+    second = mapper.MappedTermCache(path)
+    monkeypatch.setattr(mapper, "mapped_term_cache", second)
+    assert mapper.get_mapped_term_info(self_link, "key") == {"prefLabel": "Shared Target", "obsolete": False}
+    second.close()
+    assert (second.disk_hits, second.misses) == (1, 0)
+    assert _StubBioPortal.hits["/uberon/0000001"] == 1
+
+
+def test_mapped_term_cache_evicts_least_recently_used():
+    cache = mapper.MappedTermCache(maxsize=2)
+    for link in ("a", "b"):
+        cache.put(link, {"prefLabel": link, "obsolete": False}, 10)
+    cache.get("a")
+    cache.put("c", {"prefLabel": "c", "obsolete": True}, 10)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == {"prefLabel": "a", "obsolete": False}
+    assert cache.get("c") == {"prefLabel": "c", "obsolete": True}
+
+
+def test_stale_persistent_entries_are_refetched(tmp_path, monkeypatch):
+    path = str(tmp_path / "mapped_terms.sqlite")
+    cache = mapper.MappedTermCache(path)
+    cache.put("a", {"prefLabel": "a", "obsolete": False}, 10)
+    cache.close()
+    monkeypatch.setattr(mapper.time, "time", lambda: 1e12)
+
+    assert mapper.MappedTermCache(path).get("a") is None
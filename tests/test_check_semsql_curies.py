@@ -0,0 +1,123 @@
+"""Unit tests for the bulk semsql CURIE resolution in env-triad-check-semsql-curies.
+
+The bulk path must set the same label/obsolete values as the per-document
+OAK loop: the label and owl:deprecated flag of the CURIE with its prefix
+upper-cased, or None for both when the term has no label.
+"""
+
+import re
+import sqlite3
+
+from oaklib import get_adapter
+
+from external_metadata_awareness import new_check_semsql_curies as check
+
+
+def _semsql_db(path, statements):
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE statements (stanza TEXT, subject TEXT, predicate TEXT, object TEXT, "
+                 "value TEXT, datatype TEXT, language TEXT)")
+    conn.executemany("INSERT INTO statements (stanza, subject, predicate, value) VALUES (?, ?, ?, ?)",
+                     [(s, s, p, v) for s, p, v in statements])
+    # The semsql views OAK's SqlImplementation reads labels and obsoletes from.
+    conn.execute("CREATE VIEW rdfs_label_statement AS SELECT * FROM statements WHERE predicate = 'rdfs:label'")
+    conn.execute("CREATE VIEW deprecated_node AS SELECT DISTINCT subject AS id FROM statements "
+                 "WHERE predicate = 'owl:deprecated' AND value = 'true'")
+    conn.commit()
+    conn.close()
+    return str(path)
+
+
+class _CurieCollection:
+    """aggregate/bulk_write stand-in holding env_triad_component_curies_uc documents."""
+
+    def __init__(self, docs):
+        self.docs = {doc["_id"]: dict(doc) for doc in docs}
+        self.batches = []
+
+    def aggregate(self, pipeline, allowDiskUse=False):
+        ontologies = pipeline[-1]["$match"]["ontology"]["$in"]
+        for doc in self.docs.values():
+            ontology = (doc.get("prefix_uc") or "").lower()
+            if doc.get("curie_uc") and ontology in ontologies:
+                yield {"_id": doc["_id"], "curie_uc": doc["curie_uc"], "ontology": ontology}
+
+    def count_documents(self, query):
+        return len(list(self.find(query)))
+
+    def find(self, query):
+        pattern = query["prefix_uc"]["$regex"]
+        return [dict(doc) for doc in self.docs.values() if re.match(pattern, doc.get("prefix_uc") or "", re.I)]
+
+    def update_one(self, query, update):
+        self.docs[query["_id"]].update(update["$set"])
+
+    def bulk_write(self, ops, ordered=True):
+        assert not ordered
+        self.batches.append(len(ops))
+        for op in ops:
+            self.docs[op._filter["_id"]].update(op._doc["$set"])
+
+
+def test_resolve_uses_the_canonical_curie_and_deprecation(tmp_path):
+    db_path = _semsql_db(tmp_path / "envo.db", [
+        ("ENVO:00001998", "rdfs:label", "soil"),
+        ("ENVO:00002001", "rdfs:label", "obsolete waste water"),
+        ("ENVO:00002001", "owl:deprecated", "true"),
+    ])
+
+    resolved = check.resolve_semsql_curies(
+        "envo", db_path, ["envo:00001998", "ENVO:00002001", "ENVO:99999999"], batch_size=2)
+
+    assert resolved == {
+        "envo:00001998": {"label": "soil", "obsolete": False},
+        "ENVO:00002001": {"label": "obsolete waste water", "obsolete": True},
+        "ENVO:99999999": {"label": None, "obsolete": None},
+    }
+
+
+def test_process_collection_updates_in_scope_documents_in_bulk(tmp_path):
+    db_paths = {
+        "envo": _semsql_db(tmp_path / "envo.db", [("ENVO:00001998", "rdfs:label", "soil")]),
+        "po": _semsql_db(tmp_path / "po.db", [("PO:0025034", "rdfs:label", "leaf"),
+                                              ("PO:0000003", "owl:deprecated", "true")]),
+    }
+    collection = _CurieCollection([
+        {"_id": 1, "curie_uc": "ENVO:00001998", "prefix_uc": "ENVO"},
+        {"_id": 2, "curie_uc": "envo:00001998", "prefix_uc": "envo"},
+        {"_id": 3, "curie_uc": "PO:0025034", "prefix_uc": "PO"},
+        {"_id": 4, "curie_uc": "PO:0000003", "prefix_uc": "PO"},
+        {"_id": 5, "curie_uc": "FOO:1", "prefix_uc": "FOO"},
+        {"_id": 6, "curie_uc": "", "prefix_uc": "ENVO"},
+    ])
+
+    updated = check.process_collection(collection, workers=2, batch_size=2, db_paths=db_paths)
+
+    assert updated == 4
+    assert max(collection.batches) <= 2
+    labels = {_id: (doc.get("label"), doc.get("obsolete")) for _id, doc in collection.docs.items()}
+    assert labels == {1: ("soil", False), 2: ("soil", False), 3: ("leaf", False), 4: (None, None),
+                      5: (None, None), 6: (None, None)}
+    assert "label" not in collection.docs[5] and "label" not in collection.docs[6]
+
+
+def test_per_document_and_bulk_paths_agree_on_deprecated_terms(tmp_path):
+    db_path = _semsql_db(tmp_path / "envo.db", [
+        ("ENVO:00001998", "rdfs:label", "soil"),
+        ("ENVO:00002001", "rdfs:label", "obsolete waste water"),
+        ("ENVO:00002001", "owl:deprecated", "true"),
+    ])
+    docs = [
+        {"_id": 1, "curie_uc": "ENVO:00001998", "prefix_uc": "ENVO"},
+        {"_id": 2, "curie_uc": "envo:00002001", "prefix_uc": "envo"},
+        {"_id": 3, "curie_uc": "ENVO:99999999", "prefix_uc": "ENVO"},
+    ]
+    per_document = _CurieCollection(docs)
+    bulk = _CurieCollection(docs)
+
+    check.process_documents(per_document, {"prefix_uc": {"$regex": "^envo$", "$options": "i"}},
+                            get_adapter(f"sqlite:{db_path}"), "envo")
+    check.process_collection(bulk, workers=1, db_paths={"envo": db_path})
+
+    assert per_document.docs == bulk.docs
+    assert per_document.docs[2]["obsolete"] is True
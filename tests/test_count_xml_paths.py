@@ -0,0 +1,111 @@
+"""Unit tests for XPath counting (count-xml-paths).
+
+The counts feed schema-drift checks between NCBI dumps, so the stack-based
+and sharded counters must produce exactly what the original getparent()-walk
+counter produced. _reference_counts below is that original algorithm.
+"""
+
+import json
+from collections import Counter
+from pathlib import Path
+
+import pytest
+from click.testing import CliRunner
+from lxml import etree
+
+from external_metadata_awareness import count_xml_paths
+
+_FIXTURE = Path(__file__).resolve().parent / "data" / "biosample_set_sample.xml"
+
+_BIOPROJECT_LIKE = """<?xml version="1.0" encoding="UTF-8"?>
+<PackageSet version="1">
+  <Package>
+    <Project><Project><ProjectID><ArchiveID accession="PRJNA1" id="1"/></ProjectID>
+      <ProjectDescr><Title>One</Title></ProjectDescr></Project></Project>
+    <Submission submitted="2020-01-01"><Description><Organization role="owner"><Name>Lab</Name>
+    </Organization></Description></Submission>
+  </Package>
+  <Package>
+    <Project><Project><ProjectID><ArchiveID accession="PRJNA2" id="2"/></ProjectID>
+      <ProjectDescr><Title>Two</Title><Description>text &amp; more</Description></ProjectDescr>
+    </Project></Project>
+  </Package>
+  <Package><Project><Project/></Project></Package>
+</PackageSet>
+"""
+
+
+def _reference_counts(xml_file):
+    xpath_counter = Counter()
+    for _, elem in etree.iterparse(str(xml_file), events=("end",)):
+        path_parts = []
+        current = elem
+        while current is not None:
+            path_parts.append(current.tag)
+            current = current.getparent()
+        base_xpath = "/" + "/".join(reversed(path_parts))
+        xpath_counter[base_xpath] += 1
+        for attr in elem.attrib:
+            xpath_counter[f"{base_xpath}@{attr}"] += 1
+        if elem.text and elem.text.strip():
+            xpath_counter[f"{base_xpath}#text"] += 1
+        elem.clear()
+        while elem.getprevious() is not None:
+            del elem.getparent()[0]
+    return sorted(xpath_counter.items(), key=lambda x: (-x[1], x[0]))
+
+
+@pytest.fixture(params=["biosample", "bioproject"])
+def xml_file(request, tmp_path):
+    if request.param == "biosample":
+        return _FIXTURE
+    path = tmp_path / "bioproject.xml"
+    path.write_text(_BIOPROJECT_LIKE, encoding="utf-8")
+    return path
+
+
+def test_stack_counter_matches_reference(xml_file):
+    counts = count_xml_paths.count_unique_xpaths(str(xml_file), 10, "/PackageSet/Package/Project", None)
+
+    assert counts == _reference_counts(xml_file)
+
+
+@pytest.mark.parametrize("shard_size", [1, 2048])
+def test_parallel_counter_matches_reference(xml_file, shard_size):
+    counts = count_xml_paths.count_unique_xpaths_parallel(
+        str(xml_file), 10, "/PackageSet/Package/Project", workers=2, shard_size=shard_size)
+
+    assert counts == _reference_counts(xml_file)
+
+
+def test_stop_after_stops_on_the_always_count_path(tmp_path):
+    path = tmp_path / "bioproject.xml"
+    path.write_text(_BIOPROJECT_LIKE, encoding="utf-8")
+
+    counts = dict(count_xml_paths.count_unique_xpaths(str(path), 10, "/PackageSet/Package", 2))
+
+    assert counts["/PackageSet/Package"] == 2
+    assert "/PackageSet" not in counts
+
+
+def test_cli_writes_identical_json_with_workers(tmp_path):
+    runner = CliRunner()
+    outputs = []
+    for workers in ("1", "3"):
+        output = tmp_path / f"counts-{workers}.json"
+        result = runner.invoke(count_xml_paths.main, [
+            "--xml-file", str(_FIXTURE), "--output", str(output), "--workers", workers,
+            "--shard-size-mb", "1", "--always-count-path", "/BioSampleSet/BioSample"])
+        assert result.exit_code == 0, result.output
+        outputs.append(output.read_text())
+
+    assert outputs[0] == outputs[1]
+    assert json.loads(outputs[0])["paths"]["/BioSampleSet/BioSample"] == 12
+
+
+def test_cli_rejects_stop_after_with_workers():
+    result = CliRunner().invoke(count_xml_paths.main, [
+        "--xml-file", str(_FIXTURE), "--workers", "2", "--stop-after", "5"])
+
+    assert result.exit_code != 0
+    assert "--stop-after" in result.output
@@ -5,13 +5,29 @@ they take strings and return strings/dicts with no I/O, so they are cheap to
 test and guard the core parsing logic against refactors.
 """
 
+import datetime
+import os
+
+from external_metadata_awareness import new_env_triad_values_splitter as splitter
 from external_metadata_awareness.new_env_triad_values_splitter import (
+    PrefixSets,
     extract_components,
     is_digits_only,
     make_plain_component,
     normalize_label,
 )
 
+_OBO_LC = {"envo", "uberon", "po"}
+_BIOPORTAL_LC = {"envo", "snomedct", "of"}
+_VALUES = [
+    "soil [ENVO:00001998]",
+    "leaf (PO_0025034) | root [po:0009005]",
+    "forest biome ENVO:01000174",
+    "SNOMEDCT:12345; gut OF:99",
+    "plain text, more text",
+    "ENVO:ENVO:00002030",
+]
+
 
 def test_is_digits_only():
     assert is_digits_only("123") is True
@@ -54,3 +70,62 @@ def test_extract_components_bracketed_curie():
 def test_extract_components_splits_on_comma():
     comps = extract_components("soil, water")
     assert [c["label"] for c in comps] == ["soil", "water"]
+
+
+def test_prefix_sets_match_the_per_call_indicator_sets():
+    prefix_sets = PrefixSets.from_indicators(_OBO_LC, _BIOPORTAL_LC)
+    known = {x.upper() for x in _OBO_LC | _BIOPORTAL_LC} - {"OF", "GUT", "RHIZOSPHERE"}
+
+    assert prefix_sets.known == known
+    for value in _VALUES:
+        assert extract_components(value, prefix_sets=prefix_sets) == extract_components(
+            value, obo_ontology_indicators_lc=_OBO_LC, bioportal_ontology_indicators_lc=_BIOPORTAL_LC,
+            known_prefixes=known)
+
+
+def test_pool_split_matches_inline_split_in_order():
+    prefix_sets = PrefixSets.from_indicators(_OBO_LC, _BIOPORTAL_LC)
+    pairs = list(enumerate(_VALUES * 5))
+
+    pooled = list(splitter.split_in_pool(pairs, prefix_sets, workers=2, chunk_size=4))
+
+    assert pooled == [(_id, splitter.split_value(value, prefix_sets)) for _id, value in pairs]
+    _, components = pooled[0]
+    assert components[0]["curie_uc"] == "ENVO:00001998"
+    assert components[0]["uses_obo_prefix"] and components[0]["uses_bioportal_prefix"]
+
+
+class _BulkCollection:
+    def __init__(self):
+        self.batches = []
+
+    def bulk_write(self, ops, ordered=True):
+        assert not ordered
+        self.batches.append(ops)
+
+
+def test_write_components_batches_updates():
+    collection = _BulkCollection()
+    results = [(i, [{"label": "x"}] * (i % 3)) for i in range(7)]
+
+    assert splitter.write_components(collection, results, batch_size=3) == (7, 6)
+    assert [len(batch) for batch in collection.batches] == [3, 3, 1]
+    assert collection.batches[0][2]._doc == {"$set": {"components": [{"label": "x"}] * 2, "components_count": 2}}
+
+
+def test_prefix_registries_are_cached_until_stale(monkeypatch, tmp_path):
+    fetches = []
+    monkeypatch.setattr(splitter, "fetch_obo_indicators_lc", lambda: fetches.append("obo") or set(_OBO_LC))
+    monkeypatch.setattr(splitter, "fetch_bioportal_indicators_lc",
+                        lambda api_key: fetches.append(api_key) or set(_BIOPORTAL_LC))
+    cache = str(tmp_path / "registries.json")
+    max_age = datetime.timedelta(days=7)
+
+    assert splitter.load_prefix_registries(cache, max_age, "key") == (_OBO_LC, _BIOPORTAL_LC)
+    assert splitter.load_prefix_registries(cache, max_age, "key") == (_OBO_LC, _BIOPORTAL_LC)
+    assert fetches == ["obo", "key"]
+
+    stale = os.path.getmtime(cache) - max_age.total_seconds() - 1
+    os.utime(cache, (stale, stale))
+    splitter.load_prefix_registries(cache, max_age, "key")
+    assert fetches == ["obo", "key", "obo", "key"]
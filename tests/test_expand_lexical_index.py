@@ -0,0 +1,137 @@
+"""Unit tests for the lexical index expansion and merge (expand-envo-po-lexical-index)."""
+
+import pytest
+from oaklib.datamodels.lexical_index import (
+    LexicalGrouping,
+    LexicalIndex,
+    LexicalTransformation,
+    LexicalTransformationPipeline,
+    RelationshipToTerm,
+    TransformationType,
+)
+from oaklib.datamodels.synonymizer_datamodel import Synonymizer
+from oaklib.utilities.lexical.lexical_indexer import apply_transformation
+
+from external_metadata_awareness import new_expand_envo_po_lexical_index as expander
+
+_PIPELINE = LexicalTransformationPipeline(
+    name="punctuation_insensitive",
+    transformations=[
+        expander.PUNCTUATION_TRANSFORMATION,
+        LexicalTransformation(TransformationType.CaseNormalization),
+        LexicalTransformation(TransformationType.WhitespaceNormalization),
+    ],
+)
+
+
+def _rel(element, term, predicate="rdfs:label"):
+    return RelationshipToTerm(predicate=predicate, element=element, element_term=term)
+
+
+def _index(groupings, pipeline=_PIPELINE):
+    index = LexicalIndex(pipelines={pipeline.name: pipeline})
+    for term, relationships in groupings.items():
+        index.groupings[term] = LexicalGrouping(term=term)
+        index.groupings[term].relationships = list(relationships)
+    return index
+
+
+class _FakeAdapter:
+    """An adapter without a semsql session, so aliases come from entity_alias_map."""
+
+    def __init__(self, labels, synonyms):
+        self._labels = labels
+        self._synonyms = synonyms
+
+    def obsoletes(self):
+        return iter(self._labels)
+
+    def labels(self, curies):
+        for curie in curies:
+            yield curie, self._labels[curie]
+
+    def entity_alias_map(self, curie):
+        return {"rdfs:label": [self._labels[curie]], **self._synonyms.get(curie, {})}
+
+
+@pytest.mark.parametrize("text", [
+    "Forest  soil", "  leaf_litter (dead) ", "plain", "sea-water;  brackish", "obsolete_thing", "",
+])
+def test_compiled_transformations_match_apply_transformation(text):
+    rule = Synonymizer(match=r"ies$", replacement="y ")
+    transformations = [LexicalTransformation(TransformationType.Synonymization, params=[rule])]
+    transformations += [expander.PUNCTUATION_TRANSFORMATION] + list(_PIPELINE.transformations)
+
+    expected = text
+    for transformation in transformations:
+        result = apply_transformation(expected, transformation)
+        expected = result[1] if isinstance(result, tuple) else result
+
+    assert expander.compile_transformations(transformations)(text) == expected
+
+
+def test_unique_relationships_keeps_first_of_each():
+    first, duplicate, other = _rel("ENVO:1", "soil"), _rel("ENVO:1", "soil"), _rel("ENVO:1", "Soil")
+
+    assert expander.unique_relationships([first, other, duplicate]) == [first, other]
+
+
+def test_obsolete_terms_are_added_without_prefix_or_duplicates():
+    index = _index({"soil": [_rel("ENVO:1", "soil")]})
+    adapter = _FakeAdapter(
+        {"ENVO:2": "obsolete Forest-Soil", "ENVO:3": "obsolete soil", "ENVO:4": None},
+        {"ENVO:2": {"oio:hasExactSynonym": ["obsolete woodland soil", "forest soil"]}},
+    )
+
+    expander.add_obsolete_terms_to_lexical_index(adapter, index)
+
+    assert [(r.element, r.element_term) for r in index.groupings["soil"].relationships] == \
+        [("ENVO:1", "soil"), ("ENVO:3", "soil")]
+    forest = index.groupings["forest soil"].relationships
+    assert [(r.predicate, r.element, r.element_term) for r in forest] == [
+        ("rdfs:label", "ENVO:2", "Forest-Soil"),
+        ("oio:hasExactSynonym", "ENVO:2", "forest soil"),
+    ]
+    assert forest[0].pipeline == ["punctuation_insensitive"]
+    assert [r.element_term for r in index.groupings["woodland soil"].relationships] == ["woodland soil"]
+    assert not any(r.element == "ENVO:4" for g in index.groupings.values() for r in g.relationships)
+
+
+def test_merge_keeps_first_seen_term_order_and_concatenates_relationships():
+    envo = _index({"soil": [_rel("ENVO:1", "soil")], "forest": [_rel("ENVO:5", "forest")]})
+    po = _index({"leaf": [_rel("PO:1", "leaf")], "soil": [_rel("PO:9", "soil"), _rel("ENVO:1", "soil")]})
+    uberon = _index({"bone": [_rel("UBERON:1", "bone")], "soil": [_rel("UBERON:7", "soil")]})
+
+    merged = expander.merge_lexical_index_list([envo, po, uberon])
+
+    assert list(merged.groupings) == ["soil", "forest", "leaf", "bone"]
+    assert [r.element for r in merged.groupings["soil"].relationships] == ["ENVO:1", "PO:9", "UBERON:7"]
+    assert list(merged.pipelines) == ["punctuation_insensitive"]
+
+
+def test_merge_rejects_incompatible_pipelines_unless_told_not_to():
+    other = LexicalTransformationPipeline(
+        name="punctuation_insensitive",
+        transformations=[LexicalTransformation(TransformationType.CaseNormalization)],
+    )
+    indexes = [_index({"soil": [_rel("ENVO:1", "soil")]}), _index({"leaf": [_rel("PO:1", "leaf")]}, other)]
+
+    with pytest.raises(ValueError, match="punctuation_insensitive"):
+        expander.merge_lexical_index_list(indexes)
+    merged = expander.merge_lexical_index_list(indexes, validate_pipelines=False)
+    assert merged.pipelines["punctuation_insensitive"] is _PIPELINE
+
+
+def test_build_expanded_index_adds_obsoletes_for_envo_only(monkeypatch):
+    built = []
+
+    def build(adapter_string, include_obsoletes=False):
+        built.append((adapter_string, include_obsoletes))
+        return _index({adapter_string: [_rel(adapter_string, adapter_string)]})
+
+    monkeypatch.setattr(expander, "build_ontology_index", build)
+
+    merged = expander.build_expanded_lexical_index(extra_adapter_strings=["sqlite:obo:uberon"], workers=1)
+
+    assert built == [("sqlite:obo:envo", True), ("sqlite:obo:po", False), ("sqlite:obo:uberon", False)]
+    assert list(merged.groupings) == ["sqlite:obo:envo", "sqlite:obo:po", "sqlite:obo:uberon"]
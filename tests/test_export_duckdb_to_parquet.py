@@ -0,0 +1,54 @@
+"""Unit tests for the DuckDB-to-Parquet exporter's partitioning, row groups and manifest."""
+
+import json
+
+import duckdb
+import pyarrow.dataset as ds
+import pytest
+from click.testing import CliRunner
+
+from external_metadata_awareness.export_duckdb_to_parquet import export_duckdb_to_parquet
+
+
+@pytest.fixture
+def duckdb_file(tmp_path):
+    path = tmp_path / "flat.duckdb"
+    with duckdb.connect(str(path)) as conn:
+        conn.execute("CREATE TABLE attributes AS SELECT i AS id, ['depth', 'ph', 'temp'][i % 3 + 1] AS harmonized_name "
+                     "FROM range(9000) r(i)")
+        conn.execute("CREATE TABLE links AS SELECT i AS id, 'SAMN' || i AS accession FROM range(25) r(i)")
+    return path
+
+
+def test_partitioned_concurrent_export_writes_manifest(duckdb_file, tmp_path):
+    out = tmp_path / "parquet"
+
+    result = CliRunner().invoke(export_duckdb_to_parquet, [
+        str(duckdb_file), "--output-dir", str(out), "--workers", "2", "--row-group-size", "2048",
+        "--partition-by", "attributes=harmonized_name"])
+
+    assert result.exit_code == 0, result.output
+    manifest = json.loads((out / "manifest.json").read_text())
+    attributes, links = manifest["tables"]
+    assert (attributes["table"], attributes["rows"], attributes["partition_by"]) == (
+        "attributes", 9000, ["harmonized_name"])
+    assert sorted(f["path"].split("/")[1] for f in attributes["files"]) == [
+        "harmonized_name=depth", "harmonized_name=ph", "harmonized_name=temp"]
+    assert all(f["row_groups"] == 2 for f in attributes["files"])
+    assert sum(f["rows"] for f in attributes["files"]) == 9000
+    assert (links["path"], links["rows"], len(links["files"])) == ("links.parquet", 25, 1)
+
+    dataset = ds.dataset(out / "attributes", format="parquet", partitioning="hive")
+    assert dataset.count_rows(filter=ds.field("harmonized_name") == "ph") == 3000
+
+
+def test_partition_spec_must_name_a_table(duckdb_file, tmp_path):
+    result = CliRunner().invoke(export_duckdb_to_parquet, [
+        str(duckdb_file), "--output-dir", str(tmp_path / "out"), "--partition-by", "nope=col"])
+
+    assert result.exit_code != 0
+    assert "nope" in result.output
+
+    result = CliRunner().invoke(export_duckdb_to_parquet, [
+        str(duckdb_file), "--output-dir", str(tmp_path / "out"), "--partition-by", "attributes"])
+    assert result.exit_code != 0
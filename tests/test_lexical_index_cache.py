@@ -0,0 +1,57 @@
+"""Unit tests for the binary lexical index cache used by env-triad-oak-annotator."""
+
+import os
+
+from external_metadata_awareness import lexical_index_cache
+from external_metadata_awareness.lexical_automaton import LexicalAutomaton
+
+
+def _automaton():
+    return LexicalAutomaton(["soil", "forest soil"], [[("rdfs:label", "ENVO:00001998", "soil")],
+                                                      [("rdfs:label", "ENVO:00002261", "forest soil")]])
+
+
+def _write(tmp_path):
+    source = tmp_path / "envo.db"
+    source.write_bytes(b"semsql")
+    cache = tmp_path / "index.pkl"
+    lexical_index_cache.write_index_cache(str(cache), _automaton(), {"ENVO:00001998": "soil"}, [str(source)])
+    return cache, source
+
+
+def test_round_trip_with_header(tmp_path):
+    cache, source = _write(tmp_path)
+
+    automaton, element_to_label = lexical_index_cache.read_index_cache(str(cache), [str(source)])
+    header = lexical_index_cache.read_index_header(str(cache))
+
+    assert automaton.first_occurrences("forest soil") == {0: 7, 1: 0}
+    assert element_to_label == {"ENVO:00001998": "soil"}
+    assert header["format_version"] == lexical_index_cache.FORMAT_VERSION
+    assert header["keys"] == 2
+    assert header["sources"][0][0] == str(source)
+    assert not os.path.exists(f"{cache}.tmp")
+
+
+def test_changed_source_invalidates_cache(tmp_path):
+    cache, source = _write(tmp_path)
+    source.write_bytes(b"a newer semsql release")
+
+    assert lexical_index_cache.read_index_cache(str(cache), [str(source)]) is None
+
+
+def test_other_format_version_invalidates_cache(tmp_path, monkeypatch):
+    cache, source = _write(tmp_path)
+    monkeypatch.setattr(lexical_index_cache, "FORMAT_VERSION", lexical_index_cache.FORMAT_VERSION + 1)
+
+    assert lexical_index_cache.read_index_cache(str(cache), [str(source)]) is None
+
+
+def test_damaged_or_missing_cache_is_ignored(tmp_path):
+    cache, source = _write(tmp_path)
+    cache.write_bytes(cache.read_bytes()[:-10])
+
+    assert lexical_index_cache.read_index_cache(str(cache), [str(source)]) is None
+    assert lexical_index_cache.read_index_cache(str(tmp_path / "missing.pkl"), [str(source)]) is None
+    (tmp_path / "other.pkl").write_bytes(b"not a cache")
+    assert lexical_index_cache.read_index_header(str(tmp_path / "other.pkl")) is None
@@ -0,0 +1,201 @@
+"""Unit tests for the quantulum3 parsing helpers in measurement discovery.
+
+The serial loop and the --workers process pool both build their documents
+from parse_content/result_doc, so these check that the pool returns the same
+per-value results, in input order, as parsing in-process. The streaming
+helpers must stay lazy so no list of pairs is ever built.
+"""
+
+import click
+import pytest
+from pymongo.errors import BulkWriteError
+
+from external_metadata_awareness import measurement_discovery_efficient as discovery
+
+_CONTENTS = ["25 m", "7.2", "12.5 degree Celsius", "soil", "0.5 g", "pH 7", "3 kg", "100 mg/L"]
+
+
+def _pairs():
+    return [{"harmonized_name": "depth", "content": c, "biosample_count": i + 1}
+            for i, c in enumerate(_CONTENTS)]
+
+
+def test_looks_like_measurement_needs_letter_and_digit():
+    assert discovery.looks_like_measurement("25 m") is True
+    assert discovery.looks_like_measurement("7.2") is False
+    assert discovery.looks_like_measurement("soil") is False
+
+
+def test_result_doc_matches_quantity():
+    (fields,) = discovery.parse_content("25 m")
+
+    doc = discovery.result_doc("depth", "25 m", 3, fields)
+
+    assert doc == {
+        "harmonized_name": "depth",
+        "original_content": "25 m",
+        "biosample_count": 3,
+        "value": 25.0,
+        "unit": "metre",
+        "entity": "length",
+        "span_start": 0,
+        "span_end": 4,
+        "surface_text": "25 m",
+        "coverage_pct": 100.0,
+        "content_length": 4,
+    }
+
+
+def test_pool_results_match_in_process_parsing_in_order():
+    pairs = _pairs()
+
+    pooled = list(discovery.parse_in_pool(pairs, workers=2, chunk_size=3))
+
+    assert [pair for pair, _ in pooled] == pairs
+    assert [[discovery.quantity_fields(q) for q in parsed] for _, parsed in pooled] == [
+        discovery.parse_content(c) for c in _CONTENTS]
+
+
+def test_parse_chunk_reports_errors_per_value(monkeypatch):
+    def fake_parse(content):
+        if content == "bad":
+            raise ValueError("cannot parse this value")
+        return []
+
+    monkeypatch.setattr(discovery.parser, "parse", fake_parse)
+
+    assert discovery.parse_chunk(["ok", "bad"]) == [[], "cannot parse this value"]
+
+
+class _RecordingCollection:
+    def __init__(self):
+        self.batches = []
+
+    def insert_many(self, docs):
+        self.batches.append(list(docs))
+
+
+class _KeyedCollection:
+    def __init__(self, fail_with_code=None):
+        self.docs = {}
+        self.fail_with_code = fail_with_code
+
+    def insert_many(self, docs, ordered=True):
+        assert ordered is False
+        errors = []
+        for i, doc in enumerate(docs):
+            if doc["_id"] in self.docs or self.fail_with_code:
+                errors.append({"index": i, "code": self.fail_with_code or 11000, "errmsg": "write failed"})
+            else:
+                self.docs[doc["_id"]] = doc
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, "writeConcernErrors": []})
+
+
+def test_insert_result_docs_ignores_only_duplicate_keys():
+    collection = _KeyedCollection()
+    discovery.insert_result_docs(collection, [{"_id": "depth:5 m:0"}])
+    discovery.insert_result_docs(collection, [{"_id": "depth:5 m:0"}, {"_id": "depth:5 m:1"}])
+
+    assert sorted(collection.docs) == ["depth:5 m:0", "depth:5 m:1"]
+    with pytest.raises(BulkWriteError):
+        discovery.insert_result_docs(_KeyedCollection(fail_with_code=121), [{"_id": "x"}])
+
+
+def test_stream_chain_saves_counts_and_skips_lazily():
+    rows = [{"harmonized_name": name, "content": "5 m", "biosample_count": 2}
+            for name in ["depth", "host", "depth", "elev", "strain"]]
+    consumed = []
+
+    def cursor():
+        for row in rows:
+            consumed.append(row)
+            yield row
+
+    stats = discovery.new_stream_stats()
+    saved = _RecordingCollection()
+    chain = discovery.apply_skip_list(discovery.stream_aggregation(cursor(), stats, saved, agg_batch_size=2), stats)
+
+    assert next(chain)["harmonized_name"] == "depth"
+    assert len(consumed) == 1
+    assert [r["harmonized_name"] for r in chain] == ["depth", "elev"]
+    assert [len(batch) for batch in saved.batches] == [2, 2, 1]
+    assert stats["total_count"] == 5
+    assert stats["total_biosamples"] == 10
+    assert stats["saved_count"] == 5
+    assert stats["skipped_count"] == 2
+
+
+def test_prefetch_keeps_order_and_bounds_read_ahead():
+    produced = []
+
+    def source():
+        for i in range(100):
+            produced.append(i)
+            yield i
+
+    items = discovery.prefetch(source(), maxsize=5)
+    assert next(items) == 0
+    assert len(produced) <= 7
+    assert list(items) == list(range(1, 100))
+
+
+def test_prefetch_reraises_source_errors():
+    def source():
+        yield 1
+        raise RuntimeError("cursor died")
+
+    items = discovery.prefetch(source(), maxsize=5)
+    assert next(items) == 1
+    with pytest.raises(RuntimeError, match="cursor died"):
+        next(items)
+
+
+def test_shards_partition_the_pairs():
+    pairs = [{"harmonized_name": name, "content": f"{i} m", "biosample_count": 1}
+             for name in ["depth", "elev", "temp"] for i in range(200)]
+
+    owners = [[index for index in range(1, 5) if discovery.in_shard(pair, index, 4)] for pair in pairs]
+
+    assert all(len(owner) == 1 for owner in owners)
+    assert {owner[0] for owner in owners} == {1, 2, 3, 4}
+
+
+@pytest.mark.parametrize("spec", ["0/2", "3/2", "two/4", "1"])
+def test_shard_spec_rejects_bad_values(spec):
+    with pytest.raises(click.BadParameter):
+        discovery.parse_shard_spec(None, None, spec)
+
+
+def test_pair_result_docs_have_stable_ids():
+    pair = {"harmonized_name": "depth", "content": "5 to 10 m", "biosample_count": 2}
+
+    docs = discovery.pair_result_docs(pair, [(5.0, "metre", "length", 0, 1, "5"),
+                                             (10.0, "metre", "length", 5, 9, "10 m")])
+
+    assert [doc["_id"] for doc in docs] == ["depth:5 to 10 m:0", "depth:5 to 10 m:1"]
+    assert discovery.pair_result_docs(pair, [(5.0, "metre", "length", 0, 1, "5")])[0] == docs[0]
+
+
+class _CheckpointCollection:
+    def __init__(self):
+        self.docs = {}
+
+    def replace_one(self, query, doc, upsert=False):
+        self.docs[query["_id"]] = dict(doc)
+
+
+def test_checkpoint_records_last_saved_pair_and_resume_stage_skips_it():
+    collection = _CheckpointCollection()
+    checkpoint = {"_id": "1/1", "last_harmonized_name": None, "last_content": None}
+
+    discovery.save_checkpoint(collection, checkpoint, {"harmonized_name": "depth", "content": "5 m"}, 40)
+    discovery.save_checkpoint(collection, checkpoint, None, 41, complete=True)
+
+    saved = collection.docs["1/1"]
+    assert (saved["last_harmonized_name"], saved["last_content"]) == ("depth", "5 m")
+    assert (saved["pairs_processed"], saved["complete"]) == (41, True)
+    assert discovery.resume_stage(saved) == {"$match": {"$or": [
+        {"harmonized_name": {"$gt": "depth"}},
+        {"harmonized_name": "depth", "content": {"$gt": "5 m"}},
+    ]}}
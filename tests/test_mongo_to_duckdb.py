@@ -0,0 +1,116 @@
+"""Unit tests for the streaming MongoDB-to-DuckDB exporter.
+
+The fake collection answers the schema-inference aggregation the way
+MongoDB would for plain documents, so the tests cover type inference, the
+string conversion of mixed columns, sparse fields and batch boundaries.
+"""
+
+from datetime import datetime
+
+import duckdb
+import pyarrow as pa
+import pytest
+
+from external_metadata_awareness import export_submissions_to_duckdb as submissions_export
+from external_metadata_awareness import mongo_to_duckdb
+
+_BSON_TYPES = {bool: "bool", int: "int", float: "double", str: "string", type(None): "null",
+               list: "array", dict: "object", datetime: "date"}
+
+
+class _Collection:
+    def __init__(self, name, docs):
+        self.name = name
+        self.docs = docs
+        self.find_batch_size = None
+
+    def aggregate(self, pipeline, allowDiskUse=False):
+        fields = {}
+        for doc in self.docs:
+            for position, (key, value) in enumerate(doc.items()):
+                if key == "_id":
+                    continue
+                field = fields.setdefault(key, {"_id": key, "position": position, "types": set()})
+                field["position"] = min(field["position"], position)
+                field["types"].add(_BSON_TYPES[type(value)])
+        return sorted(fields.values(), key=lambda f: (f["position"], f["_id"]))
+
+    def find(self, query, projection, batch_size=None):
+        self.find_batch_size = batch_size
+        return ({k: v for k, v in doc.items() if k != "_id"} for doc in self.docs)
+
+
+@pytest.fixture
+def conn():
+    with duckdb.connect() as connection:
+        yield connection
+
+
+def test_inferred_schema_types_and_mixed_columns(conn):
+    collection = _Collection("biosamples.flattened", [
+        {"_id": 1, "accession": "SAMN1", "depth": 281, "ph": 7, "ok": True, "when": datetime(2024, 1, 2)},
+        {"_id": 2, "accession": "SAMN2", "depth": "281 degrees", "ph": 6.5, "ok": None, "tags": ["a", "b"]},
+        {"_id": 3, "accession": "SAMN3", "ph": None, "extra": "late column"},
+    ])
+
+    rows, columns = mongo_to_duckdb.export_collection(collection, conn, batch_size=2)
+
+    assert (rows, columns) == (3, 7)
+    types = dict(conn.execute(
+        "SELECT column_name, data_type FROM information_schema.columns "
+        "WHERE table_name = 'biosamples_flattened'").fetchall())
+    assert types == {"accession": "VARCHAR", "depth": "VARCHAR", "ph": "DOUBLE", "ok": "BOOLEAN",
+                     "when": "TIMESTAMP", "tags": "VARCHAR", "extra": "VARCHAR"}
+    assert conn.execute(
+        "SELECT depth, ph, tags, extra FROM biosamples_flattened ORDER BY accession").fetchall() == [
+        ("281", 7.0, None, None),
+        ("281 degrees", 6.5, "['a', 'b']", None),
+        (None, None, None, "late column"),
+    ]
+    assert collection.find_batch_size == 2
+
+
+def test_record_batches_are_bounded_and_lazy():
+    schema = pa.schema([("n", pa.int64())])
+    consumed = []
+
+    def rows():
+        for n in range(5):
+            consumed.append(n)
+            yield {"n": n}
+
+    batches = mongo_to_duckdb.record_batches(rows(), schema, batch_size=2)
+    assert next(batches).num_rows == 2
+    assert consumed == [0, 1]
+    assert [b.num_rows for b in batches] == [2, 1]
+
+
+def test_empty_collection_is_skipped(conn):
+    assert mongo_to_duckdb.export_collection(_Collection("empty", []), conn) == (0, 0)
+    assert conn.execute("SELECT COUNT(*) FROM duckdb_tables()").fetchone()[0] == 0
+
+
+def test_submission_exporters_stream_declared_tables(conn):
+    class _DB:
+        submission_biosample_rows = _Collection("submission_biosample_rows", [
+            {"submission_id": "s1", "key": "soil_data",
+             "row_data": [{"field": "depth", "value": 5}, {"field": "tags", "value": ["x"]},
+                          {"field": "blank", "value": None}]},
+        ])
+        nmdc_submissions = _Collection("nmdc_submissions", [
+            {"id": "s1", "status": "InProgress", "created": "2024-01-01",
+             "metadata_submission": {"studyForm": {"studyName": "Soil"},
+                                     "multiOmicsForm": {"dataGenerated": True}}},
+        ])
+        submission_biosample_slot_counts = _Collection("submission_biosample_slot_counts", [
+            {"field": "depth", "count": 3}])
+
+    submissions_export._export_submission_biosample_rows(_DB, conn)
+    submissions_export._export_nmdc_submissions(_DB, conn)
+    submissions_export._export_submission_biosample_slot_counts(_DB, conn)
+
+    assert conn.execute("SELECT field, value FROM submission_biosample_rows").fetchall() == [
+        ("depth", "5"), ("tags", '["x"]'), ("blank", None)]
+    assert conn.execute("SELECT submission_id, study_name, data_generated, doe FROM nmdc_submissions").fetchall() == [
+        ("s1", "Soil", True, None)]
+    assert conn.execute("SELECT * FROM submission_biosample_slot_counts").fetchall() == [("depth", 3)]
@@ -1,9 +1,17 @@
+import http.server
 import importlib.util
+import json
+import os
+import threading
+import sqlite3
 import sys
 import types
 from datetime import datetime as real_datetime, timezone
 from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
 import pytest
+import requests_cache
 
 
 def _load_script_module(monkeypatch):
@@ -12,7 +20,8 @@ def _load_script_module(monkeypatch):
     if 'tqdm' not in sys.modules:
         monkeypatch.setitem(sys.modules, 'tqdm', types.SimpleNamespace(tqdm=lambda iterable, **_kwargs: iterable))
     if 'pymongo' not in sys.modules:
-        monkeypatch.setitem(sys.modules, 'pymongo', types.SimpleNamespace(MongoClient=object))
+        monkeypatch.setitem(sys.modules, 'pymongo', types.SimpleNamespace(
+            MongoClient=object, InsertOne=object, ReplaceOne=object, UpdateOne=object))
     if 'pymongo.uri_parser' not in sys.modules:
         monkeypatch.setitem(sys.modules, 'pymongo.uri_parser', types.SimpleNamespace(parse_uri=lambda _u: {}))
     if 'linkml_runtime' not in sys.modules:
@@ -75,7 +84,7 @@ def test_process_submissions_uses_unique_temp_collection_name(monkeypatch, tmp_p
         def count_documents(self, _query):
             return 1
 
-        def find(self):
+        def find(self, _query=None):
             return [
                 {
                     'id': 'sub-1',
@@ -127,7 +136,7 @@ def test_process_submissions_uses_unique_temp_collection_name(monkeypatch, tmp_p
 
     monkeypatch.setattr(module, 'SchemaView', FakeSchemaView)
     monkeypatch.setattr(module, 'build_ontology_adapters', lambda _x: {})
-    monkeypatch.setattr(module, 'load_ontology_labels', lambda _x: {})
+    monkeypatch.setattr(module, 'load_ontology_labels', lambda _x, _cache_file: {})
     monkeypatch.setattr(module, 'find_obsolete_terms', lambda _x: [])
     monkeypatch.setattr(module, 'parse_uri', lambda _u: {'database': 'misc_metadata'})
     monkeypatch.setattr(module, 'MongoClient', FakeMongoClient)
@@ -181,7 +190,7 @@ def test_process_submissions_drops_temp_collection_on_rename_failure(monkeypatch
         def count_documents(self, _query):
             return 1
 
-        def find(self):
+        def find(self, _query=None):
             return [{
                 'id': 'sub-1',
                 'metadata_submission': {'sampleData': {'soil_data': [{'foo': 'bar'}]}},
@@ -220,7 +229,7 @@ def test_process_submissions_drops_temp_collection_on_rename_failure(monkeypatch
     client = FakeMongoClient('mongodb://example/misc_metadata')
     monkeypatch.setattr(module, 'SchemaView', FakeSchemaView)
     monkeypatch.setattr(module, 'build_ontology_adapters', lambda _x: {})
-    monkeypatch.setattr(module, 'load_ontology_labels', lambda _x: {})
+    monkeypatch.setattr(module, 'load_ontology_labels', lambda _x, _cache_file: {})
     monkeypatch.setattr(module, 'find_obsolete_terms', lambda _x: [])
     monkeypatch.setattr(module, 'parse_uri', lambda _u: {'database': 'misc_metadata'})
     monkeypatch.setattr(module, 'MongoClient', lambda _u: client)
@@ -274,7 +283,7 @@ def test_ctv_slot_parsing_non_string_and_matching_string(monkeypatch, tmp_path):
         def count_documents(self, _query):
             return 1
 
-        def find(self):
+        def find(self, _query=None):
             return [
                 {
                     'id': 'sub-1',
@@ -326,7 +335,7 @@ def test_ctv_slot_parsing_non_string_and_matching_string(monkeypatch, tmp_path):
 
     monkeypatch.setattr(module, 'SchemaView', FakeSchemaView)
     monkeypatch.setattr(module, 'build_ontology_adapters', lambda _x: {})
-    monkeypatch.setattr(module, 'load_ontology_labels', lambda _x: {})
+    monkeypatch.setattr(module, 'load_ontology_labels', lambda _x, _cache_file: {})
     monkeypatch.setattr(module, 'find_obsolete_terms', lambda _x: [])
     monkeypatch.setattr(module, 'parse_uri', lambda _u: {'database': 'misc_metadata'})
     monkeypatch.setattr(module, 'MongoClient', FakeMongoClient)
@@ -359,7 +368,7 @@ def test_additional_functions_close_mongo_client(monkeypatch):
         def count_documents(self, _query):
             return 0
 
-        def find(self):
+        def find(self, _query=None):
             return []
 
         def delete_many(self, _query):
@@ -562,3 +571,242 @@ def test_restore_secondary_indexes_replays_options(monkeypatch):
     module._restore_secondary_indexes(
         FakeColl(), [('y_uniq', [('y', -1)], {'unique': True})])
     assert calls == [([('y', -1)], {'name': 'y_uniq', 'unique': True})]
+
+
+def _semsql_adapter(path, labels):
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE statements (subject TEXT, predicate TEXT, value TEXT)")
+    conn.executemany("INSERT INTO statements VALUES (?, ?, ?)", labels)
+    conn.commit()
+    conn.close()
+    return types.SimpleNamespace(engine=types.SimpleNamespace(url=types.SimpleNamespace(database=str(path))))
+
+
+def test_ontology_labels_are_bulk_loaded_and_reused(monkeypatch, tmp_path):
+    module = _load_script_module(monkeypatch)
+    envo = _semsql_adapter(tmp_path / 'envo.db', [
+        ('ENVO:00001998', 'rdfs:label', 'soil'),
+        ('ENVO:00001998', 'oio:hasExactSynonym', 'dirt'),
+        ('ENVO:00002001', 'rdfs:label', 'waste water'),
+        ('_:b0', 'rdfs:label', 'anonymous'),
+    ])
+    po = _semsql_adapter(tmp_path / 'po.db', [('PO:0025034', 'rdfs:label', 'leaf')])
+    cache_file = str(tmp_path / 'labels.sqlite')
+
+    labels = module.load_ontology_labels({'envo': envo, 'po': po}, cache_file)
+    assert labels == {'ENVO:00001998': 'soil', 'ENVO:00002001': 'waste water', 'PO:0025034': 'leaf'}
+
+    reads = []
+    real_rows = module.semsql_label_rows
+    monkeypatch.setattr(module, 'semsql_label_rows', lambda p: reads.append(p) or real_rows(p))
+    assert module.load_ontology_labels({'envo': envo, 'po': po}, cache_file) == labels
+    assert reads == []
+
+    (tmp_path / 'po.db').unlink()
+    po = _semsql_adapter(tmp_path / 'po.db', [('PO:0025034', 'rdfs:label', 'leaf'),
+                                              ('PO:0009010', 'rdfs:label', 'seed')])
+    stat = (tmp_path / 'po.db').stat()
+    os.utime(tmp_path / 'po.db', (stat.st_atime, stat.st_mtime + 10))
+
+    labels = module.load_ontology_labels({'envo': envo, 'po': po}, cache_file)
+    assert reads == [str(tmp_path / 'po.db')]
+    assert labels['PO:0009010'] == 'seed'
+
+
+class _StubPortal(http.server.BaseHTTPRequestHandler):
+    """Local submission portal: token refresh plus offset/limit pages over TOTAL submissions."""
+
+    TOTAL = 103
+    requested = []
+
+    def log_message(self, *_args):
+        pass
+
+    def _send(self, status, body):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        self._send(200, {'access_token': 'token'})
+
+    def do_GET(self):
+        query = parse_qs(urlparse(self.path).query)
+        offset, limit = int(query['offset'][0]), int(query['limit'][0])
+        self.requested.append(offset)
+        if self.headers['Authorization'] != 'Bearer token':
+            self._send(401, {})
+            return
+        results = [{'id': f'sub-{i}'} for i in range(offset, min(offset + limit, self.TOTAL))]
+        self._send(200, {'results': results, 'count': self.TOTAL})
+
+
+class _BulkCollection:
+    def __init__(self):
+        self.batches = []
+
+    def bulk_write(self, ops, ordered=True):
+        assert not ordered
+        self.batches.append([(op._filter, op._doc) for op in ops])
+
+
+def test_concurrent_fetch_bulk_upserts_every_page(monkeypatch):
+    module = _load_script_module(monkeypatch)
+    collection = _BulkCollection()
+
+    class FakeClient:
+        def __init__(self, *_a, **_k):
+            pass
+
+        def __getitem__(self, _name):
+            return {'nmdc_submissions': collection}
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *_exc):
+            return False
+
+    _StubPortal.requested = []
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), _StubPortal)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setattr(module, 'MongoClient', FakeClient)
+    monkeypatch.setattr(module, 'dotenv_values', lambda _p: {'NMDC_DATA_SUBMISSION_REFRESH_TOKEN': 'refresh'})
+    monkeypatch.setattr(module, 'parse_uri', lambda _u: {'database': 'misc_metadata'})
+    try:
+        with requests_cache.disabled():
+            ok = module.fetch_nmdc_submissions(
+                'mongodb://localhost:27017/testdb', None, f'http://127.0.0.1:{server.server_address[1]}/',
+                page_size=10, concurrency=4)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert ok is True
+    assert sorted(_StubPortal.requested) == list(range(0, 103, 10))
+    assert len(collection.batches) == 11
+    filters = [flt for batch in collection.batches for flt, _doc in batch]
+    assert sorted(f['id'] for f in filters) == sorted(f'sub-{i}' for i in range(103))
+
+
+class _StateCollection:
+    """Refresh-state stand-in supporting the queries the incremental refresh issues."""
+
+    def __init__(self):
+        self.docs = {}
+
+    def find_one(self, _flt, sort=None):
+        dated = [d for d in self.docs.values() if d.get('date_last_modified') is not None]
+        return max(dated, key=lambda d: d['date_last_modified'], default=None)
+
+    def find(self, flt, _projection=None):
+        if '$expr' in flt:
+            _, stage = flt['$expr']['$ne']
+            return [d for d in self.docs.values() if d.get('fetched_sha256') != d.get(stage[1:])]
+        return list(self.docs.values())
+
+    def bulk_write(self, ops, ordered=True):
+        for op in ops:
+            doc = self.docs.get(op._filter['_id'])
+            if doc is None:
+                if not op._upsert:
+                    continue
+                doc = self.docs[op._filter['_id']] = {'_id': op._filter['_id']}
+            if all(doc.get(k) == v for k, v in op._filter.items()):
+                doc.update(op._doc['$set'])
+
+
+def test_incremental_fetch_stops_at_high_water_mark_and_skips_unchanged(monkeypatch):
+    module = _load_script_module(monkeypatch)
+    portal = [{'id': f'sub-{i}', 'date_last_modified': f'2024-01-{i + 1:02d}', 'v': 0} for i in range(30)]
+    requested = []
+
+    def fake_page(_session, _url, _headers, offset, page_size, column_sort='created'):
+        assert column_sort == 'date_last_modified'
+        requested.append(offset)
+        newest_first = sorted(portal, key=lambda d: d['date_last_modified'], reverse=True)
+        return {'results': newest_first[offset:offset + page_size], 'count': len(portal)}
+
+    monkeypatch.setattr(module, 'fetch_submission_page', fake_page)
+    collection, state = _BulkCollection(), _StateCollection()
+
+    assert len(module.fetch_changed_submissions(collection, state, 'url', {}, page_size=5)) == 30
+    assert requested == [0, 5, 10, 15, 20, 25]
+    assert set(module.pending_submissions({module.REFRESH_STATE_COLLECTION: state}, 'rows_sha256')) == {
+        f'sub-{i}' for i in range(30)}
+    module.mark_stage_done({module.REFRESH_STATE_COLLECTION: state}, 'rows_sha256',
+                           module.pending_submissions({module.REFRESH_STATE_COLLECTION: state}, 'rows_sha256'))
+
+    portal[29] = dict(portal[29], v=1)
+    portal[10] = dict(portal[10], v=1, date_last_modified='2024-02-01')
+    requested.clear()
+    collection.batches.clear()
+
+    changed = module.fetch_changed_submissions(collection, state, 'url', {}, page_size=5)
+
+    assert sorted(changed) == ['sub-10', 'sub-29']
+    assert requested == [0]
+    assert [[f['id'] for f, _doc in batch] for batch in collection.batches] == [['sub-10', 'sub-29']]
+    assert set(module.pending_submissions({module.REFRESH_STATE_COLLECTION: state}, 'rows_sha256')) == {
+        'sub-10', 'sub-29'}
+
+
+def test_incremental_create_rows_replaces_only_changed_submissions(monkeypatch):
+    module = _load_script_module(monkeypatch)
+
+    class Submissions:
+        docs = [{'id': f'sub-{i}', 'metadata_submission': {'sampleData': {'soil_data': [{'depth': str(i)}]}}}
+                for i in range(3)]
+
+        def count_documents(self, query):
+            return len(self.find(query))
+
+        def find(self, query):
+            return [d for d in self.docs if d['id'] in query['id']['$in']]
+
+    class Rows:
+        def __init__(self):
+            self.deleted, self.inserted = [], []
+
+        def delete_many(self, flt):
+            self.deleted.append(flt)
+
+        def insert_many(self, docs):
+            self.inserted.extend(docs)
+            return types.SimpleNamespace(inserted_ids=list(range(len(docs))))
+
+    state = _StateCollection()
+    state.docs = {'sub-0': {'_id': 'sub-0', 'fetched_sha256': 'a', 'rows_sha256': 'a'},
+                  'sub-1': {'_id': 'sub-1', 'fetched_sha256': 'b2', 'rows_sha256': 'b1'}}
+    rows = Rows()
+    db = {'nmdc_submissions': Submissions(), 'submission_biosample_rows': rows,
+          module.REFRESH_STATE_COLLECTION: state}
+
+    class FakeClient:
+        def __init__(self, _url):
+            pass
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *_exc):
+            return False
+
+        def __getitem__(self, _name):
+            return db
+
+    monkeypatch.setattr(module, 'MongoClient', FakeClient)
+    monkeypatch.setattr(module, 'parse_uri', lambda _u: {'database': 'misc_metadata'})
+
+    assert module.create_biosample_rows('mongodb://example/misc_metadata', incremental=True)
+    assert rows.deleted == [{'submission_id': {'$in': ['sub-1']}}]
+    assert [r['submission_id'] for r in rows.inserted] == ['sub-1']
+    assert state.docs['sub-1']['rows_sha256'] == 'b2'
+
+    assert module.create_biosample_rows('mongodb://example/misc_metadata', incremental=True)
+    assert len(rows.deleted) == 1
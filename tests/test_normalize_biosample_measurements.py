@@ -0,0 +1,64 @@
+"""Unit tests for normalize_biosample_measurements' batched writes.
+
+Step 1 inserts and Step 2 updates go to MongoDB as unordered bulk_write
+batches of --batch-size ops; these check the batching and the documents sent.
+"""
+
+from pymongo import InsertOne, UpdateOne
+
+from external_metadata_awareness import normalize_biosample_measurements as normalize
+
+
+class _FakeCollection:
+    def __init__(self, name, docs=()):
+        self.name = name
+        self.docs = list(docs)
+        self.bulk_calls = []
+
+    def count_documents(self, query):
+        return len(self.find(query))
+
+    def find(self, query):
+        return [d for d in self.docs if d["harmonized_name"] == query["harmonized_name"]]
+
+    def bulk_write(self, ops, ordered=True):
+        assert ordered is False
+        self.bulk_calls.append(list(ops))
+
+
+class _FakeClient(dict):
+    def __init__(self, collection):
+        super().__init__(db={collection.name: collection})
+
+
+def _value_docs(field_name, values):
+    return [normalize.value_doc(field_name, value, 1) for value in values]
+
+
+def test_parse_measurements_sends_updates_in_batches():
+    values = ["25 m", "soil", "3 m", "12 cm", "7 km"]
+    col = _FakeCollection("measurements", _value_docs("depth", values))
+
+    parsed = normalize.parse_measurements(_FakeClient(col), "db", "measurements", "depth", False, batch_size=2)
+
+    assert parsed == 4
+    assert [len(ops) for ops in col.bulk_calls] == [2, 2]
+    first = col.bulk_calls[0][0]
+    assert isinstance(first, UpdateOne)
+    assert first._filter == {"_id": "depth:25 m"}
+    assert first._doc["$set"]["reconstructed"] == ["25.0 metre"]
+    assert first._doc["$set"]["parsed_quantity"][0]["unit"] == {
+        "name": "metre", "entity": "length", "uri": "Metre"}
+
+
+def test_flush_bulk_empties_the_queue_and_skips_empty_batches():
+    col = _FakeCollection("measurements")
+    ops = [InsertOne(normalize.value_doc("depth", "25 m", 3))]
+
+    normalize.flush_bulk(col, ops)
+    normalize.flush_bulk(col, ops)
+
+    assert ops == []
+    assert len(col.bulk_calls) == 1
+    assert col.bulk_calls[0][0]._doc == {
+        "_id": "depth:25 m", "original_value": "25 m", "harmonized_name": "depth", "count": 3}
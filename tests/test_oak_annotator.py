@@ -0,0 +1,258 @@
+"""Unit tests for the batch OAK annotation engine (env-triad-oak-annotator).
+
+The stored oak_text_annotations and combined_oak_coverage must not change
+with the compiled automaton, so every label is also annotated by
+_reference_annotation below: the original per-document loop over oaklib's
+TextAnnotatorInterface, with its re-tokenizing whole-word check and
+pairwise subsumption filter.
+"""
+
+import os
+import re
+
+from oaklib.datamodels.lexical_index import LexicalGrouping, LexicalIndex, RelationshipToTerm
+from oaklib.datamodels.text_annotator import TextAnnotationConfiguration
+from oaklib.interfaces.text_annotator_interface import TextAnnotatorInterface
+from oaklib.utilities.lexical.lexical_indexer import save_lexical_index
+
+from external_metadata_awareness import new_env_triad_oak_annotator as oak_annotator
+from external_metadata_awareness import new_expand_envo_po_lexical_index as expander
+from external_metadata_awareness.lexical_automaton import LexicalAutomaton
+from external_metadata_awareness.lexical_index_cache import read_index_header
+from external_metadata_awareness.oak_helpers import build_element_to_label_map
+
+_TERMS = {
+    "gas": [("rdfs:label", "ENVO:01000797", "gas")],
+    "gastric juice": [("rdfs:label", "UBERON:0001971", "gastric juice")],
+    "soil": [("rdfs:label", "ENVO:00001998", "soil"), ("oio:hasExactSynonym", "ENVO:09200009", "Soil")],
+    "agricultural soil": [("rdfs:label", "ENVO:00002259", "agricultural soil")],
+    "forest soil": [("rdfs:label", "ENVO:00002261", "forest soil")],
+    "forest": [("rdfs:label", "ENVO:01000174", "forest")],
+    "forest biome": [("rdfs:label", "ENVO:01000174", "forest biome")],
+    "biome": [("rdfs:label", "ENVO:00000428", "biome")],
+    "leaf": [("rdfs:label", "PO:0025034", "leaf")],
+    "pH": [("rdfs:label", "PATO:0001842", "acidity")],
+    "sea": [("rdfs:label", "ENVO:00000016", "sea")],
+    "seawater": [("rdfs:label", "ENVO:00002149", "sea water")],
+    "marine": [("oio:hasRelatedSynonym", "ENVO:00000447", None)],
+    "ab": [("rdfs:label", "ENVO:9", "ab")],
+    "leaf-litter": [("rdfs:label", "ENVO:01000628", "leaf litter")],
+}
+
+_LABELS = [
+    "agricultural soil",
+    "Forest Soil",
+    "forest biome",
+    "gastric juice gas",
+    "gastric",
+    "biogas gas",
+    "stomach gastric gas",
+    "marine seawater sea",
+    "seawater",
+    "leaf-litter",
+    "Leaf litter on soil",
+    "soil soil",
+    "ab abc",
+    "",
+    "no matches here",
+]
+
+
+def _lexical_index():
+    return LexicalIndex(groupings={
+        term: LexicalGrouping(term=term, relationships=[
+            RelationshipToTerm(predicate=predicate, element=element, element_term=element_term)
+            for predicate, element, element_term in relationships])
+        for term, relationships in _TERMS.items()
+    })
+
+
+def _reference_annotation(label, annotator, element_to_label):
+    config = TextAnnotationConfiguration()
+    config.match_whole_words_only = True
+    processed = []
+    for ann in annotator.annotate_text(label, configuration=config):
+        if ann.subject_end - ann.subject_start + 1 < oak_annotator.MIN_ANNOTATION_LENGTH:
+            continue
+        if ann.match_string and " " not in ann.match_string:
+            if ann.match_string.lower() not in re.findall(r"\b\w+\b", label.lower()):
+                continue
+        ann_dict = {key: value for key, value in vars(ann).items()
+                    if value is not None and not (isinstance(value, list) and not value)}
+        ann_dict["coverage"] = (ann.subject_end - ann.subject_start + 1) / len(label)
+        ann_dict["rdfs_label"] = element_to_label.get(ann_dict["object_id"])
+        ann_dict["prefix_uc"] = ann_dict["object_id"].split(":")[0].upper()
+        processed.append(ann_dict)
+
+    filtered = []
+    for i, a in enumerate(processed):
+        span = (a["subject_start"], a["subject_end"])
+        if not any(i != j and b["subject_start"] <= span[0] and b["subject_end"] >= span[1]
+                   and (b["subject_start"], b["subject_end"]) != span
+                   for j, b in enumerate(processed)):
+            filtered.append(a)
+    return {
+        "oak_text_annotations": filtered,
+        "combined_oak_coverage": oak_annotator.compute_combined_oak_coverage(filtered, len(label)),
+        "oak_annotations_count": len(filtered),
+    }
+
+
+def test_automaton_matches_reference_annotator():
+    lexical_index = _lexical_index()
+    annotator = TextAnnotatorInterface()
+    annotator.lexical_index = lexical_index
+    element_to_label = build_element_to_label_map(lexical_index)
+    automaton = LexicalAutomaton.from_lexical_index(lexical_index)
+
+    for label in _LABELS:
+        if not label:
+            continue
+        expected = _reference_annotation(label, annotator, element_to_label)
+        actual = oak_annotator.annotate_label(label, automaton, element_to_label)
+        assert actual == expected, label
+        assert [list(a) for a in actual["oak_text_annotations"]] == \
+            [list(a) for a in expected["oak_text_annotations"]], label
+
+
+def test_first_occurrences_reports_overlapping_keys():
+    automaton = LexicalAutomaton(["he", "she", "his", "hers"], [[], [], [], []])
+
+    assert automaton.first_occurrences("ushers") == {0: 2, 1: 1, 3: 2}
+
+
+def test_key_preceded_by_a_letter_on_first_occurrence_is_skipped():
+    automaton = LexicalAutomaton.from_lexical_index(_lexical_index())
+
+    matched = {match.match_string for match in automaton.annotate("biogas gas")}
+
+    assert "gas" not in matched
+
+
+def test_filter_subsumed_annotations_keeps_equal_spans_and_order():
+    annotations = [
+        {"id": "a", "subject_start": 1, "subject_end": 4},
+        {"id": "b", "subject_start": 1, "subject_end": 12},
+        {"id": "c", "subject_start": 6, "subject_end": 12},
+        {"id": "d", "subject_start": 1, "subject_end": 12},
+        {"id": "e"},
+        {"id": "f", "subject_start": 10, "subject_end": 15},
+    ]
+
+    kept = oak_annotator.filter_subsumed_annotations(annotations)
+
+    assert [a["id"] for a in kept] == ["b", "d", "e", "f"]
+
+
+def test_annotate_in_pool_matches_inline():
+    lexical_index = _lexical_index()
+    element_to_label = build_element_to_label_map(lexical_index)
+    automaton = LexicalAutomaton.from_lexical_index(lexical_index)
+    pairs = [(i, label) for i, label in enumerate(_LABELS * 3) if label]
+
+    inline = list(oak_annotator.annotate_in_pool(pairs, automaton, element_to_label, 1, 4))
+    pooled = list(oak_annotator.annotate_in_pool(pairs, automaton, element_to_label, 2, 4))
+
+    assert pooled == inline
+    assert [_id for _id, _ in pooled] == [_id for _id, _ in pairs]
+
+
+class _FakeCollection:
+    def __init__(self):
+        self.batches = []
+
+    def bulk_write(self, ops, ordered=True):
+        assert ordered is False
+        self.batches.append([(op._filter, op._doc) for op in ops])
+
+
+def test_write_annotations_batches_unordered_updates():
+    collection = _FakeCollection()
+    results = [(i, {"oak_annotations_count": i}) for i in range(5)]
+
+    assert oak_annotator.write_annotations(collection, results, batch_size=2) == 5
+
+    assert [len(batch) for batch in collection.batches] == [2, 2, 1]
+    assert collection.batches[2] == [({"_id": 4}, {"$set": {"oak_annotations_count": 4}})]
+
+
+def _soil_index(*_args):
+    return LexicalIndex(groupings={"soil": LexicalGrouping(term="soil", relationships=[
+        RelationshipToTerm(predicate="rdfs:label", element="ENVO:00001998", element_term="soil")])})
+
+
+def _semsql_files(tmp_path, monkeypatch, names):
+    paths = {}
+    for name in names:
+        path = tmp_path / f"{name}.db"
+        path.write_bytes(b"v1")
+        paths[f"sqlite:obo:{name}"] = str(path)
+    monkeypatch.setattr(oak_annotator, "semsql_db_path", paths.__getitem__)
+    return paths
+
+
+def _newer_yaml(tmp_path, paths):
+    index_file = tmp_path / "index.yaml"
+    save_lexical_index(_lexical_index(), str(index_file))
+    newest = max(os.path.getmtime(path) for path in paths.values())
+    os.utime(index_file, (newest + 10,) * 2)
+    return str(index_file)
+
+
+def _fail(*_args):
+    raise AssertionError("the cache should have been used")
+
+
+def test_load_annotation_index_uses_cache_until_a_semsql_file_changes(tmp_path, monkeypatch):
+    paths = _semsql_files(tmp_path, monkeypatch, ["envo", "po"])
+    index_file = _newer_yaml(tmp_path, paths)
+    cache_file = str(tmp_path / "index.pkl")
+
+    automaton, element_to_label = oak_annotator.load_annotation_index(cache_file, index_file)
+    assert len(automaton) == len(_TERMS)
+
+    monkeypatch.setattr(oak_annotator, "load_lexical_index", _fail)
+    cached, cached_labels = oak_annotator.load_annotation_index(cache_file, index_file)
+    assert cached.keys == automaton.keys
+    assert cached_labels == element_to_label
+
+    rebuilt = []
+
+    def build(*adapter_strings):
+        rebuilt.append(adapter_strings)
+        return _soil_index()
+
+    monkeypatch.setattr(oak_annotator, "build_expanded_lexical_index", build)
+    with open(paths["sqlite:obo:envo"], "wb") as f:
+        f.write(b"v2 is newer")
+    os.utime(paths["sqlite:obo:envo"], (os.path.getmtime(index_file) + 10,) * 2)
+    automaton, _ = oak_annotator.load_annotation_index(cache_file, index_file)
+
+    assert rebuilt == [("sqlite:obo:envo", "sqlite:obo:po", [])]
+    assert automaton.keys == ["soil"]
+
+
+def test_load_annotation_index_keeps_the_extra_ontologies_recorded_in_the_cache(tmp_path, monkeypatch):
+    paths = _semsql_files(tmp_path, monkeypatch, ["envo", "po", "uberon"])
+    index_file = _newer_yaml(tmp_path, paths)
+    cache_file = str(tmp_path / "index.pkl")
+    adapters = list(paths)
+    # As expand-envo-po-lexical-index --extra-adapter sqlite:obo:uberon writes it.
+    expander.write_binary_index_cache(_lexical_index(), cache_file, list(paths.values()) + [index_file], adapters)
+
+    monkeypatch.setattr(oak_annotator, "load_lexical_index", _fail)
+    automaton, _ = oak_annotator.load_annotation_index(cache_file, index_file)
+    assert len(automaton) == len(_TERMS)
+
+    rebuilt = []
+
+    def build(*adapter_strings):
+        rebuilt.append(adapter_strings)
+        return _soil_index()
+
+    monkeypatch.setattr(oak_annotator, "build_expanded_lexical_index", build)
+    os.utime(paths["sqlite:obo:uberon"], (os.path.getmtime(index_file) + 10,) * 2)
+    oak_annotator.load_annotation_index(cache_file, index_file)
+
+    assert rebuilt == [("sqlite:obo:envo", "sqlite:obo:po", ["sqlite:obo:uberon"])]
+    assert read_index_header(cache_file)["adapters"] == adapters
@@ -0,0 +1,99 @@
+"""Unit tests for the concurrent OLS annotator, run against a local fake OLS /search.
+
+Labels that normalize to the same query text must be searched once, paging
+must collect every defining-ontology hit, and each query's hits must reach
+every document that shares it through one bulk UpdateMany.
+"""
+
+import collections
+import http.server
+import json
+import threading
+import urllib.parse
+
+import pytest
+import requests_cache
+
+from external_metadata_awareness import new_env_triad_ols_annotator as annotator
+
+_TERMS = {
+    "soil": [
+        {"label": "soil", "synonym": ["Soil"], "ontology_name": "envo", "ontology_prefix": "envo",
+         "is_defining_ontology": True, "obo_id": "ENVO:00001998"},
+        {"label": "soil", "synonym": [], "ontology_name": "agro", "ontology_prefix": "agro",
+         "is_defining_ontology": False, "obo_id": "ENVO:00001998"},
+        {"label": "garden soil", "synonym": ["soil"], "ontology_name": "envo", "ontology_prefix": "envo",
+         "is_defining_ontology": True, "obo_id": "ENVO:00005744"},
+    ],
+    "sea water": [
+        {"label": "sea water", "synonym": ["seawater"], "ontology_name": "envo", "ontology_prefix": "envo",
+         "is_defining_ontology": True, "obo_id": "ENVO:00002149"},
+    ],
+}
+
+
+class _FakeOLS(http.server.BaseHTTPRequestHandler):
+    queries = collections.Counter()
+
+    def do_GET(self):
+        params = urllib.parse.parse_qs(urllib.parse.urlsplit(self.path).query)
+        query_text = params["q"][0]
+        start, rows = int(params["start"][0]), int(params["rows"][0])
+        if start == 0:
+            self.queries[query_text] += 1
+        docs = _TERMS.get(query_text, [])
+        body = json.dumps({"response": {"numFound": len(docs), "docs": docs[start:start + rows]}}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def fake_ols(monkeypatch):
+    _FakeOLS.queries.clear()
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), _FakeOLS)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(annotator, "ROWS", 2)
+    with requests_cache.disabled():
+        yield f"http://127.0.0.1:{server.server_address[1]}/search"
+    server.shutdown()
+    server.server_close()
+
+
+class _BulkCollection:
+    def __init__(self):
+        self.batches = []
+
+    def bulk_write(self, ops, ordered=True):
+        assert ordered is False
+        self.batches.append(list(ops))
+
+
+def test_duplicate_labels_share_one_query():
+    docs = [{"_id": 1, "label": "Soil "}, {"_id": 2, "label": "soil"}, {"_id": 3, "label": "SOIL"},
+            {"_id": 4, "label": "ab"}, {"_id": 5, "label": None}, {"_id": 6, "label": "sea water"}]
+
+    assert annotator.group_by_query(docs) == {"soil": [1, 2, 3], "sea water": [6]}
+
+
+def test_annotate_queries_against_fake_ols(fake_ols):
+    ids_by_query = {"soil": [1, 2, 3], "sea water": [6], "no such thing": [7]}
+    collection = _BulkCollection()
+
+    annotated = annotator.annotate_queries(ids_by_query, collection, concurrency=3, batch_size=1,
+                                           search_url=fake_ols)
+
+    assert annotated == 2
+    assert all(count == 1 for count in _FakeOLS.queries.values())
+    updates = {tuple(op._filter["_id"]["$in"]): op._doc["$set"] for batch in collection.batches for op in batch}
+    assert set(updates) == {(1, 2, 3), (6,)}
+    soil = updates[(1, 2, 3)]
+    assert soil["ols_annotations_count"] == 2
+    assert [hit["obo_id"] for hit in soil["ols_text_annotations"]] == ["ENVO:00001998", "ENVO:00005744"]
+    assert soil["ols_text_annotations"][1]["exact_synonym_match"] is True
+    assert soil["ols_text_annotations"][0]["ontology_prefix_uc"] == "ENVO"
@@ -0,0 +1,115 @@
+"""Unit tests for the streaming env_triads build (populate-env-triads-collection)."""
+
+from types import SimpleNamespace
+
+from external_metadata_awareness import populate_env_triads_collection as populate
+
+_PREFIXES = ["ENVO", "PO", "UBERON"]
+
+_OAK_DOCS = [
+    {"label": "soil", "oak_text_annotations": [
+        {"object_id": "ENVO:00001998", "rdfs_label": "soil", "prefix_uc": "ENVO"},
+        {"object_id": "NCIT:C1", "object_label": "soil", "prefix_uc": "NCIT"},
+        {"object_id": "ENVO:2", "object_label": "ab", "prefix_uc": "ENVO"},
+    ]},
+    {"label": "leaf", "oak_text_annotations": [
+        {"object_id": "PO:0025034", "object_label": "leaf", "prefix_uc": "PO"},
+    ]},
+]
+_OLS_DOCS = [
+    {"label": "soil", "ols_text_annotations": [
+        {"obo_id": "ENVO:00001998", "label": "soil", "ontology_prefix_uc": "ENVO"},
+        {"obo_id": "ENVO:00002259", "label": "agricultural soil", "ontology_prefix_uc": "ENVO"},
+    ]},
+]
+_CURIE_DOCS = [
+    {"curie_uc": "ENVO:01000174", "label": "forest biome", "prefix_uc": "ENVO",
+     "mappings": [{"curie": "UBERON:1", "label_lc": "woodland", "prefix": "UBERON"}]},
+    {"curie_uc": "ENVO:9", "label": "x", "prefix_uc": "ENVO"},
+]
+_TRIAD_DOCS = [
+    {"env_triad_value": "soil [ENVO:01000174]", "components": [
+        {"label": "soil", "raw": "soil"}, {"curie_uc": "ENVO:01000174", "raw": "ENVO:01000174"}]},
+    {"env_triad_value": "soil|soil", "components": [
+        {"label": "soil", "raw": "soil"}, {"label": "soil", "raw": "soil"}, {"label": "mud"}]},
+    {"env_triad_value": "ab", "components": [{"label": "ab", "raw": "ab"}]},
+]
+
+
+def _lookups():
+    interner = populate._Interner()
+    labels = populate.build_label_annotations(_OAK_DOCS, _OLS_DOCS, _PREFIXES, 3, interner)
+    curies = populate.build_curie_annotations(_CURIE_DOCS, 3, interner)
+    return labels, curies
+
+
+def test_label_annotations_are_filtered_deduplicated_and_shared():
+    labels, _ = _lookups()
+
+    assert [(a.id, a.source) for a in labels["soil"]] == [
+        ("ENVO:00001998", "OAK"), ("ENVO:00002259", "OLS")]
+    assert labels["leaf"] == (populate.Annotation("PO:0025034", "leaf", "PO", "OAK"),)
+
+
+def test_curie_annotations_include_mappings():
+    _, curies = _lookups()
+
+    assert curies == {"ENVO:01000174": (
+        populate.Annotation("ENVO:01000174", "forest biome", "ENVO", "asserted CURIe"),
+        populate.Annotation("UBERON:1", "woodland", "UBERON", "asserted CURIe mapping"),
+    )}
+
+
+def test_triad_components_take_first_annotation_and_drop_repeats():
+    labels, curies = _lookups()
+
+    components = populate.build_triad_components(_TRIAD_DOCS, labels, curies, 3)
+
+    assert populate.component_dicts(components["soil [ENVO:01000174]"]) == [
+        {"raw": "soil", "id": "ENVO:00001998", "label": "soil", "prefix_uc": "ENVO", "source": "OAK"},
+        {"raw": "ENVO:01000174", "id": "ENVO:01000174", "label": "forest biome", "prefix_uc": "ENVO",
+         "source": "asserted CURIe"},
+    ]
+    assert populate.component_dicts(components["soil|soil"]) == [
+        {"raw": "soil", "id": "ENVO:00001998", "label": "soil", "prefix_uc": "ENVO", "source": "OAK"},
+        {"raw": "mud"},
+    ]
+    assert "ab" not in components
+
+
+def test_documents_stream_one_per_accession_in_field_order():
+    labels, curies = _lookups()
+    components = populate.build_triad_components(_TRIAD_DOCS, labels, curies, 3)
+    samples = [
+        {"accession": "SAMN1", "env_medium": "soil|soil", "env_broad_scale": "soil [ENVO:01000174]"},
+        {"accession": "SAMN2", "env_local_scale": "unannotated", "env_medium": None},
+        {"accession": "SAMN2", "env_medium": "soil|soil"},
+        {"accession": "SAMN3", "env_medium": None},
+    ]
+
+    docs = list(populate.env_triad_documents(samples, components))
+
+    assert [doc["accession"] for doc in docs] == ["SAMN1", "SAMN2"]
+    assert list(docs[0]) == ["accession", "env_broad_scale", "env_medium"]
+    assert docs[0]["env_medium"]["components"][1] == {"raw": "mud"}
+    assert docs[1]["env_local_scale"] == {"raw": "unannotated", "components": []}
+    assert docs[1]["env_medium"]["raw"] == "soil|soil"
+
+
+class _FakeCollection:
+    def __init__(self):
+        self.batches = []
+
+    def insert_many(self, docs, ordered=True):
+        assert ordered is False
+        self.batches.append(list(docs))
+        return SimpleNamespace(inserted_ids=list(range(len(docs))))
+
+
+def test_insert_in_batches():
+    collection = _FakeCollection()
+
+    inserted = populate.insert_in_batches(collection, ({"accession": i} for i in range(5)), batch_size=2)
+
+    assert inserted == 5
+    assert [len(batch) for batch in collection.batches] == [2, 2, 1]
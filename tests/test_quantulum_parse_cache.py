@@ -0,0 +1,93 @@
+"""Unit tests for the persistent quantulum3 parse cache.
+
+Cached parses must give measurement discovery and normalize_biosample_measurements
+exactly the documents a fresh quantulum3 parse gives, and a second run over
+the same values must not call quantulum3 at all.
+"""
+
+from copy import deepcopy
+
+import pytest
+from quantulum3 import parser
+
+from external_metadata_awareness import measurement_discovery_efficient as discovery
+from external_metadata_awareness import quantulum_parse_cache
+from external_metadata_awareness.normalize_biosample_measurements import clean_dict
+
+_CONTENTS = ["25 m", "12 +/- 2 kg", "between 5 and 10 cm", "pH 7", "soil", "25 m"]
+
+
+@pytest.fixture
+def cache(tmp_path):
+    with quantulum_parse_cache.ParseCache(str(tmp_path / "parses.sqlite")) as parse_cache:
+        yield parse_cache
+
+
+def _original_normalize_dicts(content):
+    """normalize_biosample_measurements' Quantity conversion before the cache existed."""
+    dicts = []
+    for q in parser.parse(content):
+        q_dict = deepcopy(q.__dict__)
+        q_dict['unit'] = {'name': q_dict['unit'].name, 'entity': q_dict['unit'].entity.name,
+                          'uri': str(q_dict['unit'].uri)}
+        q_dict['span'] = list(q_dict['span'])
+        dicts.append(clean_dict(q_dict))
+    return dicts
+
+
+def test_cached_parse_matches_fresh_parse(cache):
+    for content in _CONTENTS:
+        first = cache.parse(content)
+        second = cache.parse(content)
+        assert first == second == quantulum_parse_cache.parse_quantities(content)
+        assert [clean_dict(q) for q in second] == _original_normalize_dicts(content)
+
+
+def test_second_run_only_hits(tmp_path, monkeypatch):
+    path = str(tmp_path / "parses.sqlite")
+    expected = [discovery.parse_content(c) for c in _CONTENTS]
+    with quantulum_parse_cache.ParseCache(path) as parse_cache:
+        for content in _CONTENTS:
+            parse_cache.parse(content)
+        assert (parse_cache.hits, parse_cache.misses) == (1, 5)
+
+    def no_parse(content):
+        raise AssertionError(f"quantulum3 called for {content!r}")
+
+    monkeypatch.setattr(parser, "parse", no_parse)
+    with quantulum_parse_cache.ParseCache(path) as parse_cache:
+        assert [discovery.parse_content(c, parse_cache) for c in _CONTENTS] == expected
+        assert (parse_cache.hits, parse_cache.misses) == (6, 0)
+
+
+def test_errors_are_cached(cache, monkeypatch):
+    def fake_parse(content):
+        raise ValueError("cannot parse this value")
+
+    monkeypatch.setattr(parser, "parse", fake_parse)
+    with pytest.raises(quantulum_parse_cache.QuantulumParseError):
+        cache.parse("bad")
+    monkeypatch.undo()
+
+    with pytest.raises(quantulum_parse_cache.QuantulumParseError, match="cannot parse"):
+        cache.parse("bad")
+    assert cache.hits == 1
+
+
+def test_key_changes_with_quantulum_version(monkeypatch):
+    key = quantulum_parse_cache.content_key("25 m")
+
+    monkeypatch.setattr(quantulum_parse_cache, "QUANTULUM_VERSION", "0.0.0")
+
+    assert quantulum_parse_cache.content_key("25 m") != key
+
+
+def test_pool_answers_hits_from_the_cache(cache):
+    pairs = [{"harmonized_name": "depth", "content": c, "biosample_count": 1} for c in _CONTENTS]
+    for content in _CONTENTS[:2]:
+        cache.parse(content)
+
+    pooled = list(discovery.parse_in_pool(pairs, workers=2, chunk_size=2, parse_cache=cache))
+
+    assert [parsed for _, parsed in pooled] == [quantulum_parse_cache.parse_quantities(c) for c in _CONTENTS]
+    assert cache.get("soil") == []
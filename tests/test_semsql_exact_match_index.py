@@ -0,0 +1,111 @@
+"""Unit tests for the local exact-match index built from semsql files.
+
+Each fake semsql database below holds just the statements columns the index
+reads. Lookups must return the OLS hit schema the annotator stores, keep
+only defining-ontology terms by default, and rebuild only changed sources.
+"""
+
+import os
+import sqlite3
+
+import pytest
+
+from external_metadata_awareness import new_env_triad_ols_annotator as annotator
+from external_metadata_awareness import semsql_exact_match_index as exact_match
+
+_ENVO_STATEMENTS = [
+    ("ENVO:00001998", "rdfs:label", "soil"),
+    ("ENVO:00001998", "oio:hasExactSynonym", "Soil"),
+    ("ENVO:00005744", "rdfs:label", "garden soil"),
+    ("ENVO:00005744", "oio:hasRelatedSynonym", "soil"),
+    ("ENVO:00002149", "rdfs:label", "sea water"),
+    ("ENVO:00002149", "oio:hasExactSynonym", "seawater"),
+    ("UBERON:0000178", "rdfs:label", "blood"),
+    ("ENVO:09999999", "oio:hasExactSynonym", "unlabelled"),
+    ("_:b1", "rdfs:label", "soil"),
+]
+_UBERON_STATEMENTS = [
+    ("UBERON:0000178", "rdfs:label", "blood"),
+    ("UBERON:0000178", "oio:hasExactSynonym", "whole blood"),
+]
+
+
+def _semsql_db(path, statements):
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE statements (stanza TEXT, subject TEXT, predicate TEXT, object TEXT, "
+                 "value TEXT, datatype TEXT, language TEXT)")
+    conn.executemany("INSERT INTO statements (stanza, subject, predicate, value) VALUES (?, ?, ?, ?)",
+                     [(s, s, p, v) for s, p, v in statements])
+    conn.commit()
+    conn.close()
+    return str(path)
+
+
+@pytest.fixture
+def index_file(tmp_path):
+    db_paths = {
+        "envo": _semsql_db(tmp_path / "envo.db", _ENVO_STATEMENTS),
+        "uberon": _semsql_db(tmp_path / "uberon.db", _UBERON_STATEMENTS),
+    }
+    path = str(tmp_path / "index.sqlite")
+    assert exact_match.build_index(path, db_paths) == ["envo", "uberon"]
+    return path
+
+
+def test_lookup_matches_labels_and_synonyms_case_insensitively(index_file):
+    index = exact_match.ExactMatchIndex(index_file)
+
+    hits = index.lookup("  SOIL ")
+
+    assert hits == [
+        {"label": "soil", "synonyms": ["Soil"], "exact_label_match": True, "exact_synonym_match": True,
+         "obo_id": "ENVO:00001998", "ontology_name_uc": "ENVO", "ontology_prefix_uc": "ENVO"},
+        {"label": "garden soil", "synonyms": ["soil"], "exact_label_match": False, "exact_synonym_match": True,
+         "obo_id": "ENVO:00005744", "ontology_name_uc": "ENVO", "ontology_prefix_uc": "ENVO"},
+    ]
+    assert index.lookup("seawater")[0]["obo_id"] == "ENVO:00002149"
+    assert index.lookup("unlabelled") == []
+
+
+def test_only_defining_ontology_hits_by_default(index_file):
+    index = exact_match.ExactMatchIndex(index_file)
+
+    assert [(h["obo_id"], h["ontology_name_uc"]) for h in index.lookup("blood")] == [
+        ("UBERON:0000178", "UBERON")]
+    assert len(index.lookup("blood", defining_only=False)) == 2
+
+
+def test_unchanged_sources_are_not_reindexed(index_file, tmp_path):
+    db_paths = {"envo": str(tmp_path / "envo.db"), "uberon": str(tmp_path / "uberon.db")}
+    assert exact_match.build_index(index_file, db_paths) == []
+
+    os.remove(db_paths["uberon"])
+    _semsql_db(tmp_path / "uberon.db", [("UBERON:0000179", "rdfs:label", "plasma")])
+    stat = os.stat(db_paths["uberon"])
+    os.utime(db_paths["uberon"], (stat.st_atime, stat.st_mtime + 10))
+
+    assert exact_match.build_index(index_file, db_paths) == ["uberon"]
+    index = exact_match.ExactMatchIndex(index_file)
+    assert [h["obo_id"] for h in index.lookup("plasma")] == ["UBERON:0000179"]
+    assert index.lookup("whole blood") == []
+
+
+class _BulkCollection:
+    def __init__(self):
+        self.ops = []
+
+    def bulk_write(self, ops, ordered=True):
+        self.ops.extend(ops)
+
+
+def test_annotator_uses_the_local_index_offline(index_file):
+    collection = _BulkCollection()
+    index = exact_match.ExactMatchIndex(index_file)
+
+    annotated = annotator.annotate_queries({"soil": [1, 2], "gravel": [3]}, collection,
+                                           search_url="http://127.0.0.1:9/unreachable", local_index=index)
+
+    assert annotated == 1
+    (op,) = collection.ops
+    assert op._filter == {"_id": {"$in": [1, 2]}}
+    assert op._doc["$set"]["ols_annotations_count"] == 2
@@ -0,0 +1,264 @@
+"""Unit tests for the XML-to-MongoDB loader's parsing paths.
+
+The sharded loader splits the file at byte offsets and parses each range on
+its own, so it must find exactly the same records as a single iterparse pass.
+These tests compare the two on a small BioSampleSet-shaped fixture, including
+a tag that shares the node_type prefix and shards too small to hold a record.
+The iterative converter is checked against the original recursive one.
+"""
+
+from pathlib import Path
+
+import bson
+import click
+import lxml.etree as ET
+import pytest
+from pymongo.errors import BulkWriteError
+
+from external_metadata_awareness import xml_to_mongo
+from external_metadata_awareness.adhoc.benchmark_element_to_dict import recursive_element_to_dict
+
+_FIXTURE = Path(__file__).resolve().parent / "data" / "biosample_set_sample.xml"
+
+_RECORD = (
+    '  <BioSample id="{id}" accession="SAMN{id:08d}">\n'
+    '    <Ids><Id db="BioSample">SAMN{id:08d}</Id></Ids>\n'
+    '    <Description><Title>sample &amp; title {id}</Title></Description>\n'
+    '    <Attributes>\n'
+    '      <Attribute attribute_name="env_medium">soil [ENVO:00001998]</Attribute>\n'
+    '      <Attribute attribute_name="depth">  {id} m  </Attribute>\n'
+    '    </Attributes>\n'
+    '    <BioSampleSetNote>not a record</BioSampleSetNote>\n'
+    '  </BioSample>\n'
+)
+
+
+@pytest.fixture
+def biosample_xml(tmp_path):
+    path = tmp_path / "biosample_set.xml"
+    body = "".join(_RECORD.format(id=i) for i in range(1, 41))
+    path.write_text(
+        '<?xml version="1.0" encoding="UTF-8"?>\n<BioSampleSet>\n' + body + '</BioSampleSet>\n',
+        encoding="utf-8",
+    )
+    return path
+
+
+def _sequential_docs(path):
+    docs = []
+    for _, elem in ET.iterparse(str(path), events=("end",)):
+        if elem.tag == "BioSample":
+            docs.append(xml_to_mongo.element_to_dict(elem))
+            elem.clear()
+    return docs
+
+
+@pytest.mark.parametrize("shard_size", [1, 500, 4096, 1 << 20])
+def test_sharded_parse_matches_sequential_parse(biosample_xml, shard_size):
+    ranges = xml_to_mongo.compute_shard_ranges(str(biosample_xml), "BioSample", shard_size)
+
+    sharded = []
+    for start, end in ranges:
+        sharded.extend(xml_to_mongo.parse_shard(str(biosample_xml), start, end, "BioSample"))
+
+    assert sharded == _sequential_docs(biosample_xml)
+
+
+def test_shard_ranges_start_on_node_boundaries(biosample_xml):
+    data = biosample_xml.read_bytes()
+    ranges = xml_to_mongo.compute_shard_ranges(str(biosample_xml), "BioSample", 500)
+
+    assert len(ranges) > 1
+    for (start, end), (next_start, _) in zip(ranges, ranges[1:]):
+        assert end == next_start
+    for start, _ in ranges:
+        assert data[start:start + len(b'<BioSample ')] == b'<BioSample '
+    assert data[ranges[-1][1]:].strip() == b'</BioSampleSet>'
+
+
+def test_resume_offset_skips_loaded_records(biosample_xml):
+    ranges = xml_to_mongo.compute_shard_ranges(str(biosample_xml), "BioSample", 500)
+    resume_at = ranges[2][0]
+
+    resumed = xml_to_mongo.compute_shard_ranges(
+        str(biosample_xml), "BioSample", 500, start_offset=resume_at)
+
+    assert resumed[0][0] == resume_at
+    assert resumed[-1][1] == ranges[-1][1]
+
+
+def test_no_matching_nodes_gives_no_shards(biosample_xml):
+    assert xml_to_mongo.compute_shard_ranges(str(biosample_xml), "Package", 500) == []
+
+
+class _FakeCollection:
+    """insert_many/bulk_write stand-in that enforces unique _id like MongoDB."""
+
+    def __init__(self):
+        self.docs = []
+
+    def insert_many(self, docs, ordered=True):
+        seen = {d["_id"] for d in self.docs if "_id" in d}
+        errors = []
+        for i, doc in enumerate(docs):
+            if "_id" in doc and doc["_id"] in seen:
+                errors.append({"index": i, "code": 11000, "errmsg": "E11000 duplicate key"})
+                continue
+            seen.add(doc.get("_id"))
+            self.docs.append(doc)
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, "writeConcernErrors": []})
+
+    def bulk_write(self, requests, ordered=True):
+        for request in requests:
+            doc = request._doc
+            self.docs = [d for d in self.docs if d.get("_id") != doc["_id"]] + [doc]
+
+
+def test_load_sharded_inserts_every_record_once(biosample_xml):
+    collection = _FakeCollection()
+
+    inserted = xml_to_mongo.load_sharded(
+        str(biosample_xml), collection, "BioSample", workers=2, writers=2,
+        batch_size=7, shard_size=500)
+
+    assert inserted == 40
+    assert sorted(d["id"] for d in collection.docs) == sorted(str(i) for i in range(1, 41))
+
+
+def test_load_sharded_honours_max_elements(biosample_xml):
+    collection = _FakeCollection()
+
+    inserted = xml_to_mongo.load_sharded(
+        str(biosample_xml), collection, "BioSample", workers=2, writers=1,
+        batch_size=7, shard_size=500, max_elements=9)
+
+    assert inserted == 9
+    assert len(collection.docs) == 9
+
+
+def _fixture_biosamples():
+    return list(ET.parse(str(_FIXTURE)).getroot().iter("BioSample"))
+
+
+def test_iterative_converter_matches_recursive_converter():
+    for elem in _fixture_biosamples():
+        converted = xml_to_mongo.element_to_dict(elem)
+        assert converted == recursive_element_to_dict(elem)
+        # Key order is what ends up in the stored BSON, so it must match too.
+        assert bson.encode(converted) == bson.encode(recursive_element_to_dict(elem))
+
+
+def test_converter_handles_name_collisions_and_comments():
+    elem = ET.fromstring(
+        '<R id="1"><id>child</id><!-- note --><A>x</A><A>y</A><A><B/></A></R>')
+
+    assert xml_to_mongo.element_to_dict(elem) == {
+        "id": ["1", {"content": "child"}],
+        "A": [{"content": "x"}, {"content": "y"}, {"B": {}}],
+    }
+
+
+def test_bson_codec_encodes_the_dict_shape():
+    for elem in _fixture_biosamples():
+        raw = xml_to_mongo.element_to_raw_bson(elem)
+        assert raw.raw == bson.encode(xml_to_mongo.element_to_dict(elem))
+
+
+def test_parse_shard_with_bson_codec(biosample_xml):
+    (start, end), = xml_to_mongo.compute_shard_ranges(str(biosample_xml), "BioSample", 1 << 20)
+
+    raw_docs = xml_to_mongo.parse_shard(str(biosample_xml), start, end, "BioSample", codec="bson")
+
+    assert [bson.decode(d.raw) for d in raw_docs] == _sequential_docs(biosample_xml)
+
+
+def test_iter_nodes_yields_the_same_records_as_a_full_parse(biosample_xml):
+    streamed = [xml_to_mongo.element_to_dict(elem)
+                for elem in xml_to_mongo.iter_nodes(str(biosample_xml), "BioSample")]
+
+    assert streamed == _sequential_docs(biosample_xml)
+
+
+def test_iter_nodes_releases_processed_siblings(biosample_xml):
+    seen = 0
+    for elem in xml_to_mongo.iter_nodes(str(biosample_xml), "BioSample"):
+        # At most the record just handed out is still attached, already emptied.
+        previous = elem.getprevious()
+        if previous is not None:
+            assert len(previous) == 0
+            assert previous.getprevious() is None
+        seen += 1
+
+    assert seen == 40
+
+
+def test_keyed_insert_skips_records_already_loaded():
+    collection = _FakeCollection()
+    first = [{"_id": "1", "v": "a"}, {"_id": "2", "v": "b"}]
+    xml_to_mongo.write_batch(collection, first, "keyed-insert")
+
+    xml_to_mongo.write_batch(collection, [{"_id": "2", "v": "b"}, {"_id": "3", "v": "c"}], "keyed-insert")
+
+    assert sorted(d["_id"] for d in collection.docs) == ["1", "2", "3"]
+
+
+def test_plain_insert_surfaces_write_errors():
+    collection = _FakeCollection()
+    xml_to_mongo.write_batch(collection, [{"_id": "1"}], "insert")
+
+    with pytest.raises(BulkWriteError):
+        xml_to_mongo.write_batch(collection, [{"_id": "1"}], "insert")
+
+
+def test_upsert_replaces_by_id():
+    collection = _FakeCollection()
+    xml_to_mongo.write_batch(collection, [{"_id": "1", "v": "old"}], "upsert")
+
+    xml_to_mongo.write_batch(collection, [{"_id": "1", "v": "new"}], "upsert")
+
+    assert collection.docs == [{"_id": "1", "v": "new"}]
+
+
+def test_convert_node_keys_on_id_field():
+    elem = ET.fromstring('<BioSample id="7" accession="SAMN7"><Title>t</Title></BioSample>')
+
+    doc = xml_to_mongo.convert_node(elem, "dict", key_field="id")
+
+    assert list(doc) == ["_id", "id", "accession", "Title"]
+    assert doc["_id"] == "7"
+    with pytest.raises(ValueError):
+        xml_to_mongo.convert_node(ET.fromstring("<BioSample/>"), "dict", key_field="id")
+
+
+def test_checkpointed_load_resumes_without_duplicates(biosample_xml, tmp_path):
+    checkpoint_file = str(tmp_path / "load.checkpoint.json")
+    collection = _FakeCollection()
+
+    def run(max_elements=None):
+        checkpoint = xml_to_mongo.read_checkpoint(checkpoint_file) or xml_to_mongo.new_checkpoint(
+            str(biosample_xml), "BioSample", "biosamples", "id")
+        return xml_to_mongo.load_sharded(
+            str(biosample_xml), collection, "BioSample", workers=1, writers=2, batch_size=4,
+            shard_size=500, resume_from_offset=checkpoint["offset"], max_elements=max_elements,
+            write_mode="keyed-insert", checkpoint_file=checkpoint_file, checkpoint=checkpoint)
+
+    run(max_elements=15)
+    partial = xml_to_mongo.read_checkpoint(checkpoint_file)
+    assert not partial["complete"]
+    assert 0 < partial["records_loaded"] <= 15
+    assert partial["last_id"] == str(partial["records_loaded"])
+
+    run()
+    final = xml_to_mongo.read_checkpoint(checkpoint_file)
+    assert final["complete"]
+    assert final["records_loaded"] == 40
+    assert sorted(int(d["_id"]) for d in collection.docs) == list(range(1, 41))
+
+
+def test_checkpoint_for_another_file_is_rejected(biosample_xml):
+    expected = xml_to_mongo.new_checkpoint(str(biosample_xml), "BioSample", "biosamples", "id")
+    stale = dict(expected, file_size=expected["file_size"] + 1)
+
+    with pytest.raises(click.ClickException):
+        xml_to_mongo.check_checkpoint_matches(stale, expected)